@@ -1,172 +1,2271 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from flask import Flask, Response, render_template, stream_template, get_flashed_messages, has_request_context, request, redirect, url_for, flash, session, jsonify, g, stream_with_context, message_flashed
+from markupsafe import Markup, escape
+from datetime import datetime, timedelta
+import atexit
+import click
+import hashlib
+import hmac
+import json
+import math
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
 from functools import wraps
+from db import ConnectionPool, NoReplicaAvailable, ReplicaSet
+from cache import BroadcastCache, create_cache
+from passwords import HasherBusy, PasswordHasher
+from writebehind import QueueFull, WriteBehindQueue
+import compression
+import instrumentation
+import migrate
+import transfer
+from instrumentation import InstrumentedConnection, record_connection_wait
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'
+# Drop the newlines and indentation around {% %} tags from rendered pages
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
 
 # Database configuration
 DB_CONFIG = {
-    'host': 'localhost',
-    'port': '5432',
-    'database': 'blog_portal',
-    'user': 'postgres',
-    'password': '2006'
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': os.environ.get('DB_PORT', '5432'),
+    'database': os.environ.get('DB_NAME', 'blog_portal'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2006')
 }
 
+# Connection pool configuration
+DB_POOL_CONFIG = {
+    'minconn': int(os.environ.get('DB_POOL_MIN', 1)),
+    'maxconn': int(os.environ.get('DB_POOL_MAX', 20)),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    'check_interval': float(os.environ.get('DB_POOL_CHECK_INTERVAL', 30)),
+}
+
+db_pool = ConnectionPool(DB_CONFIG, connection_factory=InstrumentedConnection, **DB_POOL_CONFIG)
+
+# Read replicas as DB_REPLICAS=host:port,host:port, with the database and
+# credentials of DB_CONFIG. GET requests to REPLICA_VIEWS read from them;
+# for sticky_seconds after a write the session reads from the primary so
+# users see their own changes. Cache entries filled from a replica expire
+# after cache_ttl seconds, so a lagging replica cannot re-cache a page a
+# write just invalidated for the full cache TTL.
+DB_REPLICAS = [
+    dict(DB_CONFIG, host=host, port=port or DB_CONFIG['port'], connect_timeout=2)
+    for host, _, port in (entry.strip().partition(':')
+                          for entry in os.environ.get('DB_REPLICAS', '').split(',') if entry.strip())
+]
+REPLICA_CONFIG = {
+    'retry_interval': float(os.environ.get('REPLICA_RETRY_INTERVAL', 5)),
+    'health_interval': float(os.environ.get('REPLICA_HEALTH_INTERVAL', 2)),
+    'max_lag': float(os.environ.get('REPLICA_MAX_LAG', 10)),
+}
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_CACHE_TTL = int(os.environ.get('REPLICA_CACHE_TTL', 5))
+REPLICA_VIEWS = set(filter(None, os.environ.get(
+    'REPLICA_VIEWS',
+    'index,feed_json,view_post,post_comments_json,dashboard,admin_panel,admin_section,'
+    'search,search_json,api_posts,api_post,api_post_comments,trending,top,trending_json,top_json',
+).split(',')))
+# GET routes that write; like POSTs, they keep the session on the primary for a while
+WRITING_GET_VIEWS = {'like_post', 'like_post_redirect', 'delete_post', 'delete_user', 'delete_comment'}
+
+replica_set = None
+if DB_REPLICAS:
+    replica_set = ReplicaSet(DB_REPLICAS, connection_factory=InstrumentedConnection,
+                             **REPLICA_CONFIG, **DB_POOL_CONFIG)
+
+# Read-through cache for feed pages and posts ('memory', 'redis' or 'none')
+CACHE_CONFIG = {
+    'backend': os.environ.get('CACHE_BACKEND', 'memory'),
+    'max_entries': int(os.environ.get('CACHE_MAX_ENTRIES', 1024)),
+    'ttl': int(os.environ.get('CACHE_TTL', 60)),
+    'redis_url': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+}
+
+# The memory backend keeps a cache in every process: each gunicorn worker,
+# the async server, CLI commands. Their deletes, tag invalidations and
+# clears are broadcast to the others with NOTIFY on CACHE_CHANNEL, and each
+# server process applies them to its own cache (see start_cache_listener).
+CACHE_CHANNEL = 'blog_cache'
+# NOTIFY payloads must stay under 8000 bytes; larger invalidations clear instead
+CACHE_NOTIFY_MAX_BYTES = 7900
+# Broadcasts waiting to be sent beyond this collapse into one clear per cache
+CACHE_NOTIFY_MAX_PENDING = int(os.environ.get('CACHE_NOTIFY_MAX_PENDING', 1000))
+CACHE_NOTIFY_CONNECT_TIMEOUT = int(os.environ.get('CACHE_NOTIFY_CONNECT_TIMEOUT', 2))
+broadcast_caches = {}
+_publishers = {}
+_publishers_lock = threading.Lock()
+_cache_listeners = {}
+
+def cache_origin():
+    """Identifies this process in broadcasts, so it skips its own"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def create_shared_cache(name, config):
+    """create_cache, except that a memory cache's invalidations reach every process"""
+    local = create_cache(config)
+    if config['backend'] != 'memory':
+        return local
+    shared = BroadcastCache(local, lambda op, args: publish_invalidation(name, op, args))
+    broadcast_caches[name] = shared
+    return shared
+
+class CachePublisher:
+    """Sends one process's invalidation broadcasts from a daemon thread
+
+    Requests only queue their payloads. The thread owns the connection,
+    outside the pool and any transaction, and sends whatever has queued up
+    in one round trip, so a slow or unreachable database holds up the
+    broadcasts but never a request. Duplicates are dropped, and a backlog
+    past CACHE_NOTIFY_MAX_PENDING collapses into a clear per cache. If a
+    send fails, the other processes serve their entries until the TTL runs out.
+    """
+
+    def __init__(self):
+        self._pending = []      # (cache name, payload)
+        self._sending = False
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='cache-publisher', daemon=True)
+        self._thread.start()
+
+    def publish(self, name, payload):
+        with self._ready:
+            if (name, payload) not in self._pending:
+                self._pending.append((name, payload))
+            if len(self._pending) > CACHE_NOTIFY_MAX_PENDING:
+                names = dict.fromkeys(name for name, _ in self._pending)
+                self._pending = [(name, invalidation_payload(name, 'clear', [])) for name in names]
+            self._ready.notify_all()
 
-def get_db_connection():
-    """Create and return a database connection"""
+    def flush(self, timeout):
+        """Wait up to `timeout` seconds for the queued broadcasts to be sent"""
+        with self._ready:
+            self._ready.wait_for(lambda: not self._pending and not self._sending, timeout)
+
+    def _run(self):
+        conn = None
+        while True:
+            with self._ready:
+                self._ready.wait_for(lambda: self._pending)
+                batch, self._pending = self._pending, []
+                self._sending = True
+            try:
+                if conn is None or conn.closed:
+                    conn = psycopg2.connect(**DB_CONFIG, connect_timeout=CACHE_NOTIFY_CONNECT_TIMEOUT)
+                    conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute("SELECT " + ", ".join(["pg_notify(%s, %s)"] * len(batch)),
+                            [value for _, payload in batch for value in (CACHE_CHANNEL, payload)])
+                cur.close()
+            except psycopg2.Error as e:
+                print(f"Cache broadcast error: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+            finally:
+                with self._ready:
+                    self._sending = False
+                    self._ready.notify_all()
+
+def invalidation_payload(name, op, args):
+    """NOTIFY payload for an invalidation; too large ones become a clear"""
+    payload = json.dumps({'origin': cache_origin(), 'cache': name, 'op': op, 'args': args})
+    if len(payload.encode()) > CACHE_NOTIFY_MAX_BYTES:
+        payload = json.dumps({'origin': cache_origin(), 'cache': name, 'op': 'clear', 'args': []})
+    return payload
+
+def publish_invalidation(name, op, args):
+    """Queue a NOTIFY of an invalidation of cache `name` for the other processes
+
+    Called once the caller has committed; the process's CachePublisher
+    sends it shortly after.
+    """
+    # Keyed by pid: a forked worker needs a publisher thread of its own
+    pid = os.getpid()
+    with _publishers_lock:
+        publisher = _publishers.get(pid)
+        if publisher is None:
+            publisher = _publishers[pid] = CachePublisher()
+    publisher.publish(name, invalidation_payload(name, op, args))
+
+@atexit.register
+def flush_invalidations(timeout=CACHE_NOTIFY_CONNECT_TIMEOUT + 1):
+    """Give this process's queued broadcasts a moment to go out, e.g. before a CLI command exits"""
+    publisher = _publishers.get(os.getpid())
+    if publisher is not None:
+        publisher.flush(timeout)
+
+def apply_invalidation(payload):
+    """Apply an invalidation another process broadcast to this one's caches"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except psycopg2.Error as e:
-        print(f"Database connection error: {e}")
+        message = json.loads(payload)
+        if message['origin'] == cache_origin():
+            return
+        target = broadcast_caches.get(message['cache'])
+        if target is not None:
+            target.apply(message['op'], message['args'])
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Cache broadcast error: {e}")
+
+def start_cache_listener(timeout=60):
+    """Apply the invalidations other processes broadcast, in a daemon thread
+
+    Listens on a connection of its own, outside the pool; starts once per
+    process. Broadcasts sent while it was disconnected are lost, so it
+    also clears the local caches every time it (re)connects.
+    """
+    if not broadcast_caches:
         return None
+    pid = os.getpid()
+    if pid in _cache_listeners:
+        return _cache_listeners[pid]
+    
+    def run():
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**DB_CONFIG)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {CACHE_CHANNEL}")
+                for shared in broadcast_caches.values():
+                    shared.local.clear()
+                while True:
+                    if select.select([conn], [], [], timeout)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            apply_invalidation(conn.notifies.pop(0).payload)
+                    else:
+                        # Raises if the connection was lost
+                        conn.cursor().execute("SELECT 1")
+            except psycopg2.Error as e:
+                print(f"Cache listener error: {e}")
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+    
+    thread = _cache_listeners[pid] = threading.Thread(target=run, name='cache-listener', daemon=True)
+    thread.start()
+    return thread
+
+cache = create_shared_cache('cache', CACHE_CONFIG)
+
+# Identity cache: role and username per user id, so decorators skip the
+# users lookup. Entries are dropped on role changes and user deletion; with
+# the memory backend that reaches the other processes through the cache
+# broadcast, and the short TTL bounds how long a missed one can last.
+# admin_required does not rely on either: it reads the role from the database.
+IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 30))
+identity_cache = create_shared_cache('identity', dict(CACHE_CONFIG, ttl=IDENTITY_CACHE_TTL))
+
+# Query counts, DB/template timings, Server-Timing header and /metrics
+instrumentation.init_app(app)
+instrumentation.metrics.add_gauges(lambda: {f"db_pool_{k}": v for k, v in db_pool.stats().items()})
+instrumentation.metrics.add_gauges(lambda: {f"cache_{k}": v for k, v in cache.stats().items()})
+if replica_set is not None:
+    instrumentation.metrics.add_gauges(lambda: {
+        f"replica_{i}_{k}": float(replica[k] or 0)
+        for i, replica in enumerate(replica_set.stats())
+        for k in ('healthy', 'lag', 'checkouts', 'failures')
+    })
+instrumentation.metrics.add_gauges(lambda: {f"password_hasher_{k}": v for k, v in password_hasher.stats().items()})
+
+# Response compression; set COMPRESS_RESPONSES=0 when a proxy in front does it
+COMPRESS_CONFIG = {
+    'enabled': os.environ.get('COMPRESS_RESPONSES', '1') != '0',
+    'min_size': int(os.environ.get('COMPRESS_MIN_SIZE', 500)),
+    'gzip_level': int(os.environ.get('COMPRESS_GZIP_LEVEL', 6)),
+    'brotli_quality': int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5)),
+}
+compression.init_app(app, **COMPRESS_CONFIG)
+
+# Password hashing runs in a bounded process pool off the request threads.
+# Keep workers + queue below the request thread count so a sign-in burst
+# cannot tie up every thread; hashes made with another method are upgraded
+# at the next login.
+PASSWORD_HASH_CONFIG = {
+    'method': os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+    'workers': int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+    'max_queue': int(os.environ.get('PASSWORD_HASH_QUEUE', 4)),
+    'timeout': float(os.environ.get('PASSWORD_HASH_TIMEOUT', 2)),
+}
+
+password_hasher = PasswordHasher(**PASSWORD_HASH_CONFIG)
+
+# Apply pending migrations/ at startup. With MIGRATE_ON_BOOT=0 startup
+# only checks the schema version and refuses to start when it is behind;
+# run 'flask migrate' as a deploy step instead.
+MIGRATE_ON_BOOT = os.environ.get('MIGRATE_ON_BOOT', '1') == '1'
+
+# 'sync' runs the Flask server; 'async' serves asgi.app with uvicorn
+SERVER_MODE = os.environ.get('SERVER_MODE', 'sync')
+
+
+def get_db_connection(primary=False):
+    """Return the pooled connection bound to the current request
+
+    Requests that may read from a replica (see reads_from_replica) get a
+    replica connection, falling back to the primary when no replica is
+    available; `primary=True` always returns the primary's.
+    """
+    if not primary and 'db_conn' not in g and reads_from_replica():
+        conn = get_replica_connection()
+        if conn is not None:
+            return conn
+    if 'db_conn' not in g:
+        started = time.perf_counter()
+        try:
+            g.db_conn = db_pool.getconn()
+        except psycopg2.Error as e:
+            print(f"Database connection error: {e}")
+            return None
+        finally:
+            record_connection_wait(time.perf_counter() - started)
+    return g.db_conn
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db_pool.putconn(conn)
+    conn = g.pop('replica_conn', None)
+    if conn is not None:
+        replica_set.putconn(conn)
+
+def reads_from_replica():
+    """True if the current request is a read that replicas may serve"""
+    return (replica_set is not None and has_request_context()
+            and request.method in ('GET', 'HEAD') and request.endpoint in REPLICA_VIEWS
+            and session.get('primary_until', 0) <= time.time())
+
+def get_replica_connection():
+    """The request's replica connection, or None if no replica is available"""
+    if 'replica_conn' not in g:
+        started = time.perf_counter()
+        try:
+            g.replica_conn = replica_set.getconn()
+        except NoReplicaAvailable:
+            return None
+        finally:
+            record_connection_wait(time.perf_counter() - started)
+    return g.replica_conn
+
+@app.after_request
+def stick_to_primary(response):
+    """Keep a session that just wrote on the primary for REPLICA_STICKY_SECONDS"""
+    if replica_set is not None and (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                                    or request.endpoint in WRITING_GET_VIEWS):
+        session['primary_until'] = time.time() + REPLICA_STICKY_SECONDS
+    return response
+
+def read_cache(key):
+    """cache.get, except while the session reads from the primary after a write
+
+    A replica that had not replayed the write yet may have re-cached a
+    page the write invalidated, so such sessions read around the cache
+    until REPLICA_STICKY_SECONDS have passed.
+    """
+    if (replica_set is not None and has_request_context()
+            and session.get('primary_until', 0) > time.time()):
+        return None
+    return cache.get(key)
+
+def read_cache_ttl():
+    """TTL for cache entries filled by this request: REPLICA_CACHE_TTL if it read from a replica"""
+    if has_request_context() and 'replica_conn' in g:
+        return REPLICA_CACHE_TTL
+    return None
 
 def init_database():
-    """Initialize database and create tables if they don't exist"""
+    """Bring the schema up to date with migrations/; a single version query when it already is"""
+    try:
+        conn = db_pool.getconn()
+    except psycopg2.Error as e:
+        print(f"Database connection error: {e}")
+        return False
+    
+    try:
+        current = migrate.current_version(conn)
+        latest = migrate.latest_version()
+        if current > latest:
+            print(f"Database schema is at version {current}, newer than this code ({latest}).")
+            return True
+        if current == latest:
+            return True
+        if not MIGRATE_ON_BOOT:
+            print(f"Database schema is at version {current}, this code needs {latest}; run 'flask migrate'.")
+            return False
+        
+        migrate.apply_pending(conn)
+        return True
+        
+    except psycopg2.Error as e:
+        print(f"Database initialization error: {e}")
+        conn.rollback()
+        return False
+    finally:
+        db_pool.putconn(conn)
+
+def reconcile_post_counters(cur):
+    """Recompute like_count/comment_count for every post; returns rows fixed"""
+    cur.execute("""
+        UPDATE posts p
+        SET like_count = counts.like_count,
+            comment_count = counts.comment_count,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT p2.id,
+                   COALESCE(l.n, 0) as like_count,
+                   COALESCE(c.n, 0) as comment_count
+            FROM posts p2
+            LEFT JOIN (SELECT post_id, COUNT(*) as n FROM likes GROUP BY post_id) l
+                ON l.post_id = p2.id
+            LEFT JOIN (SELECT post_id, COUNT(*) as n FROM comments GROUP BY post_id) c
+                ON c.post_id = p2.id
+        ) counts
+        WHERE p.id = counts.id
+          AND (p.like_count <> counts.like_count OR p.comment_count <> counts.comment_count)
+    """)
+    return cur.rowcount
+
+# Dashboard stats as computed from the post counters, for all users or the given ones
+ACTUAL_USER_STATS_SQL = """
+    SELECT u.id as user_id, COUNT(p.id) as post_count,
+           COALESCE(SUM(p.like_count), 0) as likes_received,
+           COALESCE(SUM(p.comment_count), 0) as comments_received
+    FROM users u
+    LEFT JOIN posts p ON p.user_id = u.id
+    WHERE %(all)s OR u.id = ANY(%(user_ids)s)
+    GROUP BY u.id
+"""
+
+def rebuild_user_stats(cur):
+    """Recompute drifted dashboard stats from the post counters; returns rows fixed
+
+    Writers move user_stats rows by deltas, so a drifted row is only
+    rewritten under its row lock, with counts read after taking it: a
+    concurrent write is then either in the counts or applied on top once
+    this transaction commits. Rows a writer holds right now are skipped
+    and left to the next pass, so this never waits on a writer.
+    """
+    cur.execute("""
+        INSERT INTO user_stats (user_id)
+        SELECT u.id FROM users u
+        WHERE NOT EXISTS (SELECT 1 FROM user_stats s WHERE s.user_id = u.id)
+        ON CONFLICT (user_id) DO NOTHING
+    """)
+    cur.execute(f"""
+        SELECT s.user_id
+        FROM user_stats s
+        JOIN ({ACTUAL_USER_STATS_SQL}) a ON a.user_id = s.user_id
+        WHERE (s.post_count, s.likes_received, s.comments_received)
+              IS DISTINCT FROM (a.post_count, a.likes_received, a.comments_received)
+    """, {'all': True, 'user_ids': []})
+    drifted = [row[0] for row in cur.fetchall()]
+    if not drifted:
+        return 0
+    
+    cur.execute("""
+        SELECT user_id FROM user_stats
+        WHERE user_id = ANY(%s)
+        ORDER BY user_id
+        FOR UPDATE SKIP LOCKED
+    """, (drifted,))
+    locked = [row[0] for row in cur.fetchall()]
+    cur.execute(f"""
+        UPDATE user_stats s
+        SET post_count = a.post_count,
+            likes_received = a.likes_received,
+            comments_received = a.comments_received,
+            refreshed_at = CURRENT_TIMESTAMP
+        FROM ({ACTUAL_USER_STATS_SQL}) a
+        WHERE s.user_id = a.user_id
+          AND (s.post_count, s.likes_received, s.comments_received)
+              IS DISTINCT FROM (a.post_count, a.likes_received, a.comments_received)
+    """, {'all': False, 'user_ids': locked})
+    return cur.rowcount
+
+def adjust_user_stats(cur, user_id, posts=0, likes=0, comments=0):
+    """Apply deltas to one user's dashboard stats"""
+    cur.execute("""
+        INSERT INTO user_stats (user_id, post_count, likes_received, comments_received)
+        VALUES (%(user_id)s, %(posts)s, %(likes)s, %(comments)s)
+        ON CONFLICT (user_id) DO UPDATE
+        SET post_count = user_stats.post_count + EXCLUDED.post_count,
+            likes_received = user_stats.likes_received + EXCLUDED.likes_received,
+            comments_received = user_stats.comments_received + EXCLUDED.comments_received
+    """, {'user_id': user_id, 'posts': posts, 'likes': likes, 'comments': comments})
+
+@app.cli.command('migrate')
+@click.option('--status', 'show_status', is_flag=True, help='List migrations and when they were applied; change nothing.')
+def migrate_command(show_status):
+    """Apply pending schema migrations from migrations/"""
+    conn = get_db_connection(primary=True)
+    if not conn:
+        print("Failed to connect to the database.")
+        return
+    
+    try:
+        if show_status:
+            for version, name, applied_at in migrate.status(conn):
+                print(f"{version:04d}_{name}: {applied_at or 'pending'}")
+            return
+        applied = migrate.apply_pending(conn)
+        if applied:
+            cache.clear()
+        print(f"Schema is at version {migrate.current_version(conn)}; applied {len(applied)} migration(s).")
+    except psycopg2.Error as e:
+        print(f"Migration error: {e}")
+        conn.rollback()
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute the stored like/comment counters from the likes and comments tables"""
     conn = get_db_connection()
     if not conn:
-        return False
+        print("Failed to connect to the database.")
+        return
     
     try:
         cur = conn.cursor()
-        
-        # Create users table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                password VARCHAR(255) NOT NULL,
-                role VARCHAR(20) DEFAULT 'user',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create posts table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS posts (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                title VARCHAR(200) NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create likes table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS likes (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, post_id)
-            )
-        """)
-        
-        # Create comments table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS comments (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Check if admin user exists, if not create it
-        cur.execute("SELECT id FROM users WHERE username = 'admin'")
-        if not cur.fetchone():
-            admin_password = generate_password_hash('admin123')
-            cur.execute("""
-                INSERT INTO users (username, email, password, role)
-                VALUES ('admin', 'admin@blog.com', %s, 'admin')
-            """, (admin_password,))
-        
+        fixed = reconcile_post_counters(cur)
+        users_fixed = rebuild_user_stats(cur)
         conn.commit()
         cur.close()
-        conn.close()
-        return True
-        
+        cache.clear()
+        print(f"Reconciled counters: {fixed} post(s) and {users_fixed} user(s) corrected.")
     except psycopg2.Error as e:
-        print(f"Database initialization error: {e}")
+        print(f"Reconcile counters error: {e}")
+        conn.rollback()
+
+@app.cli.command('rebuild-user-stats')
+def rebuild_user_stats_command():
+    """Recompute the per-user dashboard stats from the post counters"""
+    conn = get_db_connection()
+    if not conn:
+        print("Failed to connect to the database.")
+        return
+    
+    try:
+        cur = conn.cursor()
+        fixed = rebuild_user_stats(cur)
+        conn.commit()
+        cur.close()
+        print(f"Rebuilt user stats: {fixed} user(s) corrected.")
+    except psycopg2.Error as e:
+        print(f"Rebuild user stats error: {e}")
+        conn.rollback()
+
+def set_user_role(cur, user_id, role):
+    """Change a user's role and bump their auth version; returns True if the user exists"""
+    cur.execute("""
+        UPDATE users SET role = %s, auth_version = auth_version + 1
+        WHERE id = %s
+    """, (role, user_id))
+    return cur.rowcount > 0
+
+@app.cli.command('set-role')
+@click.argument('email')
+@click.argument('role', type=click.Choice(['user', 'admin']))
+def set_role_command(email, role):
+    """Grant or revoke admin rights for the user with the given email"""
+    conn = get_db_connection()
+    if not conn:
+        print("Failed to connect to the database.")
+        return
+    
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+        user = cur.fetchone()
+        if user and set_user_role(cur, user[0], role):
+            conn.commit()
+            invalidate_identity(user[0])
+            print(f"{email} is now {role}.")
+        else:
+            print(f"No user with email {email}.")
+        cur.close()
+    except psycopg2.Error as e:
+        print(f"Set role error: {e}")
         conn.rollback()
+
+@app.cli.command('export')
+@click.argument('table', type=click.Choice(transfer.TABLES))
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(transfer.FORMATS),
+              help='Archive format; defaults to csv for *.csv[.gz] paths, else ndjson.')
+def export_command(table, path, fmt):
+    """Stream a table to an NDJSON or CSV archive (PATH - is stdout, *.gz is gzipped)"""
+    conn = get_db_connection()
+    if not conn:
+        print("Failed to connect to the database.", file=sys.stderr)
+        return
+    
+    try:
+        written = transfer.export_table(conn, table, path, fmt or transfer.guess_format(path))
+        print(f"Exported {table}: {written:,} bytes.", file=sys.stderr)
+    except (psycopg2.Error, OSError) as e:
+        print(f"Export error: {e}", file=sys.stderr)
+        conn.rollback()
+
+@app.cli.command('import')
+@click.argument('table', type=click.Choice(transfer.TABLES))
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(transfer.FORMATS),
+              help='Archive format; defaults to csv for *.csv[.gz] paths, else ndjson.')
+def import_command(table, path, fmt):
+    """Load an NDJSON or CSV archive made by 'flask export' (users, then posts, then comments and likes)"""
+    conn = get_db_connection()
+    if not conn:
+        print("Failed to connect to the database.")
+        return
+    
+    try:
+        read, added = transfer.import_table(conn, table, path, fmt or transfer.guess_format(path))
+        if table in ('likes', 'comments') and added:
+            # Imported engagement bypasses the bumps; recount the recent part
+            cur = conn.cursor()
+            rebuild_post_scores(cur)
+            conn.commit()
+            cur.close()
+        cache.clear()
+        print(f"Imported {table}: {added:,} of {read:,} row(s) added, {read - added:,} skipped.")
+    except (psycopg2.Error, OSError, ValueError) as e:
+        print(f"Import error: {e}")
+        conn.rollback()
+
+@app.cli.command('build-static')
+def build_static_command():
+    """Minify the stylesheets and write precompressed copies of the static files"""
+    written = compression.build_static(app.static_folder)
+    for path, size in sorted(written.items()):
+        print(f"{os.path.relpath(path, app.root_path)}: {size:,} bytes")
+
+def elect(lock_id):
+    """A new connection holding the session advisory lock `lock_id`, or None if another has it"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (lock_id,))
+        if cur.fetchone()[0]:
+            return conn
+    except psycopg2.Error:
         conn.close()
-        return False
+        raise
+    conn.close()
+    return None
+
+def start_elected_job(name, lock_id, interval, job):
+    """Run `job()` every `interval` seconds in a daemon thread of one process only
+
+    Every process that starts the job competes for the session advisory
+    lock `lock_id` on a connection of its own, outside the pool. The
+    winner keeps that connection, and so the lock, for as long as it
+    lives and runs the job; the others try again every interval, taking
+    over if it dies, and hold no connection meanwhile. Database errors are
+    printed and the job carries on.
+    """
+    if interval <= 0:
+        return None
+    
+    def run():
+        leader = None
+        while True:
+            time.sleep(interval)
+            try:
+                if leader is None:
+                    leader = elect(lock_id)
+                    if leader is None:
+                        continue
+                else:
+                    # Raises if the connection, and with it the lock, was lost
+                    leader.cursor().execute("SELECT 1")
+                job()
+            except psycopg2.Error as e:
+                print(f"{name} error: {e}")
+                if leader is not None and leader.closed:
+                    leader = None
+    
+    thread = threading.Thread(target=run, name=name.lower().replace(' ', '-'), daemon=True)
+    thread.start()
+    return thread
+
+# Background pass that corrects any drift in user_stats; 0 disables it.
+# One process runs it (see start_elected_job); `flask rebuild-user-stats`
+# runs the same pass on demand, e.g. from cron.
+USER_STATS_REFRESH_INTERVAL = float(os.environ.get('USER_STATS_REFRESH_INTERVAL', 300))
+USER_STATS_LOCK_ID = 7130001
+USER_STATS_LEADER_LOCK_ID = 7130005
+
+def refresh_user_stats():
+    """One refresher pass; only one process runs it at a time"""
+    conn = db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (USER_STATS_LOCK_ID,))
+        fixed = rebuild_user_stats(cur) if cur.fetchone()[0] else 0
+        conn.commit()
+        cur.close()
+        return fixed
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn)
+
+def start_user_stats_refresher(interval=USER_STATS_REFRESH_INTERVAL):
+    """Run refresh_user_stats every `interval` seconds, in one process only"""
+    def job():
+        fixed = refresh_user_stats()
+        if fixed:
+            print(f"User stats refresher corrected {fixed} user(s).")
+    
+    return start_elected_job('User stats refresh', USER_STATS_LEADER_LOCK_ID, interval, job)
+
+def load_identity(user_id, fresh=False):
+    """Identity of a user from the identity cache, querying on a miss
+
+    With `fresh`, always queries, and refreshes the cache entry. Returns a
+    dict with id, username, role and version, or None if the user no
+    longer exists. Raises psycopg2.Error if the database is unavailable.
+    """
+    key = f"identity:{user_id}"
+    identity = None if fresh else identity_cache.get(key)
+    if identity is not None:
+        return identity
+    
+    # Roles gate access, so read them from the primary, never a lagging replica
+    conn = get_db_connection(primary=True)
+    if not conn:
+        raise psycopg2.OperationalError("no database connection available")
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT id, username, role, auth_version as version
+            FROM users WHERE id = %s
+        """, (user_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    
+    if row is None:
+        identity_cache.delete(key)
+        return None
+    identity = dict(row)
+    identity_cache.set(key, identity)
+    return identity
+
+def invalidate_identity(*user_ids):
+    """Drop cached identities after a role change or deletion"""
+    for user_id in user_ids:
+        identity_cache.delete(f"identity:{user_id}")
+
+def current_user():
+    """The logged-in user's identity, resolved once per request
+
+    A session whose user was deleted is cleared; one stamped with an older
+    auth version picks up the current role and username.
+    """
+    if 'user_id' not in session:
+        return None
+    if 'current_user' in g:
+        return g.current_user
+    
+    try:
+        identity = load_identity(session['user_id'])
+    except psycopg2.Error as e:
+        print(f"Identity lookup error: {e}")
+        g.current_user = None
+        return None
+    return use_identity(identity)
+
+def use_identity(identity):
+    """Make `identity` the request's current user, bringing the session in step"""
+    if identity is None:
+        session.clear()
+    elif session.get('auth_version') != identity['version']:
+        session['username'] = identity['username']
+        session['role'] = identity['role']
+        session['auth_version'] = identity['version']
+    
+    g.current_user = identity
+    return identity
+
+@app.before_request
+def resolve_current_user():
+    """Keep the session's role in step with the identity cache on every page"""
+    if request.endpoint != 'static':
+        current_user()
 
 def login_required(f):
     """Decorator to require login for certain routes"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if current_user() is None:
             flash('Please log in to access this page.', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
 def admin_required(f):
-    """Decorator to require admin role for certain routes"""
+    """Decorator to require admin role for certain routes
+
+    A cached identity may predate a demotion or deletion whose
+    invalidation this process missed, so an admin's role is read again
+    from the database before the route runs.
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        user = current_user()
+        if user is not None and user['role'] == 'admin':
+            try:
+                user = use_identity(load_identity(user['id'], fresh=True))
+            except psycopg2.Error as e:
+                print(f"Identity lookup error: {e}")
+                flash('Database connection error.', 'error')
+                return redirect(url_for('index'))
+        
+        if user is None:
             flash('Please log in to access this page.', 'error')
             return redirect(url_for('login'))
         
-        conn = get_db_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("SELECT role FROM users WHERE id = %s", (session['user_id'],))
-            user_role = cur.fetchone()
-            cur.close()
-            conn.close()
-            
-            if not user_role or user_role[0] != 'admin':
-                flash('Admin access required.', 'error')
-                return redirect(url_for('index'))
+        if user['role'] != 'admin':
+            flash('Admin access required.', 'error')
+            return redirect(url_for('index'))
         
         return f(*args, **kwargs)
     return decorated_function
 
-# Routes
-@app.route('/')
-def index():
-    """Home page showing all blog posts"""
+# Feed pagination
+FEED_PAGE_SIZE = int(os.environ.get('FEED_PAGE_SIZE', 20))
+FEED_MAX_PAGE_SIZE = 100
+
+def encode_cursor(row):
+    """Encode a row's (created_at, id) keyset position as an opaque string"""
+    return f"{row['created_at'].isoformat()}_{row['id']}"
+
+def decode_cursor(value):
+    """Decode a cursor produced by encode_cursor, or None if it is invalid"""
+    try:
+        created_at, post_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (AttributeError, ValueError):
+        return None
+
+def get_page_size(default=FEED_PAGE_SIZE, maximum=FEED_MAX_PAGE_SIZE):
+    """Page size from the `limit` query argument, clamped to sane bounds"""
+    try:
+        size = int(request.args.get('limit', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
+
+# Lists show the excerpt; only a post's own page reads its content
+FEED_COLUMNS = """
+    p.id, p.user_id, p.title, p.excerpt, p.word_count, p.created_at,
+    p.like_count, p.comment_count, u.username
+"""
+
+# The JSON feeds have always returned each post's body; keep it there
+API_FEED_COLUMNS = FEED_COLUMNS + ", p.content"
+
+# Read along with the rows that fill feed and post cache entries, and kept
+# in them as the entry's HTTP validators rather than in the rows
+VALIDATED_AT_COLUMN = "p.updated_at::timestamptz as validated_at"
+
+def row_validators(rows):
+    """(etag, last_modified) of cache entry rows, taking their validated_at out"""
+    stamps = sorted((row['id'], row.pop('validated_at')) for row in rows)
+    if not stamps:
+        return 'empty', None
+    digest = hashlib.md5(','.join(f"{id}:{at.timestamp():.6f}" for id, at in stamps).encode())
+    return digest.hexdigest(), max(at for _, at in stamps)
+
+def feed_query(before=None, limit=FEED_PAGE_SIZE, columns=FEED_COLUMNS):
+    """SQL and parameters for a feed page plus one extra row, newest first"""
+    params = []
+    where = ""
+    if before:
+        where = "WHERE (p.created_at, p.id) < (%s, %s)"
+        params.extend(before)
+    params.append(limit + 1)
+    
+    return f"""
+        SELECT {columns}
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        {where}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT %s
+    """, params
+
+def fetch_feed_page(cur, before=None, limit=FEED_PAGE_SIZE, columns=FEED_COLUMNS):
+    """Fetch one page of posts, newest first, and the cursor of the next page"""
+    cur.execute(*feed_query(before, limit, columns))
+    posts = cur.fetchall()
+    
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1])
+    return posts, next_cursor
+
+def load_feed_page(before, limit, columns=FEED_COLUMNS):
+    """Feed page from the cache, querying the database on a miss
+
+    Returns (posts, next_cursor, validators), validators being the
+    (etag, last_modified) of the posts in the entry. Entries are tagged
+    with every post they show so a write to one post only drops the pages
+    containing it; the first page is also tagged 'feed:head' since new
+    posts only ever appear there.
+    Returns None if no database connection is available.
+    """
+    key = feed_cache_key(before, limit, columns)
+    page = read_cache(key)
+    if page is not None:
+        return page
+    
     conn = get_db_connection()
     if not conn:
-        flash('Database connection error.', 'error')
-        return render_template('index.html', posts=[])
+        return None
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        posts, next_cursor = fetch_feed_page(cur, before, limit, f"{columns}, {VALIDATED_AT_COLUMN}")
+    finally:
+        cur.close()
+    return cache_feed_page(key, before, posts, next_cursor)
+
+def feed_cache_key(before, limit, columns=FEED_COLUMNS):
+    position = f"{before[0].isoformat()}_{before[1]}" if before else 'head'
+    variant = 'api' if columns == API_FEED_COLUMNS else 'html'
+    return f"feed:{variant}:{limit}:{position}"
+
+def cache_feed_page(key, before, posts, next_cursor):
+    """Store a feed page under `key`, tagged as load_feed_page describes, and return it
+
+    `posts` carry validated_at; the entry keeps it as its validators.
+    """
+    posts = [dict(post) for post in posts]
+    page = (posts, next_cursor, row_validators(posts))
+    tags = ['feed'] + [f"post:{post['id']}" for post in posts]
+    if not before:
+        tags.append('feed:head')
+    cache.set(key, page, ttl=read_cache_ttl(), tags=tags)
+    return page
+
+# Trending and top feeds. Likes and comments add weight to a post's score
+# in each feed, decaying exponentially with the feed's half-life. Scores
+# are stored relative to the feed's anchor time ("forward decay"): an event
+# at time t adds weight * exp((t - anchor) / tau), so the stored order is
+# the decayed order at any moment and nothing needs rewriting as time
+# passes. The refresher rebases scores onto a new anchor before they grow
+# large, and prunes posts that have cooled off or aged out of the feed.
+# tau is the decay time constant in seconds: the half-life divided by ln 2.
+SCORE_FEEDS = {
+    'trending': {
+        'title': 'Trending',
+        'tau': float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 6)) * 3600 / math.log(2),
+        'max_age': None,
+    },
+    'top': {
+        'title': 'Top This Week',
+        'tau': float(os.environ.get('TOP_HALF_LIFE_HOURS', 72)) * 3600 / math.log(2),
+        'max_age': timedelta(days=7),
+    },
+}
+
+SCORE_WEIGHTS = {
+    'like': float(os.environ.get('SCORE_LIKE_WEIGHT', 1)),
+    'comment': float(os.environ.get('SCORE_COMMENT_WEIGHT', 2)),
+}
+# Scores that decayed below this are pruned; rebuilds only read this far back
+SCORE_PRUNE_BELOW = float(os.environ.get('SCORE_PRUNE_BELOW', 0.05))
+SCORE_REBUILD_HORIZON = timedelta(days=7)
+SCORE_REFRESH_INTERVAL = float(os.environ.get('SCORE_REFRESH_INTERVAL', 600))
+SCORE_FEED_CACHE_TTL = int(os.environ.get('SCORE_FEED_CACHE_TTL', 30))
+# Bumps hold this lock shared; rebasing takes it exclusively
+SCORE_LOCK_ID = 7130002
+SCORE_REFRESH_LOCK_ID = 7130003
+SCORE_LEADER_LOCK_ID = 7130006
+
+# Per-feed decay parameters as a relation f(feed, tau, max_age)
+SCORE_FEEDS_SQL = "unnest(%(feeds)s::text[], %(taus)s::float8[], %(max_ages)s::interval[]) AS f(feed, tau, max_age)"
+
+def score_feed_params(**params):
+    return dict(params, feeds=list(SCORE_FEEDS),
+                taus=[feed['tau'] for feed in SCORE_FEEDS.values()],
+                max_ages=[feed['max_age'] for feed in SCORE_FEEDS.values()])
+
+def bump_scores(cur, events):
+    """Add or take back engagement; `events` are (post_id, weight, created_at) tuples
+
+    Each event adds its weight decayed from `created_at`, the time of the
+    like or comment (None for now). Taking one back passes the negative weight with the
+    created_at of the row removed, so exactly what it contributed goes.
+    Events older than SCORE_REBUILD_HORIZON are ignored, as in rebuilds.
+    Runs in the caller's transaction. A score never drops below zero and a
+    post without a score gets one only from a positive change; posts older
+    than a feed's max_age are left out of it.
+    """
+    events = [event for event in events if event[1]]
+    if not events:
+        return
+    cur.execute("SELECT pg_advisory_xact_lock_shared(%s)", (SCORE_LOCK_ID,))
+    cur.execute(f"""
+        INSERT INTO post_scores (feed, post_id, score)
+        SELECT c.feed, c.post_id, c.score
+        FROM (
+            SELECT f.feed, p.id as post_id,
+                   SUM(w.weight * exp(extract(epoch FROM COALESCE(w.created_at, LOCALTIMESTAMP) - a.anchor) / f.tau)) as score
+            FROM unnest(%(post_ids)s::int[], %(weights)s::float8[], %(created_at)s::timestamp[])
+                AS w(post_id, weight, created_at)
+            JOIN posts p ON p.id = w.post_id
+            CROSS JOIN {SCORE_FEEDS_SQL}
+            JOIN score_anchors a ON a.feed = f.feed
+            WHERE COALESCE(w.created_at, LOCALTIMESTAMP) > LOCALTIMESTAMP - %(horizon)s
+              AND (f.max_age IS NULL OR p.created_at > LOCALTIMESTAMP - f.max_age)
+            GROUP BY f.feed, p.id
+        ) c
+        WHERE c.score > 0
+           OR EXISTS (SELECT 1 FROM post_scores s WHERE s.feed = c.feed AND s.post_id = c.post_id)
+        ORDER BY c.feed, c.post_id
+        ON CONFLICT (feed, post_id) DO UPDATE
+        SET score = GREATEST(post_scores.score + EXCLUDED.score, 0)
+    """, score_feed_params(post_ids=[event[0] for event in events],
+                           weights=[event[1] for event in events],
+                           created_at=[event[2] for event in events],
+                           horizon=SCORE_REBUILD_HORIZON))
+
+def rebuild_post_scores(cur):
+    """Recompute every score from the likes and comments of the last SCORE_REBUILD_HORIZON"""
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCORE_LOCK_ID,))
+    cur.execute("DELETE FROM post_scores")
+    cur.execute("UPDATE score_anchors SET anchor = LOCALTIMESTAMP")
+    cur.execute(f"""
+        INSERT INTO post_scores (feed, post_id, score)
+        SELECT f.feed, e.post_id, SUM(e.weight * exp(extract(epoch FROM e.created_at - LOCALTIMESTAMP) / f.tau))
+        FROM (
+            SELECT post_id, created_at, %(like)s as weight FROM likes
+            WHERE created_at > LOCALTIMESTAMP - %(horizon)s
+            UNION ALL
+            SELECT post_id, created_at, %(comment)s FROM comments
+            WHERE created_at > LOCALTIMESTAMP - %(horizon)s
+        ) e
+        JOIN posts p ON p.id = e.post_id
+        CROSS JOIN {SCORE_FEEDS_SQL}
+        WHERE f.max_age IS NULL OR p.created_at > LOCALTIMESTAMP - f.max_age
+        GROUP BY f.feed, e.post_id
+        HAVING SUM(e.weight * exp(extract(epoch FROM e.created_at - LOCALTIMESTAMP) / f.tau)) >= %(prune_below)s
+    """, score_feed_params(like=SCORE_WEIGHTS['like'], comment=SCORE_WEIGHTS['comment'],
+                           horizon=SCORE_REBUILD_HORIZON, prune_below=SCORE_PRUNE_BELOW))
+    return cur.rowcount
+
+def redecay_post_scores(cur):
+    """Rebase scores onto the current time and prune cold or aged-out posts; returns rows pruned"""
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCORE_LOCK_ID,))
+    params = score_feed_params(prune_below=SCORE_PRUNE_BELOW)
+    cur.execute(f"""
+        UPDATE post_scores s
+        SET score = s.score * exp(extract(epoch FROM a.anchor - LOCALTIMESTAMP) / f.tau)
+        FROM {SCORE_FEEDS_SQL}
+        JOIN score_anchors a ON a.feed = f.feed
+        WHERE s.feed = f.feed
+    """, params)
+    cur.execute("UPDATE score_anchors SET anchor = LOCALTIMESTAMP")
+    cur.execute(f"""
+        DELETE FROM post_scores s
+        USING {SCORE_FEEDS_SQL}, posts p
+        WHERE s.feed = f.feed AND p.id = s.post_id
+          AND (s.score < %(prune_below)s
+               OR (f.max_age IS NOT NULL AND p.created_at <= LOCALTIMESTAMP - f.max_age))
+    """, params)
+    return cur.rowcount
+
+def refresh_post_scores():
+    """One re-decay and prune pass; only one process runs it at a time"""
+    conn = db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (SCORE_REFRESH_LOCK_ID,))
+        pruned = redecay_post_scores(cur) if cur.fetchone()[0] else 0
+        conn.commit()
+        cur.close()
+        return pruned
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn)
+
+def start_score_refresher(interval=SCORE_REFRESH_INTERVAL):
+    """Run refresh_post_scores every `interval` seconds, in one process only"""
+    return start_elected_job('Score refresh', SCORE_LEADER_LOCK_ID, interval, refresh_post_scores)
+
+@app.cli.command('refresh-scores')
+def refresh_scores_command():
+    """Re-decay the trending and top scores now and prune cold posts"""
+    try:
+        pruned = refresh_post_scores()
+        print(f"Refreshed scores: {pruned} cold post score(s) pruned.")
+    except psycopg2.Error as e:
+        print(f"Refresh scores error: {e}")
+
+@app.cli.command('rebuild-scores')
+def rebuild_scores_command():
+    """Recompute the trending and top scores from recent likes and comments"""
+    conn = get_db_connection()
+    if not conn:
+        print("Failed to connect to the database.")
+        return
     
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("""
-            SELECT p.*, u.username, 
-                   COUNT(DISTINCT l.id) as like_count,
-                   COUNT(DISTINCT c.id) as comment_count
+        cur = conn.cursor()
+        scored = rebuild_post_scores(cur)
+        conn.commit()
+        cur.close()
+        cache.clear()
+        print(f"Rebuilt scores: {scored} post score(s).")
+    except psycopg2.Error as e:
+        print(f"Rebuild scores error: {e}")
+        conn.rollback()
+
+def encode_score_cursor(row):
+    """Encode a row's (score, id) position, and the anchor its score is relative to"""
+    return f"{row['score']!r}_{row['id']}_{row['score_anchor'].isoformat()}"
+
+def decode_score_cursor(value):
+    """Decode a cursor produced by encode_score_cursor, or None if it is invalid"""
+    try:
+        score, post_id, anchor = value.split('_')
+        score = float(score)
+        if not math.isfinite(score):
+            return None
+        return score, int(post_id), datetime.fromisoformat(anchor)
+    except (AttributeError, ValueError):
+        return None
+
+def score_feed_query(feed, after=None, limit=FEED_PAGE_SIZE, columns=FEED_COLUMNS):
+    """SQL and parameters for a page of a score feed plus one extra row, highest score first"""
+    params = {'feed': feed, 'limit': limit + 1}
+    where = ""
+    if after:
+        # A rebase since the cursor was made scales every score down by the
+        # same factor; scale the cursor's score alike
+        where = """
+            AND (s.score, s.post_id) < (
+                %(score)s::float8 * exp(extract(epoch FROM %(anchor)s::timestamp
+                                - (SELECT anchor FROM score_anchors WHERE feed = %(feed)s)) / %(tau)s),
+                %(post_id)s)
+        """
+        params.update(zip(('score', 'post_id', 'anchor'), after), tau=SCORE_FEEDS[feed]['tau'])
+    
+    return f"""
+        SELECT {columns}, s.score, a.anchor as score_anchor
+        FROM post_scores s
+        JOIN score_anchors a ON a.feed = s.feed
+        JOIN posts p ON p.id = s.post_id
+        JOIN users u ON p.user_id = u.id
+        WHERE s.feed = %(feed)s AND s.score > 0 {where}
+        ORDER BY s.score DESC, s.post_id DESC
+        LIMIT %(limit)s
+    """, params
+
+def fetch_score_feed_page(cur, feed, after=None, limit=FEED_PAGE_SIZE):
+    """Fetch one page of a score feed and the cursor of the next page"""
+    cur.execute(*score_feed_query(feed, after, limit))
+    posts = cur.fetchall()
+    
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_score_cursor(posts[-1])
+    return posts, next_cursor
+
+def load_score_feed_page(feed, after, limit):
+    """Score feed page from the cache, querying the database on a miss
+
+    Pages are tagged with their posts like feed pages, and also expire
+    after SCORE_FEED_CACHE_TTL seconds since other posts' scores move
+    past them. Returns None if no database connection is available.
+    """
+    position = '_'.join(str(part) for part in after) if after else 'head'
+    key = f"{feed}:{limit}:{position}"
+    page = read_cache(key)
+    if page is not None:
+        return page
+    
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        posts, next_cursor = fetch_score_feed_page(cur, feed, after, limit)
+    finally:
+        cur.close()
+    
+    page = ([dict(post) for post in posts], next_cursor)
+    cache.set(key, page, ttl=min(SCORE_FEED_CACHE_TTL, read_cache_ttl() or SCORE_FEED_CACHE_TTL),
+              tags=[f"post:{post['id']}" for post in posts])
+    return page
+
+# Comment threads, oldest first
+COMMENT_PAGE_SIZE = int(os.environ.get('COMMENT_PAGE_SIZE', 20))
+
+def comment_query(post_id, after=None, limit=COMMENT_PAGE_SIZE):
+    """SQL and parameters for a page of a post's comments plus one extra row, oldest first"""
+    params = [post_id]
+    where = "c.post_id = %s"
+    if after:
+        where += " AND (c.created_at, c.id) > (%s, %s)"
+        params.extend(after)
+    params.append(limit + 1)
+    
+    return f"""
+        SELECT c.id, c.user_id, c.post_id, c.content, c.created_at, u.username
+        FROM comments c
+        JOIN users u ON c.user_id = u.id
+        WHERE {where}
+        ORDER BY c.created_at ASC, c.id ASC
+        LIMIT %s
+    """, params
+
+def fetch_comment_page(cur, post_id, after=None, limit=COMMENT_PAGE_SIZE):
+    """Fetch one page of a post's comments and the cursor of the next page"""
+    cur.execute(*comment_query(post_id, after, limit))
+    comments = cur.fetchall()
+    
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor(comments[-1])
+    return comments, next_cursor
+
+def load_comment_page(post_id, after):
+    """A later page of a post's comments from the cache, querying on a miss
+
+    Returns None if no database connection is available.
+    """
+    position = f"{after[0].isoformat()}_{after[1]}"
+    key = f"comments:{post_id}:{COMMENT_PAGE_SIZE}:{position}"
+    page = read_cache(key)
+    if page is not None:
+        return page
+    
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        comments, next_cursor = fetch_comment_page(cur, post_id, after)
+    finally:
+        cur.close()
+    
+    page = ([dict(comment) for comment in comments], next_cursor)
+    cache.set(key, page, ttl=read_cache_ttl(), tags=[f"post:{post_id}"])
+    return page
+
+def load_post(post_id):
+    """Post with author and its first page of comments from the cache,
+    querying on a miss
+
+    Returns (post, comments, next_cursor, validators), validators being
+    the (etag, last_modified) of the post as cached; (None, [], None, None)
+    for a missing post and None if no database connection is available.
+    posts.updated_at moves with every edit, like and comment, so it
+    validates the comments too.
+    """
+    key = f"post:{post_id}"
+    cached = read_cache(key)
+    if cached is not None:
+        return cached
+    
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        # Get the post with author info and stats
+        cur.execute(f"""
+            SELECT p.id, p.user_id, p.title, p.content, p.created_at,
+                   p.like_count, p.comment_count, u.username, {VALIDATED_AT_COLUMN}
             FROM posts p
             JOIN users u ON p.user_id = u.id
-            LEFT JOIN likes l ON p.id = l.post_id
-            LEFT JOIN comments c ON p.id = c.post_id
-            GROUP BY p.id, u.username
-            ORDER BY p.created_at DESC
-        """)
-        posts = cur.fetchall()
+            WHERE p.id = %s
+        """, (post_id,))
+        post = cur.fetchone()
+        if not post:
+            return None, [], None, None
+        
+        comments, next_cursor = fetch_comment_page(cur, post_id)
+    finally:
         cur.close()
-        conn.close()
+    
+    return cache_post(post, comments, next_cursor)
+
+def cache_post(post, comments, next_cursor):
+    """Store a post read with validated_at, as load_post describes, and return the entry"""
+    post = dict(post)
+    key = f"post:{post['id']}"
+    result = (post, [dict(comment) for comment in comments], next_cursor, row_validators([post]))
+    cache.set(key, result, ttl=read_cache_ttl(), tags=[key])
+    return result
+
+def comment_json(comment):
+    """JSON form of a comment, with its rendered markup for appending to the page"""
+    return dict(comment, created_at=comment['created_at'].isoformat(),
+                html=render_template('comment_item.html', comment=comment))
+
+def wants_json():
+    """True when the client asked for JSON rather than a redirect"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def invalidate_post(post_id):
+    """Drop cached feed pages and post pages that show the given post"""
+    cache.invalidate_tags(f"post:{post_id}")
+
+def toggle_like(cur, user_id, post_id):
+    """Like or unlike a post in one statement; returns (liked, like_count, changed_at)
+
+    The DELETE removes an existing like; only if it removed nothing does
+    the INSERT run, and ON CONFLICT absorbs a concurrent toggle that got
+    there first. The counter moves by exactly the rows changed, and the
+    UPDATE's row lock on the post serializes concurrent togglers. The
+    author's likes_received moves by the same amount. `changed_at` is the
+    created_at of the like added or removed, or None if nothing changed.
+    """
+    cur.execute("""
+        WITH removed AS (
+            DELETE FROM likes
+            WHERE user_id = %(user_id)s AND post_id = %(post_id)s
+            RETURNING created_at
+        ), added AS (
+            INSERT INTO likes (user_id, post_id)
+            SELECT %(user_id)s, %(post_id)s
+            WHERE NOT EXISTS (SELECT 1 FROM removed)
+            ON CONFLICT (user_id, post_id) DO NOTHING
+            RETURNING created_at
+        ), counted AS (
+            UPDATE posts
+            SET like_count = like_count
+                + (SELECT COUNT(*) FROM added)
+                - (SELECT COUNT(*) FROM removed),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = %(post_id)s
+            RETURNING like_count, user_id
+        ), credited AS (
+            UPDATE user_stats s
+            SET likes_received = s.likes_received
+                + (SELECT COUNT(*) FROM added)
+                - (SELECT COUNT(*) FROM removed)
+            FROM counted
+            WHERE s.user_id = counted.user_id
+        )
+        SELECT NOT EXISTS (SELECT 1 FROM removed) as liked,
+               (SELECT like_count FROM counted) as like_count,
+               COALESCE((SELECT created_at FROM removed), (SELECT created_at FROM added)) as changed_at
+    """, {'user_id': user_id, 'post_id': post_id})
+    return cur.fetchone()
+
+# Write-behind for likes and comments (WRITE_BEHIND=1). Writes are queued in
+# process and written in batched multi-row statements. With durability
+# 'commit' a request waits until its batch is committed; with 'queued' it is
+# answered once queued and batches commit with synchronous_commit off, so a
+# crash can lose the last moments of writes.
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_DURABILITY = os.environ.get('WRITE_BEHIND_DURABILITY', 'commit')
+WRITE_BEHIND_CONFIG = {
+    'interval': float(os.environ.get('WRITE_BEHIND_INTERVAL', 0.05)),
+    'max_batch': int(os.environ.get('WRITE_BEHIND_MAX_BATCH', 500)),
+    'max_queue': int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', 10000)),
+    'timeout': float(os.environ.get('WRITE_BEHIND_TIMEOUT', 2)),
+}
+
+# Sets each (user, post) like to the wanted state; counters move by the rows
+# changed. Returns (post_id, +1/-1, created_at) per like added or removed.
+WRITE_LIKES_SQL = """
+    WITH wanted AS (
+        SELECT * FROM unnest(%(user_ids)s::int[], %(post_ids)s::int[], %(liked)s::bool[])
+            AS w(user_id, post_id, liked)
+    ), removed AS (
+        DELETE FROM likes l
+        USING wanted w
+        WHERE NOT w.liked AND l.user_id = w.user_id AND l.post_id = w.post_id
+        RETURNING l.post_id, l.created_at
+    ), added AS (
+        INSERT INTO likes (user_id, post_id)
+        SELECT w.user_id, w.post_id
+        FROM wanted w
+        JOIN posts p ON p.id = w.post_id
+        JOIN users u ON u.id = w.user_id
+        WHERE w.liked
+        ON CONFLICT (user_id, post_id) DO NOTHING
+        RETURNING post_id, created_at
+    ), counted AS (
+        SELECT post_id, SUM(n) as n FROM (
+            SELECT post_id, 1 as n FROM added
+            UNION ALL
+            SELECT post_id, -1 FROM removed
+        ) changes
+        GROUP BY post_id
+    ), bumped AS (
+        UPDATE posts p
+        SET like_count = p.like_count + c.n, updated_at = CURRENT_TIMESTAMP
+        FROM counted c WHERE p.id = c.post_id AND c.n <> 0
+        RETURNING p.id, p.user_id, c.n
+    ), credited AS (
+        INSERT INTO user_stats (user_id, likes_received)
+        SELECT user_id, SUM(n) FROM bumped GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET likes_received = user_stats.likes_received + EXCLUDED.likes_received
+    )
+    SELECT post_id, 1, created_at FROM added
+    UNION ALL
+    SELECT post_id, -1, created_at FROM removed
+"""
+
+# Comments arrive with ids and timestamps assigned when they were queued.
+# Returns (post_id, created_at) per comment written.
+WRITE_COMMENTS_SQL = """
+    WITH inserted AS (
+        INSERT INTO comments (id, user_id, post_id, content, created_at)
+        SELECT c.id, c.user_id, c.post_id, c.content, c.created_at
+        FROM unnest(%(ids)s::int[], %(user_ids)s::int[], %(post_ids)s::int[],
+                    %(contents)s::text[], %(created_at)s::timestamp[])
+            AS c(id, user_id, post_id, content, created_at)
+        JOIN posts p ON p.id = c.post_id
+        JOIN users u ON u.id = c.user_id
+        RETURNING post_id, created_at
+    ), counted AS (
+        SELECT post_id, COUNT(*) as n FROM inserted GROUP BY post_id
+    ), bumped AS (
+        UPDATE posts p
+        SET comment_count = p.comment_count + c.n, updated_at = CURRENT_TIMESTAMP
+        FROM counted c WHERE p.id = c.post_id
+        RETURNING p.id, p.user_id, c.n
+    ), credited AS (
+        INSERT INTO user_stats (user_id, comments_received)
+        SELECT user_id, SUM(n) FROM bumped GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET comments_received = user_stats.comments_received + EXCLUDED.comments_received
+    )
+    SELECT post_id, created_at FROM inserted
+"""
+
+def write_batch(likes, comments):
+    """Write a batch of queued likes and comments in one transaction; returns the posts changed
+
+    Likes and comments for posts or users deleted in the meantime are
+    dropped. Runs on the write-behind thread, with its own connection.
+    Cache entries are invalidated by invalidate_written afterwards, so a
+    cache error cannot fail a batch that was committed.
+    """
+    conn = write_pool.getconn()
+    try:
+        cur = conn.cursor()
+        if WRITE_BEHIND_DURABILITY == 'queued':
+            cur.execute("SET LOCAL synchronous_commit = off")
+        # Lock the posts in id order so concurrent batches cannot deadlock
+        post_ids = sorted({post_id for _, post_id in likes} | {c['post_id'] for c in comments})
+        cur.execute("SELECT id FROM posts WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (post_ids,))
+        
+        events = []
+        if likes:
+            cur.execute(WRITE_LIKES_SQL, {
+                'user_ids': [user_id for user_id, _ in likes],
+                'post_ids': [post_id for _, post_id in likes],
+                'liked': list(likes.values()),
+            })
+            events += [(post_id, n * SCORE_WEIGHTS['like'], created_at)
+                       for post_id, n, created_at in cur.fetchall()]
+        if comments:
+            cur.execute(WRITE_COMMENTS_SQL, {
+                'ids': [c['id'] for c in comments],
+                'user_ids': [c['user_id'] for c in comments],
+                'post_ids': [c['post_id'] for c in comments],
+                'contents': [c['content'] for c in comments],
+                'created_at': [c['created_at'] for c in comments],
+            })
+            events += [(post_id, SCORE_WEIGHTS['comment'], created_at)
+                       for post_id, created_at in cur.fetchall()]
+        bump_scores(cur, events)
+        
+        conn.commit()
+        cur.close()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        write_pool.putconn(conn)
+    return {post_id for post_id, _, _ in events}
+
+def invalidate_written(written):
+    """Invalidate the posts changed by write_batch calls"""
+    for post_id in set().union(*written):
+        invalidate_post(post_id)
+
+write_queue = None
+if WRITE_BEHIND:
+    write_pool = ConnectionPool(DB_CONFIG, connection_factory=InstrumentedConnection,
+                                **dict(DB_POOL_CONFIG, minconn=0, maxconn=1))
+    write_queue = WriteBehindQueue(write_batch, after_write=invalidate_written, **WRITE_BEHIND_CONFIG)
+    atexit.register(write_queue.close)
+    instrumentation.metrics.add_gauges(lambda: {f"write_queue_{k}": v for k, v in write_queue.stats().items()})
+
+def await_write(done):
+    """Wait for a queued write when durability is 'commit'; raises what the write raised
+
+    The request's connection goes back to the pool first, so requests
+    waiting on the queue do not hold connections others need.
+    """
+    if WRITE_BEHIND_DURABILITY == 'commit':
+        release_db_connection(None)
+        done.result()
+
+def like_or_unlike(conn, user_id, post_id):
+    """Toggle a like, directly or through the write queue; returns (liked, like_count)
+
+    Returns None if the post does not exist. While writes are queued the
+    count includes them, so it may briefly be off by the likes being
+    committed at that moment. Rolls back and raises psycopg2.Error, or
+    raises QueueFull; the connection may be released by then.
+    """
+    cur = conn.cursor()
+    try:
+        if write_queue is None:
+            liked, like_count, changed_at = toggle_like(cur, user_id, post_id)
+            if changed_at is not None:
+                weight = SCORE_WEIGHTS['like'] if liked else -SCORE_WEIGHTS['like']
+                bump_scores(cur, [(post_id, weight, changed_at)])
+            conn.commit()
+            invalidate_post(post_id)
+            return liked, like_count
         
-        return render_template('index.html', posts=posts)
+        # A batch written between reading the like and queueing the toggle
+        # leaves the read out of date; read it again then
+        while True:
+            written = write_queue.written()
+            cur.execute("""
+                SELECT p.like_count,
+                       EXISTS (SELECT 1 FROM likes WHERE user_id = %(user_id)s AND post_id = p.id)
+                FROM posts p WHERE p.id = %(post_id)s
+            """, {'user_id': user_id, 'post_id': post_id})
+            row = cur.fetchone()
+            if row is None:
+                return None
+            like_count, stored = row
+            toggled = write_queue.toggle(user_id, post_id, stored, written)
+            if toggled is not None:
+                break
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    
+    liked, done = toggled
+    like_count += write_queue.pending_counts(post_id)[0]
+    await_write(done)
+    return liked, like_count
+
+def add_comment(conn, user_id, post_id, content):
+    """Add a comment, directly or through the write queue; returns (comment, comment_count)
+
+    Returns None if the post does not exist. Queued comments get their id
+    and timestamp right away, so the reply is the same either way. Errors
+    are raised as in like_or_unlike.
+    """
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        if write_queue is None:
+            cur.execute("""
+                INSERT INTO comments (user_id, post_id, content)
+                SELECT %(user_id)s, id, %(content)s FROM posts WHERE id = %(post_id)s
+                RETURNING id, user_id, post_id, content, created_at
+            """, {'user_id': user_id, 'post_id': post_id, 'content': content})
+            comment = cur.fetchone()
+            if comment is None:
+                return None
+            cur.execute("""
+                UPDATE posts SET comment_count = comment_count + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING comment_count, user_id
+            """, (post_id,))
+            counted = cur.fetchone()
+            adjust_user_stats(cur, counted['user_id'], comments=1)
+            bump_scores(cur, [(post_id, SCORE_WEIGHTS['comment'], comment['created_at'])])
+            conn.commit()
+            invalidate_post(post_id)
+            return dict(comment), counted['comment_count']
+        
+        cur.execute("""
+            SELECT nextval(pg_get_serial_sequence('comments', 'id'))::int as id,
+                   LOCALTIMESTAMP as created_at, comment_count
+            FROM posts WHERE id = %s
+        """, (post_id,))
+        row = cur.fetchone()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    if row is None:
+        return None
+    
+    comment = {'id': row['id'], 'user_id': user_id, 'post_id': post_id,
+               'content': content, 'created_at': row['created_at']}
+    done = write_queue.comment(comment)
+    comment_count = row['comment_count'] + write_queue.pending_counts(post_id)[1]
+    await_write(done)
+    return comment, comment_count
+
+# Full-text search
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 10))
+SEARCH_MAX_PAGE = 50
+
+# Title terms outrank body terms; parameters are %(title)s and %(content)s
+POST_SEARCH_VECTOR = """
+    setweight(to_tsvector('english', %(title)s), 'A') ||
+    setweight(to_tsvector('english', %(content)s), 'B')
+"""
+
+# Post summaries for lists. The excerpt keeps one character more than any
+# list shows, so templates can tell whether to add an ellipsis.
+EXCERPT_LENGTH = 200
+POST_EXCERPT = f"left(%(content)s, {EXCERPT_LENGTH + 1})"
+POST_WORD_COUNT = r"(SELECT count(*) FROM regexp_matches(%(content)s, '\S+', 'g'))"
+READING_WORDS_PER_MINUTE = 200
+
+@app.template_filter('reading_time')
+def reading_time(word_count):
+    """Minutes it takes to read `word_count` words, at least one"""
+    return max(1, round((word_count or 0) / READING_WORDS_PER_MINUTE))
+
+# ts_headline marks matches with control characters so the snippet can be
+# HTML-escaped before the markers are turned into <mark> tags
+HEADLINE_OPTIONS = 'StartSel=\x02, StopSel=\x03, MaxWords=35, MinWords=15, MaxFragments=2'
+TITLE_HEADLINE_OPTIONS = 'StartSel=\x02, StopSel=\x03, HighlightAll=true'
+
+def highlight(text):
+    """Escape a ts_headline result and turn its match markers into <mark> tags"""
+    return escape(text).replace('\x02', Markup('<mark>')).replace('\x03', Markup('</mark>'))
+
+def search_posts(cur, query, page, page_size):
+    """One page of posts matching `query`, best match first, plus a has-more flag"""
+    # Rank and paginate on the GIN index first; snippets are only built for
+    # the rows on the page since ts_headline re-parses the whole document.
+    cur.execute("""
+        WITH q AS (SELECT websearch_to_tsquery('english', %(query)s) as query)
+        SELECT p.id, p.title, p.created_at, p.like_count, p.comment_count,
+               u.username, hits.rank,
+               ts_headline('english', p.title, q.query, %(title_options)s) as title_snippet,
+               ts_headline('english', p.content, q.query, %(options)s) as snippet
+        FROM (
+            SELECT p.id, ts_rank(p.search_vector, q.query) as rank
+            FROM posts p, q
+            WHERE p.search_vector @@ q.query
+            ORDER BY rank DESC, p.id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        ) hits
+        JOIN posts p ON p.id = hits.id
+        JOIN users u ON p.user_id = u.id
+        CROSS JOIN q
+        ORDER BY hits.rank DESC, p.id DESC
+    """, {'query': query, 'options': HEADLINE_OPTIONS, 'title_options': TITLE_HEADLINE_OPTIONS,
+          'limit': page_size + 1, 'offset': (page - 1) * page_size})
+    results = cur.fetchall()
+    return results[:page_size], len(results) > page_size
+
+def search_comments(cur, query, page, page_size):
+    """One page of comments matching `query`, best match first, plus a has-more flag"""
+    cur.execute("""
+        WITH q AS (SELECT websearch_to_tsquery('english', %(query)s) as query)
+        SELECT c.id, c.post_id, c.created_at, u.username, p.title as post_title, hits.rank,
+               ts_headline('english', c.content, q.query, %(options)s) as snippet
+        FROM (
+            SELECT c.id, ts_rank(to_tsvector('english', c.content), q.query) as rank
+            FROM comments c, q
+            WHERE to_tsvector('english', c.content) @@ q.query
+            ORDER BY rank DESC, c.id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        ) hits
+        JOIN comments c ON c.id = hits.id
+        JOIN users u ON c.user_id = u.id
+        JOIN posts p ON c.post_id = p.id
+        CROSS JOIN q
+        ORDER BY hits.rank DESC, c.id DESC
+    """, {'query': query, 'options': HEADLINE_OPTIONS,
+          'limit': page_size + 1, 'offset': (page - 1) * page_size})
+    results = cur.fetchall()
+    return results[:page_size], len(results) > page_size
+
+def run_search(query, page, include_comments):
+    """Run the post (and optionally comment) search; None if the database is unavailable"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        posts, more_posts = search_posts(cur, query, page, SEARCH_PAGE_SIZE)
+        comments, more_comments = [], False
+        if include_comments:
+            comments, more_comments = search_comments(cur, query, page, SEARCH_PAGE_SIZE)
+    finally:
+        cur.close()
+    
+    for row in posts:
+        row['title_snippet'] = highlight(row['title_snippet'])
+        row['snippet'] = highlight(row['snippet'])
+    for row in comments:
+        row['snippet'] = highlight(row['snippet'])
+    return {
+        'posts': posts,
+        'comments': comments,
+        'has_more': more_posts or more_comments,
+    }
+
+def get_page_number():
+    """1-based page number from the `page` query argument"""
+    try:
+        page = int(request.args.get('page', 1))
+    except ValueError:
+        page = 1
+    return max(1, min(page, SEARCH_MAX_PAGE))
+
+# Admin panel: each section is paged, sorted and filtered in SQL
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+# Unfiltered totals above this come from pg_class estimates, filtered ones are capped
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('ADMIN_EXACT_COUNT_LIMIT', 10000))
+
+ADMIN_SECTIONS = {
+    'users': {
+        'table': 'users',
+        'columns': "u.id, u.username, u.email, u.role, u.created_at",
+        'from': "users u",
+        'alias': 'u',
+        'sorts': {'created_at': 'u.created_at', 'username': 'u.username', 'id': 'u.id'},
+    },
+    'posts': {
+        'table': 'posts',
+        'columns': "p.id, p.title, p.created_at, p.like_count, p.comment_count, u.username",
+        'from': "posts p JOIN users u ON p.user_id = u.id",
+        'alias': 'p',
+        'sorts': {'created_at': 'p.created_at', 'title': 'p.title',
+                  'likes': 'p.like_count', 'comments': 'p.comment_count'},
+    },
+    'comments': {
+        'table': 'comments',
+        'columns': "c.id, c.content, c.created_at, c.post_id, u.username, p.title as post_title",
+        'from': "comments c JOIN users u ON c.user_id = u.id JOIN posts p ON c.post_id = p.id",
+        'alias': 'c',
+        'sorts': {'created_at': 'c.created_at', 'post': 'c.post_id'},
+    },
+}
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD query argument, or None"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+def get_admin_filters(section):
+    """Sorting, filtering and page arguments for one admin section"""
+    spec = ADMIN_SECTIONS[section]
+    sort = request.args.get('sort', 'created_at')
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    return {
+        'username': request.args.get('username', '').strip(),
+        'since': parse_date(request.args.get('since')),
+        'until': parse_date(request.args.get('until')),
+        'sort': sort if sort in spec['sorts'] else 'created_at',
+        'dir': 'asc' if request.args.get('dir') == 'asc' else 'desc',
+        'page': page,
+    }
+
+def count_admin_rows(cur, section, where="", params=()):
+    """Total rows for a section as (count, kind): 'exact', 'estimate' or 'at_least'"""
+    spec = ADMIN_SECTIONS[section]
+    if not where:
+        # Planner statistics are free; fall back to COUNT(*) on small or unanalyzed tables
+        cur.execute("SELECT reltuples::bigint as estimate FROM pg_class WHERE oid = %s::regclass",
+                    (spec['table'],))
+        row = cur.fetchone()
+        estimate = row['estimate'] if row else -1
+        if estimate >= ADMIN_EXACT_COUNT_LIMIT:
+            return estimate, 'estimate'
+        cur.execute(f"SELECT COUNT(*) as count FROM {spec['table']}")
+        return cur.fetchone()['count'], 'exact'
+    
+    # Stop counting filtered rows once past the limit
+    cur.execute(f"""
+        SELECT COUNT(*) as count FROM (
+            SELECT 1 FROM {spec['from']} WHERE {where} LIMIT %s
+        ) matched
+    """, (*params, ADMIN_EXACT_COUNT_LIMIT + 1))
+    count = cur.fetchone()['count']
+    if count > ADMIN_EXACT_COUNT_LIMIT:
+        return ADMIN_EXACT_COUNT_LIMIT, 'at_least'
+    return count, 'exact'
+
+def fetch_admin_section(cur, section, filters, stream=False):
+    """One page of an admin section plus its total and the arguments to link back to it
+
+    With stream=True the rows are a RowStream, read while the page renders.
+    """
+    spec = ADMIN_SECTIONS[section]
+    alias = spec['alias']
+    conditions, params = [], []
+    if filters['username']:
+        pattern = filters['username'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions.append("u.username ILIKE %s")
+        params.append(f"%{pattern}%")
+    if filters['since']:
+        conditions.append(f"{alias}.created_at >= %s")
+        params.append(filters['since'])
+    if filters['until']:
+        conditions.append(f"{alias}.created_at < %s")
+        params.append(filters['until'] + timedelta(days=1))
+    where = " AND ".join(conditions)
+    
+    direction = filters['dir'].upper()
+    query = f"""
+        SELECT {spec['columns']}
+        FROM {spec['from']}
+        {'WHERE ' + where if where else ''}
+        ORDER BY {spec['sorts'][filters['sort']]} {direction}, {alias}.id {direction}
+        LIMIT %s OFFSET %s
+    """
+    query_params = (*params, ADMIN_PAGE_SIZE + 1, (filters['page'] - 1) * ADMIN_PAGE_SIZE)
+    if stream:
+        # Sorted by arbitrary columns with OFFSET: keep the parallel plans
+        rows = RowStream(cur.connection, query, query_params, ADMIN_PAGE_SIZE)
+        has_more = None     # known once the rows are read; see RowStream.has_more
+    else:
+        cur.execute(query, query_params)
+        rows = cur.fetchall()
+        has_more = len(rows) > ADMIN_PAGE_SIZE
+        rows = rows[:ADMIN_PAGE_SIZE]
+    total, total_kind = count_admin_rows(cur, section, where, params)
+    
+    args = {key: value for key, value in (
+        ('username', filters['username']),
+        ('since', filters['since'] and filters['since'].strftime('%Y-%m-%d')),
+        ('until', filters['until'] and filters['until'].strftime('%Y-%m-%d')),
+        ('sort', filters['sort']),
+        ('dir', filters['dir']),
+    ) if value}
+    return {
+        'name': section,
+        'rows': rows,
+        'has_more': has_more,
+        'page': filters['page'],
+        'total': total,
+        'total_kind': total_kind,
+        'filters': filters,
+        'args': args,
+    }
+
+def delete_users(cur, user_ids):
+    """Delete users and their content in one statement; returns the deleted ids
+    
+    Likes and comments are removed explicitly so the counters and scores on
+    other users' posts can be adjusted before the cascade would hide them.
+    """
+    cur.execute("""
+        WITH gone_likes AS (
+            DELETE FROM likes WHERE user_id = ANY(%(ids)s) RETURNING post_id, created_at
+        ), gone_comments AS (
+            DELETE FROM comments WHERE user_id = ANY(%(ids)s) RETURNING post_id, created_at
+        ), gone AS (
+            SELECT post_id, created_at, 1 as liked, 0 as commented FROM gone_likes
+            UNION ALL
+            SELECT post_id, created_at, 0, 1 FROM gone_comments
+        ), deltas AS (
+            SELECT post_id, SUM(liked) as likes, SUM(commented) as comments
+            FROM gone
+            GROUP BY post_id
+        ), adjusted AS (
+            UPDATE posts p
+            SET like_count = p.like_count - d.likes,
+                comment_count = p.comment_count - d.comments,
+                updated_at = CURRENT_TIMESTAMP
+            FROM deltas d
+            WHERE p.id = d.post_id AND p.user_id <> ALL(%(ids)s)
+            RETURNING p.user_id, d.likes, d.comments
+        ), credited AS (
+            UPDATE user_stats s
+            SET likes_received = s.likes_received - a.likes,
+                comments_received = s.comments_received - a.comments
+            FROM (
+                SELECT user_id, SUM(likes) as likes, SUM(comments) as comments
+                FROM adjusted GROUP BY user_id
+            ) a
+            WHERE s.user_id = a.user_id
+        ), gone_users AS (
+            DELETE FROM users WHERE id = ANY(%(ids)s)
+            RETURNING id
+        )
+        SELECT (SELECT COALESCE(array_agg(id), '{}') FROM gone_users),
+               COALESCE(array_agg(g.post_id), '{}'),
+               COALESCE(array_agg(g.liked * %(like)s + g.commented * %(comment)s), '{}'),
+               COALESCE(array_agg(g.created_at), '{}')
+        FROM gone g
+        JOIN posts p ON p.id = g.post_id
+        WHERE p.user_id <> ALL(%(ids)s)
+    """, {'ids': list(user_ids), 'like': SCORE_WEIGHTS['like'], 'comment': SCORE_WEIGHTS['comment']})
+    deleted, post_ids, weights, created_at = cur.fetchone()
+    # Scores of the users' own posts went with them; take back the rest
+    bump_scores(cur, [(post_id, -weight, changed_at)
+                      for post_id, weight, changed_at in zip(post_ids, weights, created_at)])
+    return deleted
+
+def delete_posts(cur, post_ids, user_id=None):
+    """Delete posts in one statement, adjusting their authors' stats
+
+    With `user_id`, only that user's posts are deleted. Returns the
+    deleted ids.
+    """
+    cur.execute("""
+        WITH gone AS (
+            DELETE FROM posts
+            WHERE id = ANY(%(ids)s) AND (%(user_id)s IS NULL OR user_id = %(user_id)s)
+            RETURNING id, user_id, like_count, comment_count
+        ), credited AS (
+            UPDATE user_stats s
+            SET post_count = s.post_count - g.n,
+                likes_received = s.likes_received - g.likes,
+                comments_received = s.comments_received - g.comments
+            FROM (
+                SELECT user_id, COUNT(*) as n, SUM(like_count) as likes, SUM(comment_count) as comments
+                FROM gone GROUP BY user_id
+            ) g
+            WHERE s.user_id = g.user_id
+        )
+        SELECT id FROM gone
+    """, {'ids': list(post_ids), 'user_id': user_id})
+    return [row[0] for row in cur.fetchall()]
+
+def delete_comments(cur, comment_ids):
+    """Delete comments in one statement, adjusting comment counters and scores
+    
+    Returns (post_id, removed) for every post that lost comments.
+    """
+    cur.execute("""
+        WITH gone AS (
+            DELETE FROM comments WHERE id = ANY(%s) RETURNING post_id, created_at
+        ), counted AS (
+            UPDATE posts p
+            SET comment_count = p.comment_count - g.n, updated_at = CURRENT_TIMESTAMP
+            FROM (SELECT post_id, COUNT(*) as n FROM gone GROUP BY post_id) g
+            WHERE p.id = g.post_id
+            RETURNING p.id, p.user_id, g.n
+        ), credited AS (
+            UPDATE user_stats s SET comments_received = s.comments_received - c.n
+            FROM (SELECT user_id, SUM(n) as n FROM counted GROUP BY user_id) c
+            WHERE s.user_id = c.user_id
+        )
+        SELECT c.id, c.n, array_agg(g.created_at)
+        FROM counted c
+        JOIN gone g ON g.post_id = c.id
+        GROUP BY c.id, c.n
+    """, (list(comment_ids),))
+    rows = cur.fetchall()
+    bump_scores(cur, [(post_id, -SCORE_WEIGHTS['comment'], created_at)
+                      for post_id, _, removed_at in rows for created_at in removed_at])
+    return [(post_id, n) for post_id, n, _ in rows]
+
+# Streamed page rendering: the page header goes out before the rows are queried
+STREAMED_VIEWS = {name.strip() for name in os.environ.get('STREAMED_VIEWS', 'index,admin_panel').split(',') if name.strip()}
+# Rows fetched per round trip while a streamed page renders
+STREAM_FETCH_SIZE = int(os.environ.get('STREAM_FETCH_SIZE', 25))
+# Rendered output is sent in chunks of about this many bytes, and at every flush()
+STREAM_BUFFER_SIZE = int(os.environ.get('STREAM_BUFFER_SIZE', 8192))
+# Never part of a page: PostgreSQL text cannot hold NUL
+STREAM_FLUSH = '\x00'
+
+class RowStream:
+    """Rows of a query read as a template loops over them
+
+    The query returns up to `limit` + 1 rows; the extra row only tells that
+    there is more. The query runs on first use. With a `name` it runs in a
+    server-side cursor and rows are fetched STREAM_FETCH_SIZE at a time;
+    PostgreSQL never plans cursors in parallel though, so queries that
+    sort without an index are better off without one. Rows are kept, so a
+    second loop sees the same rows. `has_more` and `next_cursor` are known
+    once a loop has finished; `on_complete(self)` is called then.
+    """
+
+    def __init__(self, conn, query, params, limit, name=None, on_complete=None):
+        self.rows = []
+        self.has_more = False
+        self._conn = conn
+        self._name = name
+        self._query = (query, params)
+        self._limit = limit
+        self._on_complete = on_complete
+        self._cur = None
+        self._done = False
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.rows[-1]) if self.has_more else None
+
+    def _fetch(self):
+        """Read the next batch of rows; False once there are none left"""
+        if self._done:
+            return False
+        if self._cur is None:
+            self._cur = self._conn.cursor(name=self._name, cursor_factory=RealDictCursor)
+            self._cur.execute(*self._query)
+        rows = self._cur.fetchmany(STREAM_FETCH_SIZE)
+        room = self._limit - len(self.rows)
+        if len(rows) > room:
+            self.has_more = True
+            rows = rows[:room]
+        self.rows.extend(rows)
+        if self.has_more or len(rows) < STREAM_FETCH_SIZE:
+            self._done = True
+            self._cur.close()
+            if self._on_complete:
+                self._on_complete(self)
+        return bool(rows)
+
+    def __bool__(self):
+        return bool(self.rows) or self._fetch()
+
+    def __iter__(self):
+        i = 0
+        while i < len(self.rows) or self._fetch():
+            yield self.rows[i]
+            i += 1
+
+@app.template_global()
+def flush():
+    """In a streamed page, send everything rendered so far right away"""
+    return Markup(STREAM_FLUSH) if g.get('streaming') else ''
+
+def render_streamed(template_name, **context):
+    """Response that sends the page while it renders, instead of once it is complete
+
+    RowStream values in the context are read as the template reaches them.
+    Output is sent every STREAM_BUFFER_SIZE bytes and wherever the template
+    calls flush(). Flash messages are taken up front, because the session
+    cookie goes out before the body.
+    """
+    get_flashed_messages()
+    g.streaming = True
+    chunks = stream_template(template_name, **context)
+
+    def generate():
+        buffered, size = [], 0
+        try:
+            for chunk in chunks:
+                if chunk == STREAM_FLUSH or size >= STREAM_BUFFER_SIZE:
+                    if buffered:
+                        yield ''.join(buffered)
+                    buffered, size = [], 0
+                if chunk != STREAM_FLUSH:
+                    buffered.append(chunk)
+                    size += len(chunk)
+        except psycopg2.Error as e:
+            # The status line is already sent; the truncated page tells the client
+            print(f"Streamed render error: {e}")
+        finally:
+            chunks.close()
+        if buffered:
+            yield ''.join(buffered)
+
+    return Response(generate(), mimetype='text/html')
+
+def stream_feed_page(before, limit):
+    """Feed page for a streamed render: the cached one, or rows read as the page renders
+
+    The rows are cached once the template has read them all, like
+    load_feed_page does. Returns (posts, next_cursor, validators) like
+    load_feed_page, except that a miss has no validators: its headers go
+    out before the rows are read. Returns None if no database connection
+    is available.
+    """
+    key = feed_cache_key(before, limit)
+    page = read_cache(key)
+    if page is not None:
+        return page
+    
+    conn = get_db_connection()
+    if not conn:
+        return None
+    query, params = feed_query(before, limit, f"{FEED_COLUMNS}, {VALIDATED_AT_COLUMN}")
+    rows = RowStream(conn, query, params, limit, name='feed_page',
+                     on_complete=lambda rows: cache_feed_page(key, before, rows.rows, rows.next_cursor))
+    return rows, None, None
+
+# Routes
+@app.route('/')
+def index():
+    """Home page showing the latest blog posts, one page at a time"""
+    before = decode_cursor(request.args.get('before'))
+    streamed = 'index' in STREAMED_VIEWS
+    
+    try:
+        if streamed:
+            page = stream_feed_page(before, get_page_size())
+        else:
+            page = load_feed_page(before, get_page_size())
+        if page is None:
+            flash('Database connection error.', 'error')
+            return render_template('index.html', posts=[], next_cursor=None, paged=bool(before))
+        
+        posts, next_cursor, validators = page
+        response = page_not_modified(validators)
+        if response:
+            return response
+        render = render_streamed if streamed else render_template
+        return render('index.html', posts=posts, next_cursor=next_cursor, paged=bool(before))
     except psycopg2.Error as e:
         print(f"Error fetching posts: {e}")
-        cur.close()
-        conn.close()
-        return render_template('index.html', posts=[])
+        return render_template('index.html', posts=[], next_cursor=None, paged=bool(before))
+
+@app.route('/feed.json')
+def feed_json():
+    """JSON variant of the home feed, paginated with the same cursors"""
+    before = decode_cursor(request.args.get('before'))
+    
+    try:
+        page = load_feed_page(before, get_page_size(), API_FEED_COLUMNS)
+        if page is None:
+            return jsonify({'success': False, 'message': 'Database connection error'}), 503
+        
+        posts, next_cursor, _ = page
+        return jsonify({
+            'success': True,
+            'posts': [dict(post, created_at=post['created_at'].isoformat()) for post in posts],
+            'next_cursor': next_cursor
+        })
+    except psycopg2.Error as e:
+        print(f"Error fetching feed: {e}")
+        return jsonify({'success': False, 'message': 'Failed to load feed'}), 500
+
+def render_score_feed(feed):
+    """A trending or top page, paginated with cursors like the home feed"""
+    before = decode_score_cursor(request.args.get('before'))
+    context = {'feed_view': feed, 'feed_title': SCORE_FEEDS[feed]['title'], 'paged': bool(before)}
+    
+    try:
+        page = load_score_feed_page(feed, before, get_page_size())
+        if page is None:
+            flash('Database connection error.', 'error')
+            return render_template('index.html', posts=[], next_cursor=None, **context)
+        
+        posts, next_cursor = page
+        return render_template('index.html', posts=posts, next_cursor=next_cursor, **context)
+    except psycopg2.Error as e:
+        print(f"Error fetching {feed} posts: {e}")
+        return render_template('index.html', posts=[], next_cursor=None, **context)
+
+def score_feed_json(feed):
+    """JSON variant of a trending or top page"""
+    before = decode_score_cursor(request.args.get('before'))
+    
+    try:
+        page = load_score_feed_page(feed, before, get_page_size())
+        if page is None:
+            return jsonify({'success': False, 'message': 'Database connection error'}), 503
+        
+        posts, next_cursor = page
+        # Stored scores are only meaningful relative to their anchor, so they stay internal
+        hidden = ('score', 'score_anchor')
+        return jsonify({
+            'success': True,
+            'posts': [{k: v.isoformat() if k == 'created_at' else v
+                       for k, v in post.items() if k not in hidden} for post in posts],
+            'next_cursor': next_cursor
+        })
+    except psycopg2.Error as e:
+        print(f"Error fetching {feed} feed: {e}")
+        return jsonify({'success': False, 'message': 'Failed to load feed'}), 500
+
+@app.route('/trending')
+def trending():
+    """Posts with the most engagement lately, weighted towards the last few hours"""
+    return render_score_feed('trending')
+
+@app.route('/trending.json')
+def trending_json():
+    return score_feed_json('trending')
+
+@app.route('/top')
+def top():
+    """This week's posts with the most engagement"""
+    return render_score_feed('top')
+
+@app.route('/top.json')
+def top_json():
+    return score_feed_json('top')
+
+@app.route('/search')
+def search():
+    """Full-text search over posts and, optionally, comments"""
+    query = request.args.get('q', '').strip()
+    include_comments = request.args.get('comments') == '1'
+    page = get_page_number()
+    empty = {'posts': [], 'comments': [], 'has_more': False}
+    
+    if not query:
+        return render_template('search.html', query=query, include_comments=include_comments,
+                               page=page, results=empty)
+    
+    try:
+        results = run_search(query, page, include_comments)
+        if results is None:
+            flash('Database connection error.', 'error')
+            results = empty
+    except psycopg2.Error as e:
+        print(f"Search error: {e}")
+        flash('Search failed. Please try again.', 'error')
+        results = empty
+    
+    return render_template('search.html', query=query, include_comments=include_comments,
+                           page=page, results=results)
+
+@app.route('/search.json')
+def search_json():
+    """JSON variant of the search results"""
+    query = request.args.get('q', '').strip()
+    include_comments = request.args.get('comments') == '1'
+    page = get_page_number()
+    
+    if not query:
+        return jsonify({'success': False, 'message': 'Missing search query'}), 400
+    
+    try:
+        results = run_search(query, page, include_comments)
+        if results is None:
+            return jsonify({'success': False, 'message': 'Database connection error'}), 503
+    except psycopg2.Error as e:
+        print(f"Search error: {e}")
+        return jsonify({'success': False, 'message': 'Search failed'}), 500
+    
+    for row in results['posts'] + results['comments']:
+        row['created_at'] = row['created_at'].isoformat()
+        for key in ('title_snippet', 'snippet'):
+            if key in row:
+                row[key] = str(row[key])
+    return jsonify({'success': True, 'query': query, 'page': page, **results})
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -182,25 +2281,54 @@ def login():
         
         try:
             cur = conn.cursor()
-            cur.execute("SELECT id, username, password, role FROM users WHERE email = %s", (email,))
+            cur.execute("SELECT id, username, password, role, auth_version FROM users WHERE email = %s", (email,))
             user = cur.fetchone()
             cur.close()
-            conn.close()
+            # Hand the connection back while the hash is checked
+            release_db_connection(None)
             
-            if user and check_password_hash(user[2], password):
+            if user and password_hasher.verify(user[2], password):
+                if password_hasher.needs_rehash(user[2]):
+                    rehash_password(user[0], password)
                 session['user_id'] = user[0]
                 session['username'] = user[1]
                 session['role'] = user[3]
+                session['auth_version'] = user[4]
+                identity_cache.set(f"identity:{user[0]}", {
+                    'id': user[0], 'username': user[1], 'role': user[3], 'version': user[4]
+                })
                 flash('Login successful!', 'success')
                 return redirect(url_for('index'))
             else:
                 flash('Invalid email or password.', 'error')
+        except HasherBusy:
+            flash('Too many sign-ins right now. Please try again in a moment.', 'error')
         except psycopg2.Error as e:
             print(f"Login error: {e}")
             flash('Login failed. Please try again.', 'error')
     
     return render_template('login.html')
 
+def rehash_password(user_id, password):
+    """Store a fresh hash made with the current method; failures are not fatal"""
+    try:
+        new_hash = password_hasher.hash(password)
+    except HasherBusy as e:
+        print(f"Password rehash error: {e}")
+        return
+    
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET password = %s WHERE id = %s", (new_hash, user_id))
+        conn.commit()
+        cur.close()
+    except psycopg2.Error as e:
+        print(f"Password rehash error: {e}")
+        conn.rollback()
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     """User registration"""
@@ -209,6 +2337,13 @@ def signup():
         email = request.form['email']
         password = request.form['password']
         
+        # Hash before taking a pooled connection, so none is held meanwhile
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HasherBusy:
+            flash('Too many sign-ups right now. Please try again in a moment.', 'error')
+            return render_template('signup.html')
+        
         conn = get_db_connection()
         if not conn:
             flash('Database connection error.', 'error')
@@ -222,19 +2357,18 @@ def signup():
             if cur.fetchone():
                 flash('Email already registered.', 'error')
                 cur.close()
-                conn.close()
                 return render_template('signup.html')
             
             # Create new user
-            hashed_password = generate_password_hash(password)
             cur.execute("""
                 INSERT INTO users (username, email, password)
                 VALUES (%s, %s, %s)
+                RETURNING id
             """, (username, email, hashed_password))
+            cur.execute("INSERT INTO user_stats (user_id) VALUES (%s)", (cur.fetchone()[0],))
             
             conn.commit()
             cur.close()
-            conn.close()
             
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('login'))
@@ -243,7 +2377,6 @@ def signup():
             print(f"Signup error: {e}")
             conn.rollback()
             cur.close()
-            conn.close()
             flash('Registration failed. Please try again.', 'error')
     
     return render_template('signup.html')
@@ -269,48 +2402,30 @@ def dashboard():
         
         # Get user's posts
         cur.execute("""
-            SELECT p.*, 
-                   COUNT(DISTINCT l.id) as like_count,
-                   COUNT(DISTINCT c.id) as comment_count
+            SELECT p.id, p.title, p.excerpt, p.word_count, p.created_at, p.like_count, p.comment_count
             FROM posts p
-            LEFT JOIN likes l ON p.id = l.post_id
-            LEFT JOIN comments c ON p.id = c.post_id
             WHERE p.user_id = %s
-            GROUP BY p.id
             ORDER BY p.created_at DESC
         """, (session['user_id'],))
         posts = cur.fetchall()
         
-        # Get user stats
+        # Get user stats, precomputed in user_stats
         cur.execute("""
-            SELECT 
-                COUNT(p.id) as total_posts,
-                COALESCE(SUM(like_stats.like_count), 0) as total_likes,
-                COALESCE(SUM(comment_stats.comment_count), 0) as total_comments
-            FROM posts p
-            LEFT JOIN (
-                SELECT post_id, COUNT(*) as like_count
-                FROM likes
-                GROUP BY post_id
-            ) like_stats ON p.id = like_stats.post_id
-            LEFT JOIN (
-                SELECT post_id, COUNT(*) as comment_count
-                FROM comments
-                GROUP BY post_id
-            ) comment_stats ON p.id = comment_stats.post_id
-            WHERE p.user_id = %s
+            SELECT post_count as total_posts,
+                   likes_received as total_likes,
+                   comments_received as total_comments
+            FROM user_stats
+            WHERE user_id = %s
         """, (session['user_id'],))
-        stats = cur.fetchone()
+        stats = cur.fetchone() or {'total_posts': 0, 'total_likes': 0, 'total_comments': 0}
         
         cur.close()
-        conn.close()
         
         return render_template('dashboard.html', posts=posts, stats=stats)
         
     except psycopg2.Error as e:
         print(f"Dashboard error: {e}")
         cur.close()
-        conn.close()
         return render_template('dashboard.html', posts=[], stats={})
 
 @app.route('/create_post', methods=['GET', 'POST'])
@@ -328,14 +2443,16 @@ def create_post():
         
         try:
             cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO posts (user_id, title, content)
-                VALUES (%s, %s, %s)
-            """, (session['user_id'], title, content))
+            cur.execute(f"""
+                INSERT INTO posts (user_id, title, content, search_vector, excerpt, word_count)
+                VALUES (%(user_id)s, %(title)s, %(content)s, {POST_SEARCH_VECTOR},
+                        {POST_EXCERPT}, {POST_WORD_COUNT})
+            """, {'user_id': session['user_id'], 'title': title, 'content': content})
+            adjust_user_stats(cur, session['user_id'], posts=1)
             
             conn.commit()
             cur.close()
-            conn.close()
+            cache.invalidate_tags('feed:head')
             
             flash('Post created successfully!', 'success')
             return redirect(url_for('dashboard'))
@@ -344,7 +2461,6 @@ def create_post():
             print(f"Create post error: {e}")
             conn.rollback()
             cur.close()
-            conn.close()
             flash('Failed to create post. Please try again.', 'error')
     
     return render_template('create_post.html')
@@ -363,42 +2479,42 @@ def edit_post(post_id):
         
         # Check if post exists and belongs to user (or user is admin)
         if session.get('role') == 'admin':
-            cur.execute("SELECT * FROM posts WHERE id = %s", (post_id,))
+            cur.execute("SELECT id, user_id, title, content FROM posts WHERE id = %s", (post_id,))
         else:
-            cur.execute("SELECT * FROM posts WHERE id = %s AND user_id = %s", (post_id, session['user_id']))
+            cur.execute("SELECT id, user_id, title, content FROM posts WHERE id = %s AND user_id = %s", (post_id, session['user_id']))
         
         post = cur.fetchone()
         
         if not post:
             flash('Post not found or access denied.', 'error')
             cur.close()
-            conn.close()
             return redirect(url_for('dashboard'))
         
         if request.method == 'POST':
             title = request.form['title']
             content = request.form['content']
             
-            cur.execute("""
-                UPDATE posts SET title = %s, content = %s
-                WHERE id = %s
-            """, (title, content, post_id))
+            cur.execute(f"""
+                UPDATE posts
+                SET title = %(title)s, content = %(content)s, search_vector = {POST_SEARCH_VECTOR},
+                    excerpt = {POST_EXCERPT}, word_count = {POST_WORD_COUNT},
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %(post_id)s
+            """, {'title': title, 'content': content, 'post_id': post_id})
             
             conn.commit()
             cur.close()
-            conn.close()
+            invalidate_post(post_id)
             
             flash('Post updated successfully!', 'success')
             return redirect(url_for('dashboard'))
         
         cur.close()
-        conn.close()
         return render_template('edit_post.html', post=post)
         
     except psycopg2.Error as e:
         print(f"Edit post error: {e}")
         cur.close()
-        conn.close()
         flash('Error loading post. Please try again.', 'error')
         return redirect(url_for('dashboard'))
 
@@ -415,25 +2531,22 @@ def delete_post(post_id):
         cur = conn.cursor()
         
         # Check if post exists and belongs to user (or user is admin)
-        if session.get('role') == 'admin':
-            cur.execute("DELETE FROM posts WHERE id = %s", (post_id,))
-        else:
-            cur.execute("DELETE FROM posts WHERE id = %s AND user_id = %s", (post_id, session['user_id']))
+        owner = None if session.get('role') == 'admin' else session['user_id']
         
-        if cur.rowcount > 0:
+        if delete_posts(cur, [post_id], user_id=owner):
             conn.commit()
+            # A deleted post may also be the look-ahead row of the page before it
+            cache.invalidate_tags('feed', f"post:{post_id}")
             flash('Post deleted successfully!', 'success')
         else:
             flash('Post not found or access denied.', 'error')
         
         cur.close()
-        conn.close()
         
     except psycopg2.Error as e:
         print(f"Delete post error: {e}")
         conn.rollback()
         cur.close()
-        conn.close()
         flash('Failed to delete post. Please try again.', 'error')
     
     return redirect(url_for('dashboard'))
@@ -447,40 +2560,21 @@ def like_post(post_id):
         return jsonify({'success': False, 'message': 'Database connection error'})
     
     try:
-        cur = conn.cursor()
-        
-        # Check if user already liked this post
-        cur.execute("SELECT id FROM likes WHERE user_id = %s AND post_id = %s", (session['user_id'], post_id))
-        existing_like = cur.fetchone()
-        
-        if existing_like:
-            # Unlike the post
-            cur.execute("DELETE FROM likes WHERE user_id = %s AND post_id = %s", (session['user_id'], post_id))
-            action = 'unliked'
-        else:
-            # Like the post
-            cur.execute("INSERT INTO likes (user_id, post_id) VALUES (%s, %s)", (session['user_id'], post_id))
-            action = 'liked'
-        
-        # Get updated like count
-        cur.execute("SELECT COUNT(*) FROM likes WHERE post_id = %s", (post_id,))
-        like_count = cur.fetchone()[0]
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        result = like_or_unlike(conn, session['user_id'], post_id)
+        if result is None:
+            return jsonify({'success': False, 'message': 'Post not found'})
         
+        liked, like_count = result
         return jsonify({
             'success': True,
-            'action': action,
+            'action': 'liked' if liked else 'unliked',
             'like_count': like_count
         })
         
+    except QueueFull:
+        return jsonify({'success': False, 'message': 'Too many likes right now, please try again'})
     except psycopg2.Error as e:
         print(f"Like post error: {e}")
-        conn.rollback()
-        cur.close()
-        conn.close()
         return jsonify({'success': False, 'message': 'Failed to like post'})
 
 @app.route('/like_post_redirect/<int:post_id>')
@@ -493,30 +2587,20 @@ def like_post_redirect(post_id):
         return redirect(url_for('view_post', post_id=post_id))
     
     try:
-        cur = conn.cursor()
-        
-        # Check if user already liked this post
-        cur.execute("SELECT id FROM likes WHERE user_id = %s AND post_id = %s", (session['user_id'], post_id))
-        existing_like = cur.fetchone()
+        result = like_or_unlike(conn, session['user_id'], post_id)
+        if result is None:
+            flash('Post not found.', 'error')
+            return redirect(url_for('index'))
         
-        if existing_like:
-            # Unlike the post
-            cur.execute("DELETE FROM likes WHERE user_id = %s AND post_id = %s", (session['user_id'], post_id))
-            flash('Post unliked!', 'info')
-        else:
-            # Like the post
-            cur.execute("INSERT INTO likes (user_id, post_id) VALUES (%s, %s)", (session['user_id'], post_id))
+        if result[0]:
             flash('Post liked!', 'success')
+        else:
+            flash('Post unliked!', 'info')
         
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+    except QueueFull:
+        flash('Too many likes right now. Please try again.', 'error')
     except psycopg2.Error as e:
         print(f"Like post error: {e}")
-        conn.rollback()
-        cur.close()
-        conn.close()
         flash('Failed to like post. Please try again.', 'error')
     
     return redirect(url_for('view_post', post_id=post_id))
@@ -526,34 +2610,43 @@ def like_post_redirect(post_id):
 def comment_post(post_id):
     """Add a comment to a post"""
     content = request.form.get('content', '').strip()
+    as_json = wants_json()
     
     if not content:
+        if as_json:
+            return jsonify({'success': False, 'message': 'Comment cannot be empty'}), 400
         flash('Comment cannot be empty.', 'error')
         return redirect(url_for('view_post', post_id=post_id))
     
     conn = get_db_connection()
     if not conn:
+        if as_json:
+            return jsonify({'success': False, 'message': 'Database connection error'}), 503
         flash('Database connection error.', 'error')
         return redirect(url_for('view_post', post_id=post_id))
     
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO comments (user_id, post_id, content)
-            VALUES (%s, %s, %s)
-        """, (session['user_id'], post_id, content))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        result = add_comment(conn, session['user_id'], post_id, content)
+        if result is None:
+            if as_json:
+                return jsonify({'success': False, 'message': 'Post not found'}), 404
+            flash('Post not found.', 'error')
+            return redirect(url_for('index'))
         
+        comment, comment_count = result
+        comment['username'] = session['username']
+        if as_json:
+            return jsonify({'success': True, 'comment': comment_json(comment), 'comment_count': comment_count})
         flash('Comment added successfully!', 'success')
         
+    except QueueFull:
+        if as_json:
+            return jsonify({'success': False, 'message': 'Too many comments right now, please try again'}), 503
+        flash('Too many comments right now. Please try again.', 'error')
     except psycopg2.Error as e:
         print(f"Comment post error: {e}")
-        conn.rollback()
-        cur.close()
-        conn.close()
+        if as_json:
+            return jsonify({'success': False, 'message': 'Failed to add comment'}), 500
         flash('Failed to add comment. Please try again.', 'error')
     
     return redirect(url_for('view_post', post_id=post_id))
@@ -561,117 +2654,461 @@ def comment_post(post_id):
 @app.route('/post/<int:post_id>')
 def view_post(post_id):
     """View a single post with all comments"""
-    conn = get_db_connection()
-    if not conn:
-        flash('Database connection error.', 'error')
-        return redirect(url_for('index'))
-    
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get the post with author info and stats
-        cur.execute("""
-            SELECT p.*, u.username, 
-                   COUNT(DISTINCT l.id) as like_count,
-                   COUNT(DISTINCT c.id) as comment_count
-            FROM posts p
-            JOIN users u ON p.user_id = u.id
-            LEFT JOIN likes l ON p.id = l.post_id
-            LEFT JOIN comments c ON p.id = c.post_id
-            WHERE p.id = %s
-            GROUP BY p.id, u.username
-        """, (post_id,))
-        
-        post = cur.fetchone()
+        loaded = load_post(post_id)
+        if loaded is None:
+            flash('Database connection error.', 'error')
+            return redirect(url_for('index'))
         
+        post, comments, next_cursor, validators = loaded
         if not post:
             flash('Post not found.', 'error')
-            cur.close()
-            conn.close()
             return redirect(url_for('index'))
-        
-        # Get all comments for this post
-        cur.execute("""
-            SELECT c.*, u.username
-            FROM comments c
-            JOIN users u ON c.user_id = u.id
-            WHERE c.post_id = %s
-            ORDER BY c.created_at ASC
-        """, (post_id,))
-        
-        comments = cur.fetchall()
+        response = page_not_modified(validators)
+        if response:
+            return response
         
         # Check if current user has liked this post
         user_liked = False
         if session.get('user_id'):
-            cur.execute("""
-                SELECT id FROM likes 
-                WHERE user_id = %s AND post_id = %s
-            """, (session['user_id'], post_id))
-            user_liked = bool(cur.fetchone())
-        
-        cur.close()
-        conn.close()
+            conn = get_db_connection()
+            if conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT id FROM likes 
+                    WHERE user_id = %s AND post_id = %s
+                """, (session['user_id'], post_id))
+                user_liked = bool(cur.fetchone())
+                cur.close()
         
-        return render_template('view_post.html', post=post, comments=comments, user_liked=user_liked)
+        return render_template('view_post.html', post=post, comments=comments,
+                               next_cursor=next_cursor, user_liked=user_liked)
         
     except psycopg2.Error as e:
         print(f"View post error: {e}")
-        cur.close()
-        conn.close()
         flash('Error loading post. Please try again.', 'error')
         return redirect(url_for('index'))
 
+@app.route('/post/<int:post_id>/comments.json')
+def post_comments_json(post_id):
+    """Next page of a post's comments, for "load more" on the post page"""
+    after = decode_cursor(request.args.get('after'))
+    if not after:
+        return jsonify({'success': False, 'message': 'Missing or invalid cursor'}), 400
+    
+    try:
+        page = load_comment_page(post_id, after)
+        if page is None:
+            return jsonify({'success': False, 'message': 'Database connection error'}), 503
+        
+        comments, next_cursor = page
+        return jsonify({
+            'success': True,
+            'comments': [comment_json(comment) for comment in comments],
+            'next_cursor': next_cursor
+        })
+    except psycopg2.Error as e:
+        print(f"Error fetching comments: {e}")
+        return jsonify({'success': False, 'message': 'Failed to load comments'}), 500
+
+# Read-only JSON API
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+# Rows fetched per round trip from the server-side cursor while streaming
+API_STREAM_CHUNK = int(os.environ.get('API_STREAM_CHUNK', 200))
+
+def api_json(value):
+    """Compact JSON with timestamps in ISO format"""
+    return json.dumps(value, separators=(',', ':'),
+                      default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+def set_validators(response, etag, last_modified):
+    """Attach validators; clients may keep the response but must revalidate it"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def not_modified(etag, last_modified):
+    """A 304 response if the client's copy is still current, else None
+    
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110;
+    only the ETag notices posts that were deleted.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+def feed_validators(cur, before, limit):
+    """(etag, last_modified) of a feed page, from just the ids and update times of its rows"""
+    sql, params = feed_query(before, limit, columns="p.id, p.updated_at")
+    cur.execute(f"""
+        SELECT md5(string_agg(id::text || ':' || updated_at::text, ',' ORDER BY id)) as digest,
+               max(updated_at)::timestamptz as last_modified
+        FROM ({sql}) page
+    """, params)
+    row = cur.fetchone()
+    return row['digest'] or 'empty', row['last_modified']
+
+def post_validators(cur, post_id):
+    """(etag, last_modified) of a post and its comments, or None if it does not exist
+    
+    posts.updated_at moves with every edit, like and comment.
+    """
+    cur.execute("SELECT updated_at::timestamptz as last_modified FROM posts WHERE id = %s", (post_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return f"{post_id}-{row['last_modified'].timestamp():.6f}", row['last_modified']
+
+def stream_page(conn, key, query, params, limit):
+    """Stream `{"success": true, key: [...], "next_cursor": ...}` from a server-side cursor
+    
+    The query returns up to limit + 1 rows; the extra row only signals that
+    there is a next page. Rows are fetched API_STREAM_CHUNK at a time and
+    written out as they arrive, so memory stays flat however large the page.
+    """
+    cur = conn.cursor(name=f"api_{key}", cursor_factory=RealDictCursor)
+    cur.execute(query, params)
+    
+    def generate():
+        sent = 0
+        last = None
+        next_cursor = None
+        try:
+            yield f'{{"success":true,"{key}":['
+            while next_cursor is None:
+                rows = cur.fetchmany(API_STREAM_CHUNK)
+                if not rows:
+                    break
+                if sent + len(rows) > limit:
+                    rows = rows[:limit - sent]
+                    # The extra row may be the first of its chunk
+                    next_cursor = encode_cursor(rows[-1] if rows else last)
+                if rows:
+                    yield (',' if sent else '') + ','.join(api_json(dict(row)) for row in rows)
+                    sent += len(rows)
+                    last = rows[-1]
+            yield f'],"next_cursor":{api_json(next_cursor)}}}'
+        except psycopg2.Error as e:
+            # The status line is already sent; the truncated body tells the client
+            print(f"API stream error: {e}")
+        finally:
+            cur.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/api/posts')
+def api_posts():
+    """The feed as JSON, newest first, paginated with the feed's cursors"""
+    before = decode_cursor(request.args.get('before'))
+    limit = get_page_size(API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'message': 'Database connection error'}), 503
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        etag, last_modified = feed_validators(cur, before, limit)
+        cur.close()
+        response = not_modified(etag, last_modified)
+        if response:
+            return response
+    
+        query, params = feed_query(before, limit, API_FEED_COLUMNS)
+        return set_validators(stream_page(conn, 'posts', query, params, limit), etag, last_modified)
+    except psycopg2.Error as e:
+        print(f"API posts error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to load posts'}), 500
+
+@app.route('/api/posts/<int:post_id>')
+def api_post(post_id):
+    """A single post as JSON"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'message': 'Database connection error'}), 503
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        validators = post_validators(cur, post_id)
+        cur.close()
+        if validators is None:
+            return jsonify({'success': False, 'message': 'Post not found'}), 404
+        response = not_modified(*validators)
+        if response:
+            return response
+    
+        loaded = load_post(post_id)
+        if loaded is None:
+            return jsonify({'success': False, 'message': 'Database connection error'}), 503
+        post = loaded[0]
+        if not post:
+            return jsonify({'success': False, 'message': 'Post not found'}), 404
+    
+        response = Response(api_json({'success': True, 'post': post}), mimetype='application/json')
+        return set_validators(response, *validators)
+    except psycopg2.Error as e:
+        print(f"API post error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to load post'}), 500
+
+@app.route('/api/posts/<int:post_id>/comments')
+def api_post_comments(post_id):
+    """A post's comments as JSON, oldest first, paginated with `after` cursors"""
+    after = decode_cursor(request.args.get('after'))
+    limit = get_page_size(API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'message': 'Database connection error'}), 503
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        validators = post_validators(cur, post_id)
+        cur.close()
+        if validators is None:
+            return jsonify({'success': False, 'message': 'Post not found'}), 404
+        response = not_modified(*validators)
+        if response:
+            return response
+    
+        query, params = comment_query(post_id, after, limit)
+        return set_validators(stream_page(conn, 'comments', query, params, limit), *validators)
+    except psycopg2.Error as e:
+        print(f"API comments error: {e}")
+        return jsonify({'success': False, 'message': 'Failed to load comments'}), 500
+
+# HTTP caching for HTML pages and static files
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+_static_fingerprints = {}   # filename -> (mtime_ns, fingerprint)
+_asset_version = None
+
+def static_fingerprint(filename):
+    """Short content hash of a static file, recomputed when the file changes"""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _static_fingerprints.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        fingerprint = hashlib.md5(f.read()).hexdigest()[:12]
+    _static_fingerprints[filename] = (mtime, fingerprint)
+    return fingerprint
+
+def asset_version():
+    """Fingerprint of the templates and static files, so a deploy changes every page ETag"""
+    global _asset_version
+    if _asset_version is None or app.debug:
+        digest = hashlib.md5()
+        for folder in (os.path.join(app.root_path, app.template_folder), app.static_folder):
+            for root, _, files in sorted(os.walk(folder)):
+                for name in sorted(files):
+                    stat = os.stat(os.path.join(root, name))
+                    digest.update(f"{root}/{name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        _asset_version = digest.hexdigest()[:12]
+    return _asset_version
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """Point static URLs at built (minified) variants and add ?v=<content hash>
+    so they can be cached forever"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        values['filename'] = compression.built_variant(app.static_folder, values['filename'])
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+def page_etag(data_etag):
+    """Page ETag from the data validator, the viewer's nav state and the deployed assets"""
+    viewer = (session.get('user_id'), session.get('username'), session.get('role'))
+    return hashlib.md5(f"{data_etag}|{viewer}|{asset_version()}".encode()).hexdigest()
+
+def page_not_modified(validators):
+    """Answer a conditional GET for a cacheable page from its cache entry's validators
+
+    Returns a 304 response, or None to render the page. The validators
+    are stored with the cached rows the page shows, so they always
+    describe the body sent; pages rendered without them get none.
+    """
+    if validators is None or request.method != 'GET' or session.get('_flashes'):
+        # Pending flash messages make the page one-off
+        g.page_validators = None
+        return None
+    etag, last_modified = validators
+    if session.get('user_id'):
+        # Personalized: only the ETag covers the viewer, so no Last-Modified
+        last_modified = None
+    g.page_validators = (page_etag(etag), last_modified)
+    return not_modified(*g.page_validators)
+
+@message_flashed.connect_via(app)
+def skip_page_validators(sender, **extra):
+    """A page that shows a flash message must not be revalidated later"""
+    g.page_validators = None
+
+@app.after_request
+def set_cache_headers(response):
+    """Validators on cacheable pages; long-lived caching for fingerprinted static files"""
+    if request.endpoint == 'static':
+        filename = (request.view_args or {}).get('filename')
+        if filename and request.args.get('v') == static_fingerprint(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+    
+    validators = g.get('page_validators')
+    if validators and response.status_code in (200, 304):
+        set_validators(response, *validators)
+        if session.get('user_id'):
+            response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+    return response
+
 @app.route('/admin')
 @admin_required
 def admin_panel():
-    """Admin panel for managing users and posts"""
+    """Admin panel shell: section totals plus the first page of the active tab"""
+    tab = request.args.get('tab', 'users')
+    if tab not in ADMIN_SECTIONS:
+        tab = 'users'
+    
     conn = get_db_connection()
     if not conn:
         flash('Database connection error.', 'error')
-        return render_template('admin_panel.html', users=[], posts=[], comments=[])
+        return render_template('admin_panel.html', tab=tab, totals={}, section=None)
     
     try:
+        streamed = 'admin_panel' in STREAMED_VIEWS
         cur = conn.cursor(cursor_factory=RealDictCursor)
+        totals = {name: count_admin_rows(cur, name) for name in ADMIN_SECTIONS}
+        section = fetch_admin_section(cur, tab, get_admin_filters(tab), stream=streamed)
+        cur.close()
         
-        # Get all users
-        cur.execute("SELECT * FROM users ORDER BY created_at DESC")
-        users = cur.fetchall()
-        
-        # Get all posts with author info
-        cur.execute("""
-            SELECT p.*, u.username,
-                   COUNT(DISTINCT l.id) as like_count,
-                   COUNT(DISTINCT c.id) as comment_count
-            FROM posts p
-            JOIN users u ON p.user_id = u.id
-            LEFT JOIN likes l ON p.id = l.post_id
-            LEFT JOIN comments c ON p.id = c.post_id
-            GROUP BY p.id, u.username
-            ORDER BY p.created_at DESC
-        """)
-        posts = cur.fetchall()
-        
-        # Get all comments with author and post info
-        cur.execute("""
-            SELECT c.*, u.username, p.title as post_title
-            FROM comments c
-            JOIN users u ON c.user_id = u.id
-            JOIN posts p ON c.post_id = p.id
-            ORDER BY c.created_at DESC
-        """)
-        comments = cur.fetchall()
+        render = render_streamed if streamed else render_template
+        return render('admin_panel.html', tab=tab, totals=totals, section=section)
         
+    except psycopg2.Error as e:
+        print(f"Admin panel error: {e}")
         cur.close()
-        conn.close()
+        return render_template('admin_panel.html', tab=tab, totals={}, section=None)
+
+@app.route('/admin/section/<section>')
+@admin_required
+def admin_section(section):
+    """One admin section as an HTML fragment, fetched when its tab is opened"""
+    if section not in ADMIN_SECTIONS:
+        return 'Unknown section', 404
+    
+    conn = get_db_connection()
+    if not conn:
+        return 'Database connection error', 503
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        data = fetch_admin_section(cur, section, get_admin_filters(section))
+        cur.close()
+        return render_template('admin_section.html', section=data)
+    except psycopg2.Error as e:
+        print(f"Admin section error: {e}")
+        cur.close()
+        return 'Failed to load section', 500
+
+@app.route('/admin/bulk_delete/<section>', methods=['POST'])
+@admin_required
+def admin_bulk_delete(section):
+    """Delete the selected users, posts or comments in one statement (admin only)"""
+    if section not in ADMIN_SECTIONS:
+        flash('Unknown section.', 'error')
+        return redirect(url_for('admin_panel'))
+    
+    ids = set(request.form.getlist('ids', type=int))
+    if section == 'users' and session['user_id'] in ids:
+        ids.discard(session['user_id'])
+        flash('Cannot delete your own account.', 'error')
+    if not ids:
+        flash('Nothing selected.', 'error')
+        return redirect(url_for('admin_panel', tab=section))
+    
+    conn = get_db_connection()
+    if not conn:
+        flash('Database connection error.', 'error')
+        return redirect(url_for('admin_panel', tab=section))
+    
+    try:
+        cur = conn.cursor()
+        if section == 'users':
+            user_ids = delete_users(cur, ids)
+            conn.commit()
+            deleted = len(user_ids)
+            invalidate_identity(*user_ids)
+            # Counters and posts across the whole site may have changed
+            cache.clear()
+        elif section == 'posts':
+            post_ids = delete_posts(cur, ids)
+            conn.commit()
+            deleted = len(post_ids)
+            cache.invalidate_tags('feed', *(f"post:{post_id}" for post_id in post_ids))
+        else:
+            affected = delete_comments(cur, ids)
+            conn.commit()
+            deleted = sum(n for _, n in affected)
+            cache.invalidate_tags(*(f"post:{post_id}" for post_id, _ in affected))
+        cur.close()
+        flash(f'Deleted {deleted} {section}.', 'success')
         
-        return render_template('admin_panel.html', users=users, posts=posts, comments=comments)
+    except psycopg2.Error as e:
+        print(f"Bulk delete error: {e}")
+        conn.rollback()
+        cur.close()
+        flash(f'Failed to delete {section}. Please try again.', 'error')
+    
+    return redirect(url_for('admin_panel', tab=section))
+
+@app.route('/admin/set_role/<int:user_id>', methods=['POST'])
+@admin_required
+def admin_set_role(user_id):
+    """Grant or revoke admin rights (admin only)"""
+    role = request.form.get('role')
+    if role not in ('user', 'admin'):
+        flash('Invalid role.', 'error')
+        return redirect(url_for('admin_panel'))
+    if user_id == session['user_id']:
+        flash('Cannot change your own role.', 'error')
+        return redirect(url_for('admin_panel'))
+    
+    conn = get_db_connection()
+    if not conn:
+        flash('Database connection error.', 'error')
+        return redirect(url_for('admin_panel'))
+    
+    try:
+        cur = conn.cursor()
+        if set_user_role(cur, user_id, role):
+            conn.commit()
+            invalidate_identity(user_id)
+            flash('Role updated successfully!', 'success')
+        else:
+            flash('User not found.', 'error')
+        cur.close()
         
     except psycopg2.Error as e:
-        print(f"Admin panel error: {e}")
+        print(f"Set role error: {e}")
+        conn.rollback()
         cur.close()
-        conn.close()
-        return render_template('admin_panel.html', users=[], posts=[], comments=[])
+        flash('Failed to update role. Please try again.', 'error')
+    
+    return redirect(url_for('admin_panel'))
 
 @app.route('/admin/delete_user/<int:user_id>')
 @admin_required
@@ -688,22 +3125,23 @@ def delete_user(user_id):
     
     try:
         cur = conn.cursor()
-        cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
         
-        if cur.rowcount > 0:
+        if delete_users(cur, [user_id]):
             conn.commit()
+            invalidate_identity(user_id)
+            # Counters and posts across the whole site may have changed
+            cache.clear()
             flash('User deleted successfully!', 'success')
         else:
+            conn.rollback()
             flash('User not found.', 'error')
         
         cur.close()
-        conn.close()
         
     except psycopg2.Error as e:
         print(f"Delete user error: {e}")
         conn.rollback()
         cur.close()
-        conn.close()
         flash('Failed to delete user. Please try again.', 'error')
     
     return redirect(url_for('admin_panel'))
@@ -715,34 +3153,112 @@ def delete_comment(comment_id):
     conn = get_db_connection()
     if not conn:
         flash('Database connection error.', 'error')
-        return redirect(url_for('admin_panel'))
+        return redirect(url_for('admin_panel', tab='comments'))
     
     try:
         cur = conn.cursor()
-        cur.execute("DELETE FROM comments WHERE id = %s", (comment_id,))
+        affected = delete_comments(cur, [comment_id])
         
-        if cur.rowcount > 0:
+        if affected:
             conn.commit()
+            invalidate_post(affected[0][0])
             flash('Comment deleted successfully!', 'success')
         else:
             flash('Comment not found.', 'error')
         
         cur.close()
-        conn.close()
         
     except psycopg2.Error as e:
         print(f"Delete comment error: {e}")
         conn.rollback()
         cur.close()
-        conn.close()
         flash('Failed to delete comment. Please try again.', 'error')
     
-    return redirect(url_for('admin_panel'))
+    return redirect(url_for('admin_panel', tab='comments'))
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once this worker can reach the database"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'status': 'unavailable'}), 503
+    
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        return jsonify({'status': 'ready', 'pid': os.getpid()})
+    except psycopg2.Error as e:
+        print(f"Readiness check error: {e}")
+        return jsonify({'status': 'unavailable'}), 503
+
+@app.route('/admin/pool_stats')
+@admin_required
+def pool_stats():
+    """Connection pool usage counters (admin only)"""
+    return jsonify(db_pool.stats())
+
+@app.route('/admin/hasher_stats')
+@admin_required
+def hasher_stats():
+    """Password hashing pool queue depth and timings (admin only)"""
+    return jsonify(password_hasher.stats())
+
+@app.route('/admin/write_queue_stats')
+@admin_required
+def write_queue_stats():
+    """Write-behind queue depth, batch counts and flush timings (admin only)"""
+    if write_queue is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(write_queue.stats(), enabled=True, durability=WRITE_BEHIND_DURABILITY))
+
+@app.route('/admin/replica_stats')
+@admin_required
+def replica_stats():
+    """Health, replication lag and pool usage per read replica (admin only)"""
+    if replica_set is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, 'replicas': replica_set.stats()})
+
+@app.route('/admin/cache_stats')
+@admin_required
+def cache_stats():
+    """Cache hit/miss/eviction counters (admin only)"""
+    return jsonify(cache.stats())
+
+# Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>"; without
+# a token configured /metrics is only served to logged-in admins
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+def metrics_authorized():
+    """Whether the request may read /metrics, which exposes admin-only stats"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if METRICS_TOKEN and scheme.lower() == 'bearer' and hmac.compare_digest(token, METRICS_TOKEN):
+        return True
+    user = current_user()
+    return user is not None and user['role'] == 'admin'
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Per-endpoint latency histograms and pool/cache gauges for Prometheus"""
+    if not metrics_authorized():
+        return 'Forbidden\n', 403, {'Content-Type': 'text/plain'}
+    return instrumentation.metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
 if __name__ == '__main__':
     # Initialize database on startup
     if init_database():
         print("Database initialized successfully!")
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        start_cache_listener()
+        start_user_stats_refresher()
+        start_score_refresher()
+        if write_queue is not None:
+            # Exit normally on SIGTERM so atexit drains the write queue
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        if SERVER_MODE == 'async':
+            import uvicorn
+            uvicorn.run('asgi:app', host='0.0.0.0', port=5000)
+        else:
+            app.run(debug=True, host='0.0.0.0', port=5000)
     else:
         print("Failed to initialize database. Please check your PostgreSQL connection.")
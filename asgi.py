@@ -0,0 +1,286 @@
+"""ASGI entry point: async fast paths for the read-heavy pages.
+
+GET /, /feed.json and /post/<id> are served natively with an asyncpg pool
+(view_post's three queries run concurrently); every other request falls
+through to the regular Flask app, run in a thread pool by asgiref. Pages
+are rendered with the Flask app's own templates, session and hooks, so the
+output is identical to the sync server.
+
+Run with:  SERVER_MODE=async python app.py
+      or:  uvicorn asgi:app --host 0.0.0.0 --port 5000
+Requires the packages in requirements-async.txt.
+"""
+import asyncio
+import io
+import re
+import sys
+
+import asyncpg
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template, request, session, jsonify, flash, redirect, url_for
+
+import app as blog
+
+POST_ROUTE = re.compile(r'^/post/(\d+)$')
+
+
+def build_environ(scope):
+    """Minimal WSGI environ for rendering a bodiless GET through Flask"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope.get('server', ('localhost', 80))[0],
+        'SERVER_PORT': str(scope.get('server', ('localhost', 80))[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+class AsyncBlogApp:
+    """ASGI application serving the hot read paths with asyncpg"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.pool = None
+
+    async def startup(self):
+        # Hear the invalidations of the other processes caching in memory
+        blog.start_cache_listener()
+        config = blog.DB_CONFIG
+        self.pool = await asyncpg.create_pool(
+            host=config['host'],
+            port=int(config['port']),
+            database=config['database'],
+            user=config['user'],
+            password=config['password'],
+            min_size=blog.DB_POOL_CONFIG['minconn'],
+            max_size=blog.DB_POOL_CONFIG['maxconn'],
+        )
+
+    async def shutdown(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        handler, args = None, ()
+        if scope['type'] == 'http' and scope['method'] == 'GET' and self.pool is not None:
+            path = scope['path']
+            if path == '/':
+                handler = self.index
+            elif path == '/feed.json':
+                handler = self.feed_json
+            else:
+                match = POST_ROUTE.match(path)
+                if match:
+                    handler = self.view_post
+                    args = (int(match.group(1)),)
+
+        if handler is None:
+            await self.wsgi(scope, receive, send)
+            return
+
+        try:
+            response = await self.render(scope, handler, *args)
+        except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+            # Let the sync view produce its usual error page
+            print(f"Async handler error, falling back to sync: {e}")
+            await self.wsgi(scope, receive, send)
+            return
+        await self.send_response(send, response)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except (asyncpg.PostgresError, OSError) as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def render(self, scope, handler, *args):
+        """Run a handler inside a Flask request context and finalize its response
+
+        The viewer's identity is resolved ahead of the Flask hooks, which
+        would otherwise query it synchronously.
+        """
+        ctx = self.flask_app.request_context(build_environ(scope))
+        ctx.push()
+        try:
+            if 'user_id' in session:
+                blog.use_identity(await self.load_identity(session['user_id']))
+            response = self.flask_app.preprocess_request()
+            if response is None:
+                response = await handler(*args)
+            response = self.flask_app.make_response(response)
+            return self.flask_app.process_response(response)
+        finally:
+            ctx.pop()
+
+    async def send_response(self, send, response):
+        headers = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def fetch_feed_page(self, before, limit, columns=blog.FEED_COLUMNS):
+        """Async counterpart of app.load_feed_page, sharing its cache entries"""
+        key = blog.feed_cache_key(before, limit, columns)
+        page = blog.read_cache(key)
+        if page is not None:
+            return page
+
+        where, params = self.feed_where(before)
+        params.append(limit + 1)
+        rows = await self.pool.fetch(f"""
+            SELECT {columns}, {blog.VALIDATED_AT_COLUMN}
+            FROM posts p
+            JOIN users u ON p.user_id = u.id
+            {where}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT ${len(params)}
+        """, *params)
+        posts = [dict(row) for row in rows]
+
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            next_cursor = blog.encode_cursor(posts[-1])
+
+        return blog.cache_feed_page(key, before, posts, next_cursor)
+
+    def feed_where(self, before):
+        """WHERE clause and parameters positioning a feed page after `before`"""
+        if before:
+            return "WHERE (p.created_at, p.id) < ($1, $2)", list(before)
+        return "", []
+
+    async def load_identity(self, user_id):
+        """Async counterpart of app.load_identity, sharing its cache entries"""
+        key = f"identity:{user_id}"
+        identity = blog.identity_cache.get(key)
+        if identity is not None:
+            return identity
+
+        row = await self.pool.fetchrow("""
+            SELECT id, username, role, auth_version as version
+            FROM users WHERE id = $1
+        """, user_id)
+        if row is None:
+            return None
+        identity = dict(row)
+        blog.identity_cache.set(key, identity)
+        return identity
+
+    async def index(self):
+        before = blog.decode_cursor(request.args.get('before'))
+        posts, next_cursor, validators = await self.fetch_feed_page(before, blog.get_page_size())
+        response = blog.page_not_modified(validators)
+        if response:
+            return response
+        return render_template('index.html', posts=posts, next_cursor=next_cursor, paged=bool(before))
+
+    async def feed_json(self):
+        before = blog.decode_cursor(request.args.get('before'))
+        posts, next_cursor, _ = await self.fetch_feed_page(before, blog.get_page_size(), blog.API_FEED_COLUMNS)
+        return jsonify({
+            'success': True,
+            'posts': [dict(post, created_at=post['created_at'].isoformat()) for post in posts],
+            'next_cursor': next_cursor
+        })
+
+    async def fetch_post(self, post_id):
+        row = await self.pool.fetchrow(f"""
+            SELECT p.id, p.user_id, p.title, p.content, p.created_at,
+                   p.like_count, p.comment_count, u.username, {blog.VALIDATED_AT_COLUMN}
+            FROM posts p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.id = $1
+        """, post_id)
+        return dict(row) if row else None
+
+    async def fetch_comments(self, post_id):
+        """First page of a post's comments, as in app.fetch_comment_page"""
+        limit = blog.COMMENT_PAGE_SIZE
+        rows = await self.pool.fetch("""
+            SELECT c.id, c.user_id, c.post_id, c.content, c.created_at, u.username
+            FROM comments c
+            JOIN users u ON c.user_id = u.id
+            WHERE c.post_id = $1
+            ORDER BY c.created_at ASC, c.id ASC
+            LIMIT $2
+        """, post_id, limit + 1)
+        comments = [dict(row) for row in rows]
+
+        next_cursor = None
+        if len(comments) > limit:
+            comments = comments[:limit]
+            next_cursor = blog.encode_cursor(comments[-1])
+        return comments, next_cursor
+
+    async def fetch_user_liked(self, user_id, post_id):
+        if not user_id:
+            return False
+        return await self.pool.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM likes WHERE user_id = $1 AND post_id = $2)",
+            user_id, post_id,
+        )
+
+    async def view_post(self, post_id):
+        user_id = session.get('user_id')
+        key = f"post:{post_id}"
+        cached = blog.read_cache(key)
+
+        if cached is not None:
+            post, comments, next_cursor, validators = cached
+            response = blog.page_not_modified(validators)
+            if response:
+                return response
+            user_liked = await self.fetch_user_liked(user_id, post_id)
+        else:
+            # The three lookups are independent, so they run on separate
+            # pooled connections at the same time
+            post, (comments, next_cursor), user_liked = await asyncio.gather(
+                self.fetch_post(post_id),
+                self.fetch_comments(post_id),
+                self.fetch_user_liked(user_id, post_id),
+            )
+            if post:
+                post, comments, next_cursor, validators = blog.cache_post(post, comments, next_cursor)
+                response = blog.page_not_modified(validators)
+                if response:
+                    return response
+
+        if not post:
+            flash('Post not found.', 'error')
+            return redirect(url_for('index'))
+        return render_template('view_post.html', post=post, comments=comments,
+                               next_cursor=next_cursor, user_liked=user_liked)
+
+app = AsyncBlogApp(blog.app)
@@ -0,0 +1,140 @@
+"""Compare requests/sec and latency of the sync and async serving modes.
+
+Starts the Flask threaded server and the uvicorn/asyncpg server in turn,
+drives GET / and GET /post/<id> from a pool of keep-alive HTTP clients for a
+fixed duration, and prints throughput plus p50/p99 latency per mode as JSON.
+The response cache is disabled so every request reaches the database.
+
+Usage: python bench/async_vs_sync.py [--concurrency 32] [--duration 10]
+Needs an initialized database with at least one post and the packages in
+requirements-async.txt.
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.loadgen import percentile  # noqa: E402
+
+SERVERS = {
+    'sync': [sys.executable, '-c',
+             "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    'async': [sys.executable, '-m', 'uvicorn', 'asgi:app',
+              '--host', '127.0.0.1', '--port', '{port}', '--log-level', 'warning'],
+}
+
+
+def wait_until_up(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/feed.json')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def drive(port, paths, concurrency, duration):
+    """Hit `paths` round-robin from `concurrency` threads; returns (latencies, errors)"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        local, failed, i = [], 0, offset
+        while time.monotonic() < stop_at:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    failed += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0]
+
+
+def run_mode(mode, port, paths, args):
+    env = dict(os.environ, CACHE_BACKEND='none', DB_POOL_MAX=str(args.pool_size))
+    command = [part.format(port=port) for part in SERVERS[mode]]
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        drive(port, paths, args.concurrency, 1)    # warm up pools
+        latencies, errors = drive(port, paths, args.concurrency, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / args.duration, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--pool-size', type=int, default=20)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--modes', default='sync,async')
+    args = parser.parse_args()
+
+    import app as blog
+    conn = blog.db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM posts ORDER BY like_count + comment_count DESC LIMIT 5")
+        post_ids = [row[0] for row in cur.fetchall()]
+    finally:
+        blog.db_pool.putconn(conn)
+    if not post_ids:
+        sys.exit("No posts to benchmark; seed the database first.")
+
+    paths = ['/'] + [f'/post/{post_id}' for post_id in post_ids]
+    results = {
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'paths': paths,
+    }
+    for mode in args.modes.split(','):
+        results[mode] = run_mode(mode, args.port, paths, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Measure bytes on the wire per route, before and after compression.
+
+Every route is fetched in-process through Flask's test client four ways:
+  untrimmed  Jinja whitespace trimming off, no compression (the old output)
+  identity   trimmed output, Accept-Encoding: identity
+  gzip       trimmed output, gzip-encoded
+  br         trimmed output, brotli-encoded (if the brotli package is installed)
+
+The stylesheet is measured as the source style.css ("untrimmed"/identity)
+and as whatever the page links to (the minified build after
+'flask build-static'), precompressed. Prints JSON.
+
+Expects data from bench/seed.py (its users log in with password 'bench').
+
+Usage: python bench/compression.py
+"""
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as blog  # noqa: E402
+import compression  # noqa: E402
+from bench.seed import BENCH_EMAIL_DOMAIN, BENCH_PASSWORD  # noqa: E402
+
+ENCODINGS = ('identity', 'gzip', 'br') if compression.brotli else ('identity', 'gzip')
+
+
+def fixture():
+    conn = blog.db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM posts ORDER BY comment_count DESC, id LIMIT 1")
+        row = cur.fetchone()
+    finally:
+        blog.db_pool.putconn(conn)
+    if not row:
+        sys.exit("No bench data found; run bench/seed.py first.")
+    return row[0]
+
+
+def set_trimming(enabled):
+    blog.app.jinja_env.trim_blocks = enabled
+    blog.app.jinja_env.lstrip_blocks = enabled
+    blog.app.jinja_env.cache.clear()
+
+
+def size(client, path, encoding):
+    response = client.get(path, headers={'Accept-Encoding': encoding})
+    if response.status_code != 200:
+        raise RuntimeError(f"{path}: HTTP {response.status_code}")
+    # Read the whole (possibly streamed) body as sent
+    return len(b''.join(response.response))
+
+
+def main():
+    post_id = fixture()
+    client = blog.app.test_client()
+    response = client.post('/login', data={'email': f'bench0{BENCH_EMAIL_DOMAIN}', 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        sys.exit("Login failed for bench0; run bench/seed.py first.")
+    client.get('/')     # consume the login flash so pages render normally
+
+    routes = [
+        '/',
+        f'/post/{post_id}',
+        '/search?q=postgres',
+        '/dashboard',
+        '/admin',
+        '/admin/section/posts',
+        '/feed.json',
+        '/api/posts?limit=100',
+        f'/api/posts/{post_id}/comments?limit=100',
+    ]
+    results = {}
+    for path in routes:
+        set_trimming(False)
+        row = {'untrimmed': size(client, path, 'identity')}
+        set_trimming(True)
+        for encoding in ENCODINGS:
+            row[encoding] = size(client, path, encoding)
+        results[path] = row
+
+    # The page links to the fingerprinted (and, once built, minified) stylesheet
+    page = client.get('/', headers={'Accept-Encoding': 'identity'}).get_data(as_text=True)
+    linked = page.split('href="/static/css/', 1)[1].split('"', 1)[0]
+    row = {'untrimmed': size(client, '/static/css/style.css', 'identity')}
+    for encoding in ENCODINGS:
+        row[encoding] = size(client, f'/static/css/{linked}', encoding)
+    results[f'/static/css/{linked}'] = row
+
+    totals = {key: sum(row[key] for row in results.values()) for key in ('untrimmed',) + ENCODINGS}
+    print(json.dumps({'routes': results, 'total': totals}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Measure what list queries cost with full post bodies versus precomputed excerpts.
+
+Runs the home feed (walking --pages pages by cursor) and the dashboard's
+post list for the user with the most posts, once selecting p.content as
+the lists used to and once selecting p.excerpt and p.word_count. For each
+it reports the size of the rows as sent in PostgreSQL's text format, the
+time spent in execute() (query plus transfer) and in fetchall() (decoding
+rows into RealDictRows), as medians over --repeat runs. Prints JSON.
+
+Seed long-form posts to see the difference, e.g.
+python bench/seed.py --posts 20000 --paragraphs 30
+
+Usage: python bench/excerpts.py [--pages 50] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+import app as blog  # noqa: E402
+
+COLUMNS = {
+    'content': """
+        p.id, p.user_id, p.title, p.content, p.created_at,
+        p.like_count, p.comment_count, u.username
+    """,
+    'excerpt': blog.FEED_COLUMNS,
+}
+
+DASHBOARD_COLUMNS = {
+    'content': "p.id, p.title, p.content, p.created_at, p.like_count, p.comment_count",
+    'excerpt': "p.id, p.title, p.excerpt, p.word_count, p.created_at, p.like_count, p.comment_count",
+}
+
+
+def result_bytes(cur, queries):
+    """Total size of the queries' column values in text format, as they go over the wire"""
+    total = 0
+    for sql, params in queries:
+        cur.execute(f"""
+            SELECT sum((SELECT sum(octet_length(value)) FROM json_each_text(row_to_json(r))))::bigint as size
+            FROM ({sql}) r
+        """, params)
+        total += cur.fetchone()['size'] or 0
+    return total
+
+
+def run(cur, queries):
+    """Execute (sql, params) pairs; returns (execute seconds, fetch seconds, rows)"""
+    execute_time = fetch_time = 0.0
+    rows = 0
+    for sql, params in queries:
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        executed = time.perf_counter()
+        rows += len(cur.fetchall())
+        execute_time += executed - started
+        fetch_time += time.perf_counter() - executed
+    return execute_time, fetch_time, rows
+
+
+def feed_queries(cur, columns, pages, limit):
+    """The feed pages a reader paging back `pages` times would load"""
+    queries, before = [], None
+    for _ in range(pages):
+        sql, params = blog.feed_query(before, limit, columns=columns)
+        queries.append((sql, params))
+        cur.execute(*blog.feed_query(before, limit, columns="p.id, p.created_at"))
+        rows = cur.fetchall()
+        if len(rows) <= limit:
+            break
+        before = (rows[limit - 1]['created_at'], rows[limit - 1]['id'])
+    return queries
+
+
+def measure(cur, queries, repeat):
+    runs = sorted((run(cur, queries) for _ in range(repeat)), key=lambda r: r[0] + r[1])
+    execute_time, fetch_time, rows = runs[len(runs) // 2]
+    return {
+        'rows': rows,
+        'bytes': result_bytes(cur, queries),
+        'execute_ms': round(execute_time * 1000, 2),
+        'decode_ms': round(fetch_time * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=50, help='feed pages to walk')
+    parser.add_argument('--limit', type=int, default=blog.FEED_PAGE_SIZE)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = blog.db_pool.getconn()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT user_id FROM posts GROUP BY user_id ORDER BY count(*) DESC LIMIT 1")
+        author = cur.fetchone()
+        if not author:
+            sys.exit("No posts to benchmark; run bench/seed.py first.")
+        cur.execute("SELECT avg(length(content))::int as chars FROM posts")
+        results = {'avg_content_chars': cur.fetchone()['chars']}
+        for variant in ('content', 'excerpt'):
+            feed = feed_queries(cur, COLUMNS[variant], args.pages, args.limit)
+            dashboard = [(f"""
+                SELECT {DASHBOARD_COLUMNS[variant]}
+                FROM posts p
+                WHERE p.user_id = %s
+                ORDER BY p.created_at DESC
+            """, (author['user_id'],))]
+            results[variant] = {
+                'feed': measure(cur, feed, args.repeat),
+                'dashboard': measure(cur, dashboard, args.repeat),
+            }
+        cur.close()
+    finally:
+        blog.db_pool.putconn(conn)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
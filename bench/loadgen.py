@@ -0,0 +1,176 @@
+"""Load generation helpers shared by the benchmark scripts.
+
+A driver performs requests either in-process through Flask's test client
+or over HTTP with keep-alive connections and its own cookie jar. run_load()
+runs a scenario function from several threads for a fixed duration and
+collects latencies per endpoint label.
+"""
+import http.client
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Response:
+    def __init__(self, status, body, headers):
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+    def json(self):
+        import json
+        return json.loads(self.body)
+
+
+class LocalDriver:
+    """Drives the app in-process through Flask's test client"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.client.open(path, method=method, data=data, headers=headers)
+        return Response(response.status_code, response.get_data(), dict(response.headers))
+
+
+class HttpDriver:
+    """Drives a running server over one keep-alive HTTP connection"""
+
+    def __init__(self, base_url, timeout=10):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.cookies = SimpleCookie()
+        self.conn = None
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self.conn
+
+    def request(self, method, path, data=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={m.value}" for k, m in self.cookies.items())
+
+        try:
+            conn = self._connection()
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection so the next request reconnects
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            raise
+
+        for value in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(value)
+        return Response(response.status, payload, dict(response.getheaders()))
+
+
+class Recorder:
+    """Thread-safe latency collection keyed by endpoint label"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, label, seconds, ok):
+        with self._lock:
+            if ok:
+                self.latencies.setdefault(label, []).append(seconds)
+            else:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def timed(self, driver, label, method, path, data=None, headers=None, ok_status=(200, 302, 304)):
+        """Perform one request and record its latency under `label`"""
+        started = time.perf_counter()
+        try:
+            response = driver.request(method, path, data=data, headers=headers)
+        except (OSError, http.client.HTTPException):
+            self.record(label, 0, False)
+            return None
+        self.record(label, time.perf_counter() - started, response.status in ok_status)
+        return response
+
+    def summary(self, duration):
+        endpoints = {}
+        labels = set(self.latencies) | set(self.errors)
+        for label in sorted(labels):
+            values = sorted(self.latencies.get(label, []))
+            endpoints[label] = {
+                'requests': len(values),
+                'errors': self.errors.get(label, 0),
+                'rps': round(len(values) / duration, 1),
+                'p50_ms': _ms(percentile(values, 50)),
+                'p95_ms': _ms(percentile(values, 95)),
+                'p99_ms': _ms(percentile(values, 99)),
+            }
+        total = sum(e['requests'] for e in endpoints.values())
+        return {
+            'requests': total,
+            'errors': sum(e['errors'] for e in endpoints.values()),
+            'rps': round(total / duration, 1),
+            'endpoints': endpoints,
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def run_load(make_driver, setup, step, concurrency, duration):
+    """Run `step(driver, state, recorder)` from `concurrency` threads for `duration` seconds
+
+    `setup(driver, worker_index)` runs once per thread before the clock
+    starts (e.g. to log in) and returns the per-thread state.
+    """
+    recorder = Recorder()
+    ready = threading.Barrier(concurrency + 1)
+    stop = threading.Event()
+    failures = []
+
+    def worker(index):
+        driver = make_driver()
+        try:
+            state = setup(driver, index)
+        except Exception as e:  # reported after the run
+            failures.append(e)
+            state = None
+        ready.wait()
+        if state is None:
+            return
+        while not stop.is_set():
+            step(driver, state, recorder)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    summary = recorder.summary(elapsed)
+    summary['setup_failures'] = [repr(e) for e in failures]
+    return summary
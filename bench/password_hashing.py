@@ -0,0 +1,101 @@
+"""Micro-benchmark: password hash cost vs. login throughput.
+
+For each hash method, measures the cost of one hash, then runs verify()
+from --concurrency threads for --duration seconds, both inline in the
+threads and through the PasswordHasher process pool. A probe thread
+meanwhile does a small slice of Python work every 10 ms, standing in for a
+feed request sharing the process; its p50/p99 latency shows how much the
+hashing starves other request threads.
+
+No database is needed. Prints JSON.
+
+Usage: python bench/password_hashing.py [--methods pbkdf2:sha256:600000,scrypt:32768:8:1]
+                                        [--concurrency 16] [--duration 5] [--workers 2]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+from bench.loadgen import percentile  # noqa: E402
+from passwords import PasswordHasher  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def probe(stop, latencies):
+    """Time a fixed slice of pure-Python work, as a request thread would see it"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        sum(i * i for i in range(2000))
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+
+
+def run(verify, stored, concurrency, duration):
+    done = [0] * concurrency
+    stop = threading.Event()
+    probe_latencies = []
+
+    def worker(index):
+        while not stop.is_set():
+            verify(stored, PASSWORD)
+            done[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    threads.append(threading.Thread(target=probe, args=(stop, probe_latencies)))
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    probe_latencies.sort()
+    return {
+        'logins_per_s': round(sum(done) / elapsed, 1),
+        'probe_p50_ms': round(percentile(probe_latencies, 50) * 1000, 2),
+        'probe_p99_ms': round(percentile(probe_latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', default='pbkdf2:sha256:260000,pbkdf2:sha256:600000,scrypt:32768:8:1')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=2, help='hashing processes for the pool runs')
+    args = parser.parse_args()
+
+    results = {'cpus': os.cpu_count(), 'concurrency': args.concurrency,
+               'workers': args.workers, 'methods': {}}
+    for method in args.methods.split(','):
+        started = time.perf_counter()
+        stored = generate_password_hash(PASSWORD, method=method)
+        hash_ms = (time.perf_counter() - started) * 1000
+
+        hasher = PasswordHasher(method=method, workers=args.workers, max_queue=args.concurrency)
+        hasher.verify(stored, PASSWORD)     # start the worker processes
+        try:
+            results['methods'][method] = {
+                'hash_ms': round(hash_ms, 1),
+                'inline': run(check_password_hash, stored, args.concurrency, args.duration),
+                'pool': run(hasher.verify, stored, args.concurrency, args.duration),
+            }
+        finally:
+            hasher.shutdown()
+        print(f"{method}: done", file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
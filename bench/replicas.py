@@ -0,0 +1,154 @@
+"""Show read traffic moving to replicas, and writers staying on the primary.
+
+Starts the Flask threaded server without replicas and then with
+DB_REPLICAS=--replicas. In each mode --concurrency anonymous clients read
+the feed and popular posts for --duration seconds. Meanwhile, logged-in
+writers post a comment and immediately read the post back to check its
+comment count includes the new comment. Reports throughput and latency, the transactions each
+database instance ran during the run (from pg_stat_database), and
+how many read-backs missed the writer's own comment. Prints JSON.
+
+A local streaming replica for the primary in app.DB_CONFIG can be made with
+  pg_basebackup -h 127.0.0.1 -p 5432 -U postgres -D /tmp/pgreplica -R -X stream
+  pg_ctl -D /tmp/pgreplica -o '-p 5433' start
+
+Usage: python bench/replicas.py [--replicas 127.0.0.1:5433] [--concurrency 16]
+Expects data from bench/seed.py (bench0 is the admin, password 'bench').
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psycopg2  # noqa: E402
+
+import app as blog  # noqa: E402
+from bench.async_vs_sync import wait_until_up  # noqa: E402
+from bench.loadgen import HttpDriver, run_load  # noqa: E402
+from bench.run import load_fixture, login  # noqa: E402
+
+SERVER = [sys.executable, '-c',
+          "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+LOGIN_ATTEMPTS = 20
+
+
+def instances(replicas):
+    """DSN keyword arguments per database instance, primary first"""
+    result = {'primary': blog.DB_CONFIG}
+    for entry in filter(None, replicas.split(',')):
+        host, _, port = entry.partition(':')
+        result[entry] = dict(blog.DB_CONFIG, host=host, port=port or blog.DB_CONFIG['port'])
+    return result
+
+
+def committed(dsns):
+    """Transactions of the blog database on every instance, committed or rolled back"""
+    counts = {}
+    for name, dsn in dsns.items():
+        conn = psycopg2.connect(**dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()")
+            counts[name] = cur.fetchone()[0]
+        finally:
+            conn.close()
+    return counts
+
+
+def read_your_writes(base_url, user_index, post_ids, stop, results):
+    """Comment, then read the post back straight away; count reads missing the comment"""
+    driver = HttpDriver(base_url)
+    for attempt in range(LOGIN_ATTEMPTS):
+        try:
+            login(driver, user_index)
+            break
+        except RuntimeError:
+            time.sleep(0.2 * (attempt + 1))
+    else:
+        return
+    rng = random.Random(user_index)
+    writes = missed = 0
+    while not stop.is_set():
+        post_id = rng.choice(post_ids)
+        response = driver.request('POST', f'/comment_post/{post_id}',
+                                  data={'content': f'Replica check {rng.random():.6f}'},
+                                  headers={'Accept': 'application/json'})
+        if response.status != 200:
+            continue
+        written = response.json()['comment_count']
+        post = driver.request('GET', f'/api/posts/{post_id}').json()['post']
+        writes += 1
+        missed += post['comment_count'] < written
+    with results['lock']:
+        results['writes'] += writes
+        results['missed'] += missed
+
+
+def run_mode(replicas, port, post_ids, args):
+    env = dict(os.environ, CACHE_BACKEND='none', PERF_LOG_LEVEL='ERROR', DB_REPLICAS=replicas)
+    command = [part.format(port=port) for part in SERVER]
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    dsns = instances(args.replicas)
+
+    def setup(driver, index):
+        return random.Random(index)
+
+    def browse(driver, rng, rec):
+        rec.timed(driver, 'GET /', 'GET', '/')
+        rec.timed(driver, 'GET /post/<id>', 'GET', f'/post/{rng.choice(post_ids)}')
+
+    writes = {'writes': 0, 'missed': 0, 'lock': threading.Lock()}
+    stop = threading.Event()
+    writers = [threading.Thread(target=read_your_writes,
+                                args=(base_url, 1 + i, post_ids[:20], stop, writes))
+               for i in range(args.writers)]
+    try:
+        wait_until_up(port)
+        before = committed(dsns)
+        for writer in writers:
+            writer.start()
+        results = run_load(lambda: HttpDriver(base_url), setup, browse, args.concurrency, args.duration)
+        stop.set()
+        for writer in writers:
+            writer.join()
+        after = committed(dsns)
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait()
+    results['transactions'] = {name: after[name] - before[name] for name in dsns}
+    results['read_your_writes'] = {'writes': writes['writes'], 'missed': writes['missed']}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replicas', default='127.0.0.1:5433', help='DB_REPLICAS to route reads to')
+    parser.add_argument('--concurrency', type=int, default=16, help='anonymous reader threads')
+    parser.add_argument('--writers', type=int, default=4, help='logged-in comment-then-read threads')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5058)
+    args = parser.parse_args()
+
+    _, post_ids = load_fixture()
+    print(json.dumps({
+        'concurrency': args.concurrency,
+        'writers': args.writers,
+        'duration_s': args.duration,
+        'primary_only': run_mode('', args.port, post_ids, args),
+        'replicas': run_mode(args.replicas, args.port, post_ids, args),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
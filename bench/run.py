@@ -0,0 +1,170 @@
+"""Run the benchmark scenarios and report per-endpoint latency as JSON.
+
+Scenarios:
+  browse     anonymous visitor: first feed page, an older page, popular posts
+  like       logged-in user toggling likes on popular posts
+  comment    logged-in user commenting on popular posts
+  dashboard  logged-in user loading their dashboard
+  admin      admin loading the admin panel
+
+Each scenario runs for --duration seconds at --concurrency threads, either
+in-process through Flask's test client (--mode local, the default) or
+against a running server (--mode http --url http://host:port). Results for
+every scenario are printed and, with --output, written to a JSON file so
+runs can be compared across commits.
+
+Expects data from bench/seed.py (its users log in with password 'bench').
+
+Usage: python bench/run.py [--scenarios browse,like] [--concurrency 16]
+                           [--duration 10] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as blog  # noqa: E402
+from bench.loadgen import HttpDriver, LocalDriver, run_load  # noqa: E402
+from bench.seed import BENCH_EMAIL_DOMAIN, BENCH_PASSWORD, ZipfSampler  # noqa: E402
+
+
+def load_fixture():
+    """Bench user ids and posts ordered by popularity, read once up front"""
+    conn = blog.db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users WHERE email LIKE %s ORDER BY id", ('%' + BENCH_EMAIL_DOMAIN,))
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT id FROM posts ORDER BY like_count + comment_count DESC, id LIMIT 1000")
+        post_ids = [row[0] for row in cur.fetchall()]
+    finally:
+        blog.db_pool.putconn(conn)
+    if len(user_ids) < 2 or not post_ids:
+        sys.exit("No bench data found; run bench/seed.py first.")
+    return user_ids, post_ids
+
+
+def login(driver, user_index):
+    response = driver.request('POST', '/login', data={
+        'email': f'bench{user_index}{BENCH_EMAIL_DOMAIN}',
+        'password': BENCH_PASSWORD,
+    })
+    if response.status != 302:
+        raise RuntimeError(f"login failed for bench{user_index}: HTTP {response.status}")
+
+
+def make_scenarios(user_ids, post_ids):
+    def popular_posts(index):
+        # Popularity order is already Zipf-skewed; sample it again so
+        # requests concentrate on the hottest posts
+        rng = random.Random(index)
+        return rng, ZipfSampler(list(reversed(post_ids)), 1.0, rng)
+
+    def anonymous(driver, index):
+        return popular_posts(index)
+
+    def user(driver, index):
+        # bench0 is the admin; regular users are bench1..N
+        login(driver, 1 + index % (len(user_ids) - 1))
+        return popular_posts(index)
+
+    def admin(driver, index):
+        login(driver, 0)
+        return None, None
+
+    def browse(driver, state, rec):
+        rng, posts = state
+        response = rec.timed(driver, 'GET /feed.json', 'GET', '/feed.json')
+        rec.timed(driver, 'GET /', 'GET', '/')
+        if response is not None and response.status == 200:
+            cursor = response.json().get('next_cursor')
+            if cursor:
+                rec.timed(driver, 'GET /?before=<cursor>', 'GET', f'/?before={cursor}')
+        for _ in range(3):
+            rec.timed(driver, 'GET /post/<id>', 'GET', f'/post/{posts.sample()}')
+
+    def like(driver, state, rec):
+        rng, posts = state
+        rec.timed(driver, 'GET /like_post/<id>', 'GET', f'/like_post/{posts.sample()}')
+
+    def comment(driver, state, rec):
+        rng, posts = state
+        rec.timed(driver, 'POST /comment_post/<id>', 'POST', f'/comment_post/{posts.sample()}',
+                  data={'content': f'Benchmark comment {rng.random():.6f}'})
+
+    def dashboard(driver, state, rec):
+        rec.timed(driver, 'GET /dashboard', 'GET', '/dashboard')
+
+    def admin_panel(driver, state, rec):
+        rec.timed(driver, 'GET /admin', 'GET', '/admin')
+
+    return {
+        'browse': (anonymous, browse),
+        'like': (user, like),
+        'comment': (user, comment),
+        'dashboard': (user, dashboard),
+        'admin': (admin, admin_panel),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default='browse,like,comment,dashboard,admin')
+    parser.add_argument('--mode', choices=('local', 'http'), default='local')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    user_ids, post_ids = load_fixture()
+    scenarios = make_scenarios(user_ids, post_ids)
+
+    if args.mode == 'local':
+        def make_driver():
+            return LocalDriver(blog.app)
+    else:
+        def make_driver():
+            return HttpDriver(args.url)
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'mode': args.mode,
+        'url': args.url if args.mode == 'http' else None,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'scenarios': {},
+    }
+    for name in args.scenarios.split(','):
+        if name not in scenarios:
+            sys.exit(f"Unknown scenario: {name} (choose from {', '.join(scenarios)})")
+        setup, step = scenarios[name]
+        print(f"Running {name}...", file=sys.stderr)
+        results['scenarios'][name] = run_load(make_driver, setup, step, args.concurrency, args.duration)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
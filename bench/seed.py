@@ -0,0 +1,192 @@
+"""Seed the database with synthetic users, posts, likes and comments.
+
+Rows are streamed into Postgres with COPY. Likes and comments follow a Zipf
+distribution over posts, so a few posts are very popular and most get
+little engagement, like a real blog. All generated users share the password
+'bench' and have emails bench<N>@bench.local; one of them is an admin.
+Counters, user stats and search vectors are rebuilt afterwards.
+
+Usage: python bench/seed.py [--users 1000] [--posts 10000] [--likes 100000]
+                            [--comments 50000] [--zipf 1.1] [--reset]
+"""
+import argparse
+import bisect
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import app as blog  # noqa: E402
+import migrate  # noqa: E402
+from transfer import copy_rows  # noqa: E402
+
+BENCH_EMAIL_DOMAIN = '@bench.local'
+BENCH_PASSWORD = 'bench'
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog postgres flask python blog post "
+    "index query cache latency throughput pool cursor page feed comment like "
+    "design review deploy server worker thread process memory disk network"
+).split()
+
+
+class ZipfSampler:
+    """Sample items with probability proportional to 1 / rank**s"""
+
+    def __init__(self, items, s, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.rng = rng
+        total = 0.0
+        self.cumulative = []
+        for rank in range(1, len(self.items) + 1):
+            total += 1.0 / rank ** s
+            self.cumulative.append(total)
+        self.total = total
+
+    def sample(self):
+        return self.items[bisect.bisect_left(self.cumulative, self.rng.random() * self.total)]
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def reset(cur):
+    cur.execute("DELETE FROM users WHERE email LIKE %s", ('%' + BENCH_EMAIL_DOMAIN,))
+    removed = cur.rowcount
+    # Bench runs may have liked or commented on non-bench posts
+    blog.reconcile_post_counters(cur)
+    blog.rebuild_user_stats(cur)
+    return removed
+
+
+def run_backfill(conn, version):
+    """Run migration `version` again, so its backfill fills the rows just seeded"""
+    path = next(path for found, _, path in migrate.discover() if found == version)
+    conn.autocommit = True
+    try:
+        migrate.load(path).upgrade(conn)
+    finally:
+        conn.autocommit = False
+
+
+def seed(conn, args):
+    rng = random.Random(args.seed)
+    cur = conn.cursor()
+    now = datetime.now()
+    timings = {}
+
+    started = time.perf_counter()
+    password = generate_password_hash(BENCH_PASSWORD)
+    copy_rows(cur, 'users', ('username', 'email', 'password', 'role', 'created_at'), (
+        (f'bench{i}', f'bench{i}{BENCH_EMAIL_DOMAIN}', password,
+         'admin' if i == 0 else 'user', now - timedelta(days=400))
+        for i in range(args.users)
+    ))
+    cur.execute("SELECT id FROM users WHERE email LIKE %s ORDER BY id", ('%' + BENCH_EMAIL_DOMAIN,))
+    user_ids = [row[0] for row in cur.fetchall()]
+    timings['users'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    span = timedelta(days=365).total_seconds()
+    copy_rows(cur, 'posts', ('user_id', 'title', 'content', 'created_at'), (
+        (rng.choice(user_ids), sentence(rng, rng.randint(3, 9)),
+         '\n\n'.join(sentence(rng, rng.randint(20, 80)) for _ in range(rng.randint(1, args.paragraphs))),
+         now - timedelta(seconds=rng.random() * span))
+        for _ in range(args.posts)
+    ))
+    cur.execute("SELECT id, created_at FROM posts WHERE user_id = ANY(%s)", (user_ids,))
+    posts = cur.fetchall()
+    post_ids = [row[0] for row in posts]
+    post_created = dict(posts)
+    timings['posts'] = time.perf_counter() - started
+
+    popular = ZipfSampler(post_ids, args.zipf, rng)
+
+    started = time.perf_counter()
+    seen = set()
+    likes = []
+    attempts = 0
+    while len(likes) < args.likes and attempts < args.likes * 5:
+        attempts += 1
+        pair = (rng.choice(user_ids), popular.sample())
+        if pair not in seen:
+            seen.add(pair)
+            likes.append(pair)
+    copy_rows(cur, 'likes', ('user_id', 'post_id', 'created_at'), (
+        (user_id, post_id, post_created[post_id] + (now - post_created[post_id]) * rng.random())
+        for user_id, post_id in likes
+    ))
+    timings['likes'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    copy_rows(cur, 'comments', ('user_id', 'post_id', 'content', 'created_at'), (
+        (rng.choice(user_ids), post_id, sentence(rng, rng.randint(4, 30)),
+         post_created[post_id] + (now - post_created[post_id]) * rng.random())
+        for post_id in (popular.sample() for _ in range(args.comments))
+    ))
+    timings['comments'] = time.perf_counter() - started
+    conn.commit()
+
+    started = time.perf_counter()
+    blog.reconcile_post_counters(cur)
+    blog.rebuild_user_stats(cur)
+    blog.rebuild_post_scores(cur)
+    conn.commit()
+    run_backfill(conn, 4)  # search vectors
+    run_backfill(conn, 9)  # excerpts and word counts
+    cur.execute("ANALYZE")
+    conn.commit()
+    timings['derived'] = time.perf_counter() - started
+
+    cur.close()
+    return {
+        'users': len(user_ids),
+        'posts': len(post_ids),
+        'likes': len(likes),
+        'comments': args.comments,
+        'seconds': {k: round(v, 2) for k, v in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--likes', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--paragraphs', type=int, default=4, help='max paragraphs per post')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for post popularity')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='delete previously seeded data first')
+    args = parser.parse_args()
+
+    if not blog.init_database():
+        sys.exit("Failed to initialize database.")
+
+    conn = blog.db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        if args.reset:
+            print(f"Removed {reset(cur)} bench user(s) and their content.")
+        cur.execute("SELECT 1 FROM users WHERE email LIKE %s LIMIT 1", ('%' + BENCH_EMAIL_DOMAIN,))
+        if cur.fetchone():
+            sys.exit("Bench data already present; rerun with --reset.")
+        conn.commit()
+        cur.close()
+
+        result = seed(conn, args)
+    finally:
+        blog.db_pool.putconn(conn)
+
+    print(result)
+
+
+if __name__ == '__main__':
+    main()
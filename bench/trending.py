@@ -0,0 +1,120 @@
+"""Compare the trending feed served from post_scores with scoring on the fly.
+
+For each of --pages trending pages, times the query on the score table
+(walking the cursors) against an on-the-fly query. The on-the-fly query
+sums the same decayed like and comment weights over the likes and
+comments of the last week and sorts by the result. Also times the bump a
+like or comment adds to its write transaction, and one refresher pass.
+Reports medians over --repeat runs as JSON.
+
+Usage: python bench/trending.py [--pages 5] [--repeat 5]
+Expects data from bench/seed.py.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+import app as blog  # noqa: E402
+
+ON_THE_FLY = f"""
+    WITH events AS (
+        SELECT post_id, created_at, %(like)s as weight FROM likes
+        WHERE created_at > LOCALTIMESTAMP - %(horizon)s
+        UNION ALL
+        SELECT post_id, created_at, %(comment)s FROM comments
+        WHERE created_at > LOCALTIMESTAMP - %(horizon)s
+    ), scores AS (
+        SELECT post_id, SUM(weight * exp(extract(epoch FROM created_at - LOCALTIMESTAMP) / %(tau)s)) as score
+        FROM events
+        GROUP BY post_id
+    )
+    SELECT {blog.FEED_COLUMNS}, s.score
+    FROM scores s
+    JOIN posts p ON p.id = s.post_id
+    JOIN users u ON p.user_id = u.id
+    ORDER BY s.score DESC, s.post_id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+
+def median_ms(samples):
+    samples = sorted(samples)
+    return round(samples[len(samples) // 2] * 1000, 2)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return median_ms(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=blog.FEED_PAGE_SIZE)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = blog.db_pool.getconn()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT count(*) as n FROM post_scores WHERE feed = 'trending'")
+        scored = cur.fetchone()['n']
+        if not scored:
+            sys.exit("No trending scores; run bench/seed.py (or flask rebuild-scores) first.")
+
+        def table_pages():
+            after = None
+            for _ in range(args.pages):
+                _, cursor = blog.fetch_score_feed_page(cur, 'trending', after, args.limit)
+                after = blog.decode_score_cursor(cursor)
+                if not after:
+                    break
+
+        def on_the_fly_pages():
+            for page in range(args.pages):
+                cur.execute(ON_THE_FLY, {
+                    'like': blog.SCORE_WEIGHTS['like'], 'comment': blog.SCORE_WEIGHTS['comment'],
+                    'horizon': blog.SCORE_REBUILD_HORIZON, 'tau': blog.SCORE_FEEDS['trending']['tau'],
+                    'limit': args.limit, 'offset': page * args.limit,
+                })
+                cur.fetchall()
+
+        cur.execute("SELECT post_id FROM post_scores WHERE feed = 'trending' ORDER BY score DESC LIMIT 1")
+        hot_post = cur.fetchone()['post_id']
+
+        def bump():
+            blog.bump_scores(cur, [(hot_post, blog.SCORE_WEIGHTS['like'], None)])
+            conn.rollback()
+
+        def refresh():
+            blog.redecay_post_scores(cur)
+            conn.rollback()
+
+        results = {
+            'scored_posts': scored,
+            'pages': args.pages,
+            'score_table_ms': timed(table_pages, args.repeat),
+            'on_the_fly_ms': timed(on_the_fly_pages, args.repeat),
+            'bump_ms': timed(bump, args.repeat * 10),
+            'refresh_ms': timed(refresh, args.repeat),
+        }
+        conn.rollback()
+        cur.close()
+    finally:
+        blog.db_pool.putconn(conn)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Compare time to first byte of buffered and streamed page rendering.
+
+Starts the Flask threaded server twice, once with STREAMED_VIEWS empty and
+once with the streamed views enabled, logs in as the bench admin and
+fetches each page sequentially. For every request it records the time to
+the response headers, to the first body byte and to the last one, and
+prints the medians per mode as JSON. The response cache is disabled so
+every page is rendered from the database.
+
+Usage: python bench/ttfb.py [--requests 30] [--limit 100]
+Expects data from bench/seed.py (bench0 is the admin, password 'bench').
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.async_vs_sync import wait_until_up  # noqa: E402
+from bench.loadgen import percentile  # noqa: E402
+from bench.seed import BENCH_EMAIL_DOMAIN, BENCH_PASSWORD  # noqa: E402
+
+SERVER = [sys.executable, '-c',
+          "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+
+def login(port):
+    """Session cookie of the bench admin"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = urlencode({'email': f'bench0{BENCH_EMAIL_DOMAIN}', 'password': BENCH_PASSWORD})
+    conn.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie', '').split(';', 1)[0]
+    if response.status != 302 or not cookie:
+        sys.exit("Login failed for bench0; run bench/seed.py first.")
+    # Visit a page once so the login flash is not part of the measurements
+    conn.request('GET', '/feed.json', headers={'Cookie': cookie})
+    conn.getresponse().read()
+    return cookie
+
+
+def measure(port, path, cookie):
+    """(headers, first byte, last byte) times of one request, in seconds"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    started = time.perf_counter()
+    conn.request('GET', path, headers={'Cookie': cookie, 'Accept-Encoding': 'identity'})
+    response = conn.getresponse()
+    headers = time.perf_counter() - started
+    response.read(1)
+    first = time.perf_counter() - started
+    response.read()
+    last = time.perf_counter() - started
+    conn.close()
+    if response.status != 200:
+        raise RuntimeError(f"{path}: HTTP {response.status}")
+    return headers, first, last
+
+
+def run_mode(streamed, port, paths, args):
+    env = dict(os.environ, CACHE_BACKEND='none', PERF_LOG_LEVEL='ERROR',
+               STREAMED_VIEWS='index,admin_panel' if streamed else '')
+    command = [part.format(port=port) for part in SERVER]
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        cookie = login(port)
+        results = {}
+        for path in paths:
+            measure(port, path, cookie)     # warm up
+            samples = zip(*(measure(port, path, cookie) for _ in range(args.requests)))
+            results[path] = {
+                f'{name}_ms': round(percentile(sorted(values), 50) * 1000, 2)
+                for name, values in zip(('headers', 'ttfb', 'total'), samples)
+            }
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=30, help='requests per page and mode')
+    parser.add_argument('--limit', type=int, default=100, help='feed page size')
+    parser.add_argument('--port', type=int, default=5056)
+    args = parser.parse_args()
+
+    paths = ['/', f'/?limit={args.limit}', '/admin?tab=users', '/admin?tab=posts', '/admin?tab=comments']
+    print(json.dumps({
+        'requests': args.requests,
+        'buffered': run_mode(False, args.port, paths, args),
+        'streamed': run_mode(True, args.port, paths, args),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Compare like and comment bursts written directly and through the write-behind queue.
+
+Starts the Flask threaded server once per mode: direct writes
+(WRITE_BEHIND=0), write-behind waiting for the commit, and write-behind
+answering once queued. In each mode --concurrency logged-in bench users
+toggle likes and post comments on the --posts hottest posts for --duration
+seconds. Reports throughput and latency per endpoint, the transactions the
+database committed, the queue's batch statistics, and whether the stored
+like and comment counters still match the rows afterwards. Prints JSON.
+
+Usage: python bench/write_behind.py [--concurrency 32] [--duration 10] [--posts 3]
+Expects data from bench/seed.py (bench0 is the admin, password 'bench').
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as blog  # noqa: E402
+from bench.async_vs_sync import wait_until_up  # noqa: E402
+from bench.loadgen import HttpDriver, run_load  # noqa: E402
+from bench.run import load_fixture, login  # noqa: E402
+
+SERVER = [sys.executable, '-c',
+          "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+LOGIN_ATTEMPTS = 20
+
+MODES = {
+    'direct': {'WRITE_BEHIND': '0'},
+    'write_behind_commit': {'WRITE_BEHIND': '1', 'WRITE_BEHIND_DURABILITY': 'commit'},
+    'write_behind_queued': {'WRITE_BEHIND': '1', 'WRITE_BEHIND_DURABILITY': 'queued'},
+}
+
+
+def database_counters(cur):
+    cur.execute("SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()")
+    return cur.fetchone()[0]
+
+
+def counters_match(cur, post_ids):
+    """True if like_count and comment_count equal the rows for every post"""
+    cur.execute("""
+        SELECT count(*) FROM posts p
+        WHERE p.id = ANY(%s)
+          AND (p.like_count <> (SELECT count(*) FROM likes WHERE post_id = p.id)
+               OR p.comment_count <> (SELECT count(*) FROM comments WHERE post_id = p.id))
+    """, (post_ids,))
+    return cur.fetchone()[0] == 0
+
+
+def run_mode(mode, port, user_ids, hot_posts, args):
+    env = dict(os.environ, CACHE_BACKEND='none', PERF_LOG_LEVEL='ERROR', **MODES[mode])
+    command = [part.format(port=port) for part in SERVER]
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+
+    def setup(driver, index):
+        # bench0 is the admin; regular users are bench1..N. Logins all
+        # arrive at once, so retry those the password hasher turned away.
+        for attempt in range(LOGIN_ATTEMPTS):
+            try:
+                login(driver, 1 + index % (len(user_ids) - 1))
+                break
+            except RuntimeError:
+                if attempt == LOGIN_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.2 * (attempt + 1))
+        return random.Random(index)
+
+    def burst(driver, rng, rec):
+        post_id = rng.choice(hot_posts)
+        if rng.random() < args.comment_ratio:
+            rec.timed(driver, 'POST /comment_post/<id>', 'POST', f'/comment_post/{post_id}',
+                      data={'content': f'Burst comment {rng.random():.6f}'},
+                      headers={'Accept': 'application/json'})
+        else:
+            rec.timed(driver, 'GET /like_post/<id>', 'GET', f'/like_post/{post_id}')
+
+    conn = blog.db_pool.getconn()
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        wait_until_up(port)
+        commits = database_counters(cur)
+        results = run_load(lambda: HttpDriver(base_url), setup, burst, args.concurrency, args.duration)
+
+        admin = HttpDriver(base_url)
+        login(admin, 0)
+        results['write_queue'] = admin.request('GET', '/admin/write_queue_stats').json()
+    finally:
+        # SIGINT exits through atexit, which drains the queue
+        server.send_signal(signal.SIGINT)
+        server.wait()
+    try:
+        results['transactions'] = database_counters(cur) - commits
+        results['counters_match'] = counters_match(cur, hot_posts)
+        cur.close()
+    finally:
+        conn.autocommit = False
+        blog.db_pool.putconn(conn)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--posts', type=int, default=3, help='hot posts the burst goes to')
+    parser.add_argument('--comment-ratio', type=float, default=0.2)
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    user_ids, post_ids = load_fixture()
+    hot_posts = post_ids[:args.posts]
+    results = {
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'posts': hot_posts,
+    }
+    for mode in args.modes.split(','):
+        results[mode] = run_mode(mode, args.port, user_ids, hot_posts, args)
+    print(json.dumps(results, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
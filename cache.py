@@ -0,0 +1,266 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheBackend:
+    """Interface shared by the cache backends
+
+    Values are stored under string keys with a TTL and an optional set of
+    tags; invalidating a tag drops every entry stored with it.
+    """
+
+    def get(self, key):
+        """Return the cached value, or None on a miss"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None, tags=()):
+        """Store a value, replacing any existing entry for the key"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def invalidate_tags(self, *tags):
+        """Drop every entry stored with any of the given tags"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU cache with per-entry TTL and a bounded entry count"""
+
+    def __init__(self, max_entries=1024, default_ttl=60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value, tags)
+        self._tags = {}                 # tag -> set of keys
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _unlink(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._unlink(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None, tags=()):
+        ttl = self.default_ttl if ttl is None else ttl
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._entries:
+                self._unlink(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._unlink(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._unlink(key)
+
+    def invalidate_tags(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._unlink(key)
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            })
+        return snapshot
+
+
+class RedisCache(CacheBackend):
+    """Cache stored in Redis (or a compatible local stand-in), shared by all workers
+
+    Tags are kept as Redis sets of keys. Requires the optional `redis` package
+    and Redis 7 or later (EXPIRE NX/GT).
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', default_ttl=60, prefix='blog:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None, tags=()):
+        ttl = self.default_ttl if ttl is None else ttl
+        full_key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.set(full_key, pickle.dumps(value), ex=ttl)
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            pipe.sadd(tag_key, full_key)
+            # A tag set must outlive every entry in it, so its TTL is only
+            # ever extended: set when it has none, raised when shorter
+            pipe.expire(tag_key, ttl, nx=True)
+            pipe.expire(tag_key, ttl, gt=True)
+        pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def invalidate_tags(self, *tags):
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = self.client.smembers(tag_key)
+            if keys:
+                self.client.delete(*keys)
+                self._count('invalidations', len(keys))
+            self.client.delete(tag_key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+        self._count('invalidations', len(keys))
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        info = self.client.info('stats')
+        snapshot.update({
+            'backend': 'redis',
+            'evictions': info.get('evicted_keys', 0),
+            'expirations': info.get('expired_keys', 0),
+        })
+        return snapshot
+
+
+class NullCache(CacheBackend):
+    """Backend that never stores anything, for disabling the cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, key, value, ttl=None, tags=()):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def invalidate_tags(self, *tags):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none', 'hits': 0, 'misses': self._misses}
+
+
+class BroadcastCache(CacheBackend):
+    """A per-process backend whose invalidations reach the other processes
+
+    delete, invalidate_tags and clear apply to the local backend and are
+    then passed to `publish(op, args)`; whatever carries them calls
+    apply(op, args) in the other processes, which does not publish again.
+    """
+
+    OPS = ('delete', 'invalidate_tags', 'clear')
+
+    def __init__(self, local, publish):
+        self.local = local
+        self.publish = publish
+
+    def get(self, key):
+        return self.local.get(key)
+
+    def set(self, key, value, ttl=None, tags=()):
+        self.local.set(key, value, ttl=ttl, tags=tags)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.publish('delete', [key])
+
+    def invalidate_tags(self, *tags):
+        self.local.invalidate_tags(*tags)
+        self.publish('invalidate_tags', list(tags))
+
+    def clear(self):
+        self.local.clear()
+        self.publish('clear', [])
+
+    def apply(self, op, args):
+        """Replay an invalidation published by another process"""
+        if op not in self.OPS:
+            raise ValueError(f"Unknown cache operation: {op}")
+        getattr(self.local, op)(*args)
+
+    def stats(self):
+        return self.local.stats()
+
+
+def create_cache(config):
+    """Build the cache backend named by config['backend']"""
+    backend = config.get('backend', 'memory')
+    if backend == 'memory':
+        return LRUCache(max_entries=config.get('max_entries', 1024),
+                        default_ttl=config.get('ttl', 60))
+    if backend == 'redis':
+        return RedisCache(url=config.get('redis_url', 'redis://localhost:6379/0'),
+                          default_ttl=config.get('ttl', 60))
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f"Unknown cache backend: {backend}")
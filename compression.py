@@ -0,0 +1,202 @@
+import gzip
+import mimetypes
+import os
+import re
+import zlib
+
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:     # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/json', 'application/javascript', 'image/svg+xml',
+}
+
+# Suffix of a precompressed static file per content coding, in preference order
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+def negotiate(accept_encodings, available):
+    """The first coding in `available` the client accepts with the highest quality, or None"""
+    best, best_quality = None, 0
+    for encoding in available:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Encoder:
+    """Incremental gzip or brotli encoder"""
+
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        self.brotli = encoding == 'br'
+        if self.brotli:
+            self._obj = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._obj.process(data) if self.brotli else self._obj.compress(data)
+
+    def flush(self):
+        """Everything buffered so far, so the client can decode it now"""
+        return self._obj.flush() if self.brotli else self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.finish() if self.brotli else self._obj.flush()
+
+
+def _compress_stream(chunks, encoder):
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield encoder.compress(chunk) + encoder.flush()
+        yield encoder.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def init_app(app, enabled=True, min_size=500, gzip_level=6, brotli_quality=5):
+    """Negotiated response compression, and precompressed variants for static files
+
+    Dynamic responses of a compressible type are gzip- or brotli-encoded
+    when the client accepts it. Buffered bodies shorter than `min_size`
+    bytes are sent as they are. Streamed bodies are compressed chunk by
+    chunk and flushed after each one, so streaming still reaches the client
+    incrementally. Static files are never compressed per request; the
+    `.br`/`.gz` files written by build_static() are served instead when
+    they are at least as new as the original.
+    """
+    available = ('br', 'gzip') if brotli else ('gzip',)
+
+    def send_static(filename):
+        source = safe_join(app.static_folder, filename)
+        if source and os.path.isfile(source):
+            encodings = [enc for enc, suffix in PRECOMPRESSED if _is_current(source + suffix, source)]
+            encoding = negotiate(request.accept_encodings, encodings)
+            if encoding:
+                suffix = dict(PRECOMPRESSED)[encoding]
+                response = send_from_directory(app.static_folder, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+        response = app.send_static_file(filename)
+        if response.mimetype in COMPRESSIBLE_TYPES:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    if app.has_static_folder:
+        app.view_functions['static'] = send_static
+
+    if not enabled:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        if request.method == 'HEAD' or response.cache_control.no_transform:
+            return response
+        encoding = negotiate(request.accept_encodings, available)
+        if encoding is None:
+            return response
+
+        encoder = _Encoder(encoding, gzip_level, brotli_quality)
+        if response.is_streamed:
+            response.response = _compress_stream(response.iter_encoded(), encoder)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(encoder.compress(data) + encoder.finish())
+        response.headers['Content-Encoding'] = encoding
+
+        # A strong ETag names exact bytes, which now differ per coding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def _is_current(path, source):
+    """True if `path` exists and is no older than `source`"""
+    try:
+        return os.stat(path).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except OSError:
+        return False
+
+
+def built_variant(static_folder, filename):
+    """`name.min.css` for `name.css` if build_static() produced a current one, else `filename`"""
+    root, ext = os.path.splitext(filename)
+    if ext != '.css' or root.endswith('.min'):
+        return filename
+    minified = f"{root}.min{ext}"
+    if _is_current(os.path.join(static_folder, minified), os.path.join(static_folder, filename)):
+        return minified
+    return filename
+
+
+_CSS_STRING = re.compile(r'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')''')
+
+
+def minify_css(text):
+    """Drop comments and redundant whitespace from a stylesheet, leaving strings intact"""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
+    parts = _CSS_STRING.split(text)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[i])
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        part = re.sub(r':\s+', ':', part)
+        parts[i] = part.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def build_static(static_folder):
+    """Minify stylesheets and precompress them next to the originals
+
+    Writes `name.min.css` for every `name.css`, then `.gz` (and `.br` if
+    brotli is installed) copies of every compressible file, minified or
+    not. Returns {path: size in bytes} for what was written.
+    """
+    written = {}
+
+    def write(path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+        written[path] = len(data)
+
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if name.endswith('.css') and not name.endswith('.min.css'):
+                path = os.path.join(root, name)
+                with open(path, encoding='utf-8') as f:
+                    write(path[:-4] + '.min.css', minify_css(f.read()).encode())
+
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            if mimetypes.guess_type(name)[0] not in COMPRESSIBLE_TYPES:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli:
+                write(path + '.br', brotli.compress(data, quality=11))
+    return written
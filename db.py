@@ -0,0 +1,352 @@
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe, size-capped pool of psycopg2 connections"""
+
+    def __init__(self, dsn_kwargs, minconn=1, maxconn=20, timeout=5.0,
+                 check_interval=30.0, connection_factory=None):
+        self.dsn_kwargs = dict(dsn_kwargs)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.connection_factory = connection_factory
+
+        self._lock = threading.Condition()
+        self._idle = []        # (conn, last_used) pairs, most recent last
+        self._in_use = {}      # conn -> generation it was checked out in
+        self._reserved = 0     # slots held while a new connection is opened
+        self._generation = 0
+        self._pid = os.getpid()
+        self._stats = {
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+        }
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._reserved
+
+    def _check_fork(self):
+        """Forget connections inherited from a parent process"""
+        pid = os.getpid()
+        if pid != self._pid:
+            # The sockets belong to the parent; closing them here would
+            # terminate its sessions, so just drop the references.
+            self._idle = []
+            self._in_use = {}
+            self._reserved = 0
+            self._pid = pid
+
+    def _connect(self):
+        kwargs = dict(self.dsn_kwargs)
+        if self.connection_factory is not None:
+            kwargs['connection_factory'] = self.connection_factory
+        return psycopg2.connect(**kwargs)
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn, last_used):
+        """Cheap liveness check, with a round trip only for long-idle connections"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - last_used < self.check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        """Check out a healthy connection, waiting up to `timeout` seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            with self._lock:
+                self._check_fork()
+                while not self._idle and self._size() >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"no database connection available after {timeout:.1f}s "
+                            f"(maxconn={self.maxconn})"
+                        )
+                    waited = True
+                    self._lock.wait(remaining)
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    self._in_use[conn] = self._generation
+                else:
+                    conn, last_used = None, None
+                    self._reserved += 1
+
+            # Network I/O happens outside the lock
+            if conn is not None:
+                if self._is_healthy(conn, last_used):
+                    break
+                self._close_quietly(conn)
+                with self._lock:
+                    self._in_use.pop(conn, None)
+                    self._stats['connections_discarded'] += 1
+                    self._lock.notify()
+                continue
+
+            try:
+                conn = self._connect()
+            except psycopg2.Error:
+                with self._lock:
+                    self._reserved -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._reserved -= 1
+                self._in_use[conn] = self._generation
+                self._stats['connections_created'] += 1
+            break
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += time.monotonic() - started
+        return conn
+
+    def putconn(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        with self._lock:
+            if conn not in self._in_use:
+                # Checked out before a fork, or already returned
+                return
+            generation = self._in_use[conn]
+
+        keep = not conn.closed and generation == self._generation
+        if keep and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                keep = False
+        if not keep:
+            self._close_quietly(conn)
+
+        with self._lock:
+            self._in_use.pop(conn, None)
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._stats['connections_discarded'] += 1
+            self._lock.notify()
+
+    def prefill(self):
+        """Open connections up to `minconn` so first requests skip the handshake"""
+        conns = []
+        try:
+            while True:
+                with self._lock:
+                    self._check_fork()
+                    if self._size() >= self.minconn:
+                        break
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def closeall(self):
+        """Close idle connections now and in-use ones when they are returned"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._generation += 1
+            self._stats['connections_discarded'] += len(idle)
+            self._lock.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def in_use(self):
+        """Number of connections currently checked out"""
+        with self._lock:
+            return len(self._in_use)
+
+    def stats(self):
+        """Return a snapshot of pool usage counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'size': self._size(),
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+            })
+        return snapshot
+
+
+class NoReplicaAvailable(psycopg2.OperationalError):
+    """Raised when every read replica is down, lagging or out of connections"""
+
+
+# Whether WAL is streaming in, and the replay lag in seconds. A streaming
+# replica that replayed all WAL it received is current; one whose WAL
+# receiver is down only replays what it already has, so its lag is the
+# time since it last replayed a transaction, however idle the primary is.
+REPLICA_HEALTH_SQL = """
+    SELECT streaming,
+           CASE WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN streaming AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                WHEN streaming THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 0)
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity')
+           END
+    FROM (SELECT NOT pg_is_in_recovery()
+                 OR EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') as streaming) s
+"""
+
+
+class ReplicaSet:
+    """Connection pools over read replicas, balanced by load and health
+
+    getconn() hands out a connection from the healthy replica with the
+    fewest connections in use, rotating between equally busy ones. A
+    replica is taken out for `retry_interval` seconds when connecting to it
+    fails, or when a health check finds it more than `max_lag` seconds
+    behind its primary (or cut off from it, and that long since its last
+    replay; see REPLICA_HEALTH_SQL). Health checks run on checkout, at most every
+    `health_interval` seconds per replica. Extra keyword arguments are
+    passed to each replica's ConnectionPool.
+    """
+
+    def __init__(self, dsn_kwargs_list, retry_interval=5.0, health_interval=2.0,
+                 max_lag=10.0, **pool_kwargs):
+        self.pools = [ConnectionPool(dsn_kwargs, **pool_kwargs) for dsn_kwargs in dsn_kwargs_list]
+        self.retry_interval = retry_interval
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+
+        self._lock = threading.Lock()
+        self._owners = {}      # conn -> index of the replica it came from
+        self._next = 0
+        self._replicas = [{
+            'down_until': 0.0,
+            'checked_at': 0.0,
+            'lag': None,
+            'error': None,
+            'checkouts': 0,
+            'failures': 0,
+        } for _ in self.pools]
+
+    def _candidates(self):
+        """Indexes of replicas not marked down, least busy first"""
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.pools)
+            up = [i for i, r in enumerate(self._replicas) if r['down_until'] <= now]
+        return sorted(up, key=lambda i: (self.pools[i].in_use(), (i - start) % len(self.pools)))
+
+    def _mark_down(self, index, error):
+        with self._lock:
+            replica = self._replicas[index]
+            replica['down_until'] = time.monotonic() + self.retry_interval
+            replica['error'] = str(error).strip()
+            replica['failures'] += 1
+        dsn = self.pools[index].dsn_kwargs
+        print(f"Read replica {dsn.get('host')}:{dsn.get('port')} down for {self.retry_interval:.0f}s: {replica['error']}")
+
+    def _check(self, index, conn):
+        """Run a health check if one is due; returns False if the replica was marked down"""
+        with self._lock:
+            replica = self._replicas[index]
+            if time.monotonic() - replica['checked_at'] < self.health_interval:
+                return True
+            replica['checked_at'] = time.monotonic()
+        try:
+            cur = conn.cursor()
+            cur.execute(REPLICA_HEALTH_SQL)
+            streaming, lag = cur.fetchone()
+            cur.close()
+            conn.rollback()
+        except psycopg2.Error as e:
+            self._mark_down(index, e)
+            return False
+        with self._lock:
+            self._replicas[index]['lag'] = float(lag)
+        if self.max_lag is not None and lag > self.max_lag:
+            reason = "replication lag" if streaming else "not streaming WAL, last replay"
+            self._mark_down(index, f"{reason} {float(lag):.1f}s exceeds {self.max_lag}s")
+            return False
+        return True
+
+    def getconn(self, timeout=None):
+        """Check out a connection from a healthy replica; raises NoReplicaAvailable"""
+        for index in self._candidates():
+            pool = self.pools[index]
+            try:
+                conn = pool.getconn(timeout)
+            except PoolTimeout:
+                continue        # busy, not broken
+            except psycopg2.Error as e:
+                self._mark_down(index, e)
+                continue
+            if not self._check(index, conn):
+                pool.putconn(conn)
+                continue
+            with self._lock:
+                self._owners[conn] = index
+                self._replicas[index]['checkouts'] += 1
+            return conn
+        raise NoReplicaAvailable("no healthy read replica available")
+
+    def putconn(self, conn):
+        """Return a connection to the pool of the replica it came from"""
+        with self._lock:
+            index = self._owners.pop(conn, None)
+        if index is not None:
+            self.pools[index].putconn(conn)
+
+    def closeall(self):
+        for pool in self.pools:
+            pool.closeall()
+
+    def stats(self):
+        """Health and pool usage per replica"""
+        now = time.monotonic()
+        with self._lock:
+            replicas = [dict(r) for r in self._replicas]
+        result = []
+        for pool, replica in zip(self.pools, replicas):
+            result.append({
+                'host': pool.dsn_kwargs.get('host'),
+                'port': pool.dsn_kwargs.get('port'),
+                'healthy': replica['down_until'] <= now,
+                'lag': replica['lag'],
+                'last_error': replica['error'],
+                'checkouts': replica['checkouts'],
+                'failures': replica['failures'],
+                'pool': pool.stats(),
+            })
+        return result
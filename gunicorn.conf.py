@@ -0,0 +1,50 @@
+"""Gunicorn settings for the production launcher (start_production.sh).
+
+The app is preloaded in the master so workers fork with the code already
+imported, pending schema migrations run exactly once before forking, and each
+worker opens its own database connections after the fork.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+pidfile = os.environ.get('WEB_PIDFILE', 'gunicorn.pid')
+accesslog = '-'
+
+# Every request thread in a worker may hold a connection at once
+os.environ.setdefault('DB_POOL_MAX', str(threads))
+
+
+def on_starting(server):
+    """Migrate the schema once, in the master, before any worker exists"""
+    import app
+
+    if not app.init_database():
+        raise SystemExit("Failed to initialize database. Please check your PostgreSQL connection.")
+    # Workers must not inherit the master's sockets
+    app.db_pool.closeall()
+    server.log.info("Database initialized successfully!")
+
+
+def post_fork(server, worker):
+    """Warm up this worker's own connection pool and start its background jobs"""
+    import app
+
+    try:
+        app.db_pool.prefill()
+    except app.psycopg2.Error as e:
+        # Requests will retry; /ready reports the failure meanwhile
+        worker.log.warning(f"Database connection error: {e}")
+    # Workers each cache in memory and hear each other's invalidations
+    app.start_cache_listener()
+    app.start_user_stats_refresher()
+    app.start_score_refresher()
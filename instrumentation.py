@@ -0,0 +1,336 @@
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import psycopg2
+from flask import g, has_app_context, has_request_context, request, before_render_template, template_rendered
+from psycopg2 import extensions
+
+logger = logging.getLogger('blog.perf')
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(os.environ.get('PERF_LOG_LEVEL', 'INFO'))
+    logger.propagate = False
+
+# Statements slower than this are logged with their EXPLAIN plan
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+# psycopg2 placeholders: %s, %(name)s, and %% for a literal percent sign
+_PLACEHOLDER = re.compile(r'%(?:\((\w+)\))?s|%%')
+
+
+def _request_stats():
+    """Per-request counters on flask.g, or None outside a request"""
+    if not has_app_context():
+        return None
+    stats = g.get('perf')
+    if stats is None:
+        stats = g.perf = {'queries': 0, 'db_time': 0.0, 'conn_time': 0.0, 'render_time': 0.0}
+    return stats
+
+
+def record_connection_wait(seconds):
+    """Account time spent checking a connection out of the pool"""
+    stats = _request_stats()
+    if stats is not None:
+        stats['conn_time'] += seconds
+
+
+def _numbered(sql):
+    """A psycopg2 statement with its placeholders rewritten as $1, $2, ..."""
+    numbers = {}
+
+    def number(match):
+        if match.group(0) == '%%':
+            return '%'
+        name = match.group(1)
+        if name is None:
+            name = len(numbers)
+        numbers.setdefault(name, len(numbers) + 1)
+        return f"${numbers[name]}"
+
+    return _PLACEHOLDER.sub(number, sql)
+
+
+def _explain(cursor, sql, parameterized):
+    """EXPLAIN a statement on the cursor's connection without disturbing its transaction
+
+    Statements with parameters are explained as a generic plan (PostgreSQL
+    16+), so the values never reach the log through the plan's filters.
+    """
+    conn = cursor.connection
+    if conn.autocommit or conn.get_transaction_status() != extensions.TRANSACTION_STATUS_INTRANS:
+        return None
+    if not _EXPLAINABLE.match(sql):
+        return None
+    explain = "EXPLAIN "
+    if parameterized:
+        if conn.server_version < 160000:
+            return None
+        explain = "EXPLAIN (GENERIC_PLAN) "
+        sql = _numbered(sql)
+    # A plain cursor, so the EXPLAIN itself is not instrumented
+    plain = extensions.cursor(conn)
+    try:
+        plain.execute("SAVEPOINT perf_explain")
+        try:
+            plain.execute(explain + sql)
+            plan = '\n'.join(row[0] for row in plain.fetchall())
+        except psycopg2.Error:
+            plan = None
+        plain.execute("ROLLBACK TO SAVEPOINT perf_explain")
+        plain.execute("RELEASE SAVEPOINT perf_explain")
+        return plan
+    except psycopg2.Error:
+        return None
+    finally:
+        plain.close()
+
+
+def _record_query(cursor, query, elapsed, parameterized=False):
+    stats = _request_stats()
+    if stats is not None:
+        stats['queries'] += 1
+        stats['db_time'] += elapsed
+
+    if elapsed * 1000 < SLOW_QUERY_MS:
+        return
+    sql = query.decode() if isinstance(query, bytes) else query
+    logger.warning(json.dumps({
+        'event': 'slow_query',
+        'endpoint': request.endpoint if has_request_context() else None,
+        'duration_ms': round(elapsed * 1000, 2),
+        'statement': ' '.join(sql.split()),
+        'plan': _explain(cursor, sql, parameterized),
+    }))
+
+
+_cursor_classes = {}
+_cursor_classes_lock = threading.Lock()
+
+
+def instrumented_cursor_class(base):
+    """Subclass of a cursor factory that times every statement it executes"""
+    cls = _cursor_classes.get(base)
+    if cls is not None:
+        return cls
+
+    class InstrumentedCursor(base):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                # Logged without its parameters: they can be emails or password hashes
+                _record_query(self, query, time.perf_counter() - started, vars is not None)
+
+        def executemany(self, query, vars_list):
+            started = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                _record_query(self, query, time.perf_counter() - started, True)
+
+        def copy_expert(self, sql, file, size=8192):
+            started = time.perf_counter()
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                stats = _request_stats()
+                if stats is not None:
+                    stats['queries'] += 1
+                    stats['db_time'] += time.perf_counter() - started
+
+    InstrumentedCursor.__name__ = f"Instrumented{base.__name__}"
+    with _cursor_classes_lock:
+        return _cursor_classes.setdefault(base, InstrumentedCursor)
+
+
+class InstrumentedConnection(extensions.connection):
+    """psycopg2 connection whose cursors record per-request query statistics"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = instrumented_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+
+class Metrics:
+    """Per-endpoint request metrics, rendered in Prometheus text format
+
+    Metrics are kept per process; with several workers each one reports
+    its own series.
+    """
+
+    SERIES = (
+        ('request_duration_seconds', 'Request latency', LATENCY_BUCKETS),
+        ('db_duration_seconds', 'Time spent executing SQL per request', LATENCY_BUCKETS),
+        ('db_connection_wait_seconds', 'Time spent acquiring a pooled connection per request', LATENCY_BUCKETS),
+        ('template_render_seconds', 'Time spent rendering templates per request', LATENCY_BUCKETS),
+        ('db_queries_per_request', 'SQL statements executed per request', QUERY_COUNT_BUCKETS),
+    )
+
+    def __init__(self, prefix='blog_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}   # (series, endpoint) -> Histogram
+        self._responses = {}    # (endpoint, status) -> count
+        self._gauges = []       # callables returning {name: value}
+
+    def observe(self, endpoint, status, values):
+        with self._lock:
+            for name, _, buckets in self.SERIES:
+                key = (name, endpoint)
+                hist = self._histograms.get(key)
+                if hist is None:
+                    hist = self._histograms[key] = Histogram(buckets)
+                hist.observe(values[name])
+            key = (endpoint, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def add_gauges(self, source):
+        """Register a callable whose numeric results are exported as gauges"""
+        self._gauges.append(source)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, help_text, buckets in self.SERIES:
+                metric = self.prefix + name
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (series, endpoint), hist in sorted(self._histograms.items()):
+                    if series != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{endpoint="{endpoint}",le="+Inf"}} {hist.count}')
+                    lines.append(f'{metric}_sum{{endpoint="{endpoint}"}} {hist.sum}')
+                    lines.append(f'{metric}_count{{endpoint="{endpoint}"}} {hist.count}')
+
+            metric = self.prefix + 'responses_total'
+            lines.append(f"# HELP {metric} Responses by endpoint and status")
+            lines.append(f"# TYPE {metric} counter")
+            for (endpoint, status), count in sorted(self._responses.items()):
+                lines.append(f'{metric}{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+        for source in self._gauges:
+            try:
+                values = source()
+            except Exception as e:
+                logger.warning(json.dumps({'event': 'metrics_error', 'error': str(e)}))
+                continue
+            for name, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = self.prefix + name
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def init_app(app):
+    """Register the per-request timing hooks on a Flask app"""
+
+    @app.before_request
+    def start_request_timer():
+        g.perf_started = time.perf_counter()
+        _request_stats()
+
+    @before_render_template.connect_via(app)
+    def start_render_timer(sender, template, context, **extra):
+        g.perf_render_started = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def stop_render_timer(sender, template, context, **extra):
+        started = g.pop('perf_render_started', None)
+        stats = _request_stats()
+        if started is not None and stats is not None:
+            stats['render_time'] += time.perf_counter() - started
+
+    @app.after_request
+    def report_request_timing(response):
+        started = g.get('perf_started')
+        if started is None:
+            return response
+        stats = _request_stats()
+        report = functools.partial(_report_request, request.method, request.path,
+                                   request.endpoint or 'unmatched', response.status_code, started, stats)
+        if response.is_streamed:
+            # The body, and the queries and rendering behind it, are produced
+            # after the headers go out: report once it has been sent, and
+            # leave out a Server-Timing header that could only be partial
+            response.call_on_close(report)
+        else:
+            response.headers['Server-Timing'] = _server_timing(stats, time.perf_counter() - started)
+            report()
+        return response
+
+
+def _server_timing(stats, total):
+    return ', '.join((
+        f'db;dur={stats["db_time"] * 1000:.2f};desc="{stats["queries"]} queries"',
+        f'conn;dur={stats["conn_time"] * 1000:.2f}',
+        f'tpl;dur={stats["render_time"] * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}',
+    ))
+
+
+def _report_request(method, path, endpoint, status, started, stats):
+    """Log a finished request and add it to the metrics
+
+    Takes everything it needs as arguments: for a streamed response it runs
+    after the request context is gone.
+    """
+    total = time.perf_counter() - started
+    logger.info(json.dumps({
+        'event': 'request',
+        'method': method,
+        'path': path,
+        'endpoint': endpoint,
+        'status': status,
+        'duration_ms': round(total * 1000, 2),
+        'queries': stats['queries'],
+        'db_ms': round(stats['db_time'] * 1000, 2),
+        'conn_ms': round(stats['conn_time'] * 1000, 2),
+        'render_ms': round(stats['render_time'] * 1000, 2),
+    }))
+    metrics.observe(endpoint, status, {
+        'request_duration_seconds': total,
+        'db_duration_seconds': stats['db_time'],
+        'db_connection_wait_seconds': stats['conn_time'],
+        'template_render_seconds': stats['render_time'],
+        'db_queries_per_request': stats['queries'],
+    })
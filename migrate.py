@@ -0,0 +1,183 @@
+import importlib.util
+import os
+import re
+import time
+
+from psycopg2 import errors
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# migrations/0001_initial_schema.py -> version 1, 'initial_schema'
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# Session advisory lock held while migrating, so concurrent boots apply
+# each migration once
+MIGRATE_LOCK_ID = 7130004
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """(version, name, path) of every migration file, in version order
+
+    Only lists the directory; the modules are loaded when they are applied.
+    """
+    found = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            found.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    found.sort()
+    versions = [version for version, _, _ in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return found
+
+
+def latest_version(directory=MIGRATIONS_DIR):
+    """The version the code expects the schema to be at"""
+    found = discover(directory)
+    return found[-1][0] if found else 0
+
+
+def current_version(conn):
+    """The schema version recorded in the database; 0 if it was never migrated"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT max(version) FROM schema_version")
+        version = cur.fetchone()[0] or 0
+    except errors.UndefinedTable:
+        version = 0
+    finally:
+        cur.close()
+        conn.rollback()
+    return version
+
+
+def load(path):
+    """Import a migration file as a module"""
+    name = 'migrations.' + os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_index_concurrently(conn, name, definition):
+    """CREATE INDEX CONCURRENTLY `name` ON `definition`, without blocking writes
+
+    Needs an autocommit connection. A build that failed or was interrupted
+    leaves an INVALID index behind; it is dropped and built again.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+    """, (name,))
+    row = cur.fetchone()
+    if row and not row[0]:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+    cur.close()
+
+
+def _lock(conn, poll_interval=0.5):
+    """Take the migration lock, waiting for another process to finish first
+
+    Polls with pg_try_advisory_lock instead of blocking in pg_advisory_lock:
+    a session blocked in that call holds a snapshot, which CREATE INDEX
+    CONCURRENTLY in the session holding the lock would wait for.
+    """
+    cur = conn.cursor()
+    while True:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (MIGRATE_LOCK_ID,))
+        if cur.fetchone()[0]:
+            break
+        time.sleep(poll_interval)
+    cur.close()
+
+
+def _unlock(conn):
+    if conn.closed:
+        return
+    conn.rollback()
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATE_LOCK_ID,))
+        cur.close()
+    finally:
+        conn.autocommit = False
+
+
+def apply_pending(conn, directory=MIGRATIONS_DIR, log=print):
+    """Apply every migration newer than the database's version; returns their versions
+
+    Each migration module has `upgrade(conn)` and spells out all the SQL it
+    runs, so it keeps doing the same thing however the app changes later.
+    It runs in a transaction committed together with its schema_version row,
+    unless the module sets `transactional = False` (for CREATE INDEX
+    CONCURRENTLY, or backfills that commit per batch); then it runs in
+    autocommit mode and its row is written once it has finished.
+    Migrations must be safe to run again: a database created before
+    schema_version existed replays them all, and a migration that dies
+    half-way is run again on the next attempt.
+    """
+    conn.rollback()
+    conn.autocommit = True
+    try:
+        _lock(conn)
+    finally:
+        conn.autocommit = False
+
+    applied = []
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        # Another process may have migrated while we waited for the lock
+        cur.execute("SELECT COALESCE(max(version), 0) FROM schema_version")
+        current = cur.fetchone()[0]
+        conn.commit()
+
+        for version, name, path in discover(directory):
+            if version <= current:
+                continue
+            module = load(path)
+            transactional = getattr(module, 'transactional', True)
+            started = time.perf_counter()
+            conn.autocommit = not transactional
+            try:
+                module.upgrade(conn)
+                cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+                if transactional:
+                    conn.commit()
+            except Exception:
+                if transactional:
+                    conn.rollback()
+                raise
+            finally:
+                conn.autocommit = False
+            applied.append(version)
+            log(f"Applied migration {version:04d}_{name} ({time.perf_counter() - started:.2f}s)")
+        cur.close()
+    finally:
+        _unlock(conn)
+    return applied
+
+
+def status(conn, directory=MIGRATIONS_DIR):
+    """(version, name, applied_at or None) for every migration file"""
+    applied = {}
+    if current_version(conn):
+        cur = conn.cursor()
+        cur.execute("SELECT version, applied_at FROM schema_version")
+        applied = dict(cur.fetchall())
+        cur.close()
+        conn.rollback()
+    return [(version, name, applied.get(version)) for version, name, _ in discover(directory)]
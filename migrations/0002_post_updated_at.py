@@ -0,0 +1,16 @@
+"""posts.updated_at: last change to a post or its counters, used for HTTP validators"""
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'posts' AND column_name = 'updated_at'
+    """)
+    if not cur.fetchone():
+        cur.execute("""
+            ALTER TABLE posts
+            ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        """)
+        cur.execute("UPDATE posts SET updated_at = created_at")
+    cur.close()
@@ -0,0 +1,21 @@
+"""Denormalized like and comment counters on posts, maintained by the write routes"""
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'posts' AND column_name = 'like_count'
+    """)
+    if not cur.fetchone():
+        cur.execute("""
+            ALTER TABLE posts
+            ADD COLUMN like_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0
+        """)
+        cur.execute("""
+            UPDATE posts p
+            SET like_count = (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.id),
+                comment_count = (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.id)
+        """)
+    cur.close()
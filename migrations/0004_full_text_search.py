@@ -0,0 +1,41 @@
+"""Full-text search: weighted post vector plus an expression index on comments
+
+Not transactional: the backfill commits per batch so it never holds every
+post row locked at once, and the indexes are built without blocking writes.
+Each step is safe to repeat, and rows already filled are skipped if this
+runs again.
+"""
+import migrate
+
+transactional = False
+
+BATCH_SIZE = 1000
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector")
+
+    last_id = 0
+    while True:
+        cur.execute("""
+            SELECT max(id) FROM (
+                SELECT id FROM posts WHERE id > %s ORDER BY id LIMIT %s
+            ) batch
+        """, (last_id, BATCH_SIZE))
+        batch_end = cur.fetchone()[0]
+        if batch_end is None:
+            break
+        cur.execute("""
+            UPDATE posts
+            SET search_vector = setweight(to_tsvector('english', title), 'A') ||
+                                setweight(to_tsvector('english', content), 'B')
+            WHERE id > %s AND id <= %s AND search_vector IS NULL
+        """, (last_id, batch_end))
+        last_id = batch_end
+    cur.close()
+
+    # After the backfill, so the index is built once from the filled rows
+    migrate.create_index_concurrently(conn, 'idx_posts_search', 'posts USING GIN (search_vector)')
+    migrate.create_index_concurrently(conn, 'idx_comments_search',
+                                      "comments USING GIN (to_tsvector('english', content))")
@@ -0,0 +1,20 @@
+"""Indexes backing the keyset-paginated feed, its per-post counts and comment threads
+
+Not transactional: the indexes are built without blocking writes to the
+posts, likes and comments tables.
+"""
+import migrate
+
+transactional = False
+
+
+def upgrade(conn):
+    migrate.create_index_concurrently(conn, 'idx_posts_created_at_id', 'posts (created_at DESC, id DESC)')
+    migrate.create_index_concurrently(conn, 'idx_likes_post_id', 'likes (post_id)')
+    # Comment threads are read in (created_at, id) order per post; this
+    # also covers lookups by post_id alone
+    migrate.create_index_concurrently(conn, 'idx_comments_post_created_at_id',
+                                      'comments (post_id, created_at, id)')
+    cur = conn.cursor()
+    cur.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_comments_post_id")
+    cur.close()
@@ -0,0 +1,7 @@
+"""users.auth_version: bumped whenever a user's role changes, invalidating sessions' cached role"""
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS auth_version INTEGER NOT NULL DEFAULT 0")
+    cur.close()
@@ -0,0 +1,26 @@
+"""Per-user dashboard stats, maintained by the write routes"""
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('user_stats') IS NOT NULL")
+    has_user_stats = cur.fetchone()[0]
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            post_count INTEGER NOT NULL DEFAULT 0,
+            likes_received INTEGER NOT NULL DEFAULT 0,
+            comments_received INTEGER NOT NULL DEFAULT 0,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    if not has_user_stats:
+        cur.execute("""
+            INSERT INTO user_stats (user_id, post_count, likes_received, comments_received)
+            SELECT u.id, COUNT(p.id), COALESCE(SUM(p.like_count), 0), COALESCE(SUM(p.comment_count), 0)
+            FROM users u
+            LEFT JOIN posts p ON p.user_id = u.id
+            GROUP BY u.id
+            ON CONFLICT (user_id) DO NOTHING
+        """)
+    cur.close()
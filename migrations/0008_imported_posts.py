@@ -0,0 +1,15 @@
+"""Maps post ids in imported archives to the posts created for them,
+so comments and likes can be imported after their posts"""
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS imported_posts (
+            source_id INTEGER PRIMARY KEY,
+            post_id INTEGER NOT NULL REFERENCES posts(id) ON DELETE CASCADE
+        )
+    """)
+    # Backs the cascade when posts are deleted
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_imported_posts_post_id ON imported_posts (post_id)")
+    cur.close()
@@ -0,0 +1,39 @@
+"""Excerpts and word counts for post lists, so they never read the body
+
+Not transactional: the backfill commits per batch so it never holds every
+post row locked at once. Each step is safe to repeat, and rows already
+filled are skipped if this runs again.
+"""
+
+transactional = False
+
+BATCH_SIZE = 1000
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS excerpt TEXT,
+        ADD COLUMN IF NOT EXISTS word_count INTEGER
+    """)
+
+    last_id = 0
+    while True:
+        cur.execute("""
+            SELECT max(id) FROM (
+                SELECT id FROM posts WHERE id > %s ORDER BY id LIMIT %s
+            ) batch
+        """, (last_id, BATCH_SIZE))
+        batch_end = cur.fetchone()[0]
+        if batch_end is None:
+            break
+        # The excerpt keeps 201 characters: one more than any list shows
+        cur.execute(r"""
+            UPDATE posts
+            SET excerpt = left(content, 201),
+                word_count = (SELECT count(*) FROM regexp_matches(content, '\S+', 'g'))
+            WHERE id > %s AND id <= %s AND excerpt IS NULL
+        """, (last_id, batch_end))
+        last_id = batch_end
+    cur.close()
@@ -0,0 +1,61 @@
+"""Time-decayed engagement scores behind the trending and top feeds
+
+The first scores are computed with the default weights (like 1, comment 2)
+and half-lives (trending 6h, top 72h over posts from the last 7 days) from
+the last 7 days of likes and comments; run `flask rebuild-scores` if they
+are configured differently.
+"""
+
+
+def upgrade(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('post_scores') IS NOT NULL")
+    has_post_scores = cur.fetchone()[0]
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS post_scores (
+            feed VARCHAR(20) NOT NULL,
+            post_id INTEGER NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+            score DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (feed, post_id)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_post_scores_feed_score
+        ON post_scores (feed, score DESC, post_id DESC)
+    """)
+    # Backs the cascade when posts are deleted
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_post_scores_post_id ON post_scores (post_id)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS score_anchors (
+            feed VARCHAR(20) PRIMARY KEY,
+            anchor TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        INSERT INTO score_anchors (feed)
+        VALUES ('trending'), ('top')
+        ON CONFLICT (feed) DO NOTHING
+    """)
+    if not has_post_scores:
+        # tau is the half-life in seconds divided by ln 2
+        cur.execute("""
+            INSERT INTO post_scores (feed, post_id, score)
+            SELECT f.feed, e.post_id, SUM(e.weight * exp(extract(epoch FROM e.created_at - a.anchor) / f.tau))
+            FROM (
+                SELECT post_id, created_at, 1.0 as weight FROM likes
+                WHERE created_at > LOCALTIMESTAMP - interval '7 days'
+                UNION ALL
+                SELECT post_id, created_at, 2.0 FROM comments
+                WHERE created_at > LOCALTIMESTAMP - interval '7 days'
+            ) e
+            JOIN posts p ON p.id = e.post_id
+            CROSS JOIN (VALUES
+                ('trending', 6 * 3600 / ln(2), NULL::interval),
+                ('top', 72 * 3600 / ln(2), interval '7 days')
+            ) AS f(feed, tau, max_age)
+            JOIN score_anchors a ON a.feed = f.feed
+            WHERE f.max_age IS NULL OR p.created_at > LOCALTIMESTAMP - f.max_age
+            GROUP BY f.feed, e.post_id, a.anchor
+            HAVING SUM(e.weight * exp(extract(epoch FROM e.created_at - a.anchor) / f.tau)) >= 0.05
+        """)
+    cur.close()
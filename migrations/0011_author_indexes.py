@@ -0,0 +1,14 @@
+"""Indexes for lookups by author, built without blocking writes
+
+posts.user_id backs the dashboard's post list and the cascade when a
+user is deleted; comments.user_id backs that cascade too. likes.post_id
+and comments.post_id are already indexed (0005).
+"""
+import migrate
+
+transactional = False
+
+
+def upgrade(conn):
+    migrate.create_index_concurrently(conn, 'idx_posts_user_id_created_at', 'posts (user_id, created_at DESC)')
+    migrate.create_index_concurrently(conn, 'idx_comments_user_id', 'comments (user_id)')
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(RuntimeError):
+    """Raised when the hashing queue stays full for longer than the timeout"""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored, password):
+    return check_password_hash(stored, password)
+
+
+class PasswordHasher:
+    """Runs password hashing in a bounded pool of worker processes
+
+    At most `workers` hashes run at once and at most `max_queue` more wait
+    for a worker; further callers block up to `timeout` seconds for a slot
+    and then get HasherBusy. Request threads therefore spend their time
+    waiting on a future instead of burning CPU under the GIL. With
+    workers=0 hashing runs inline in the calling thread.
+
+    `method` is the werkzeug method string as it appears in stored hashes
+    (e.g. 'pbkdf2:sha256:600000'); hashes stored with anything else are
+    reported as needing a rehash.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:600000', workers=2, max_queue=4, timeout=2.0):
+        self.method = method
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, workers) + max_queue)
+        self._executor = None
+        self._pid = None
+        self._in_flight = 0
+        self._stats = {
+            'completed': 0,
+            'rejected': 0,
+            'peak_in_flight': 0,
+            'wait_time_total': 0.0,     # blocked on a full queue
+            'run_time_total': 0.0,      # queued behind busy workers plus hashing
+        }
+
+    def _get_executor(self):
+        """The process pool for this process, created on first use (and after a fork)"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Imported here: multiprocessing is slow to import and only
+                # needed once the first hash runs
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # spawn: forking a threaded server process is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HasherBusy("password hashing queue is full")
+
+        with self._lock:
+            self._in_flight += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+        queued_at = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                result = fn(*args)
+            else:
+                executor = self._get_executor()
+                from concurrent.futures.process import BrokenProcessPool
+                try:
+                    result = executor.submit(fn, *args).result()
+                except BrokenProcessPool:
+                    # A worker died; start a fresh pool and retry once
+                    with self._lock:
+                        self._executor = None
+                    result = self._get_executor().submit(fn, *args).result()
+            finished = time.perf_counter()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['wait_time_total'] += queued_at - started
+            self._stats['run_time_total'] += finished - queued_at
+        return result
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(_hash, password, self.method)
+
+    def verify(self, stored, password):
+        """Check a password against a stored hash"""
+        return self._run(_verify, stored, password)
+
+    def needs_rehash(self, stored):
+        """True if the stored hash was made with other parameters than the configured ones"""
+        return stored.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            in_flight = self._in_flight
+        snapshot.update({
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'in_flight': in_flight,
+            'queued': max(0, in_flight - max(1, self.workers)),
+        })
+        return snapshot
@@ -0,0 +1,61 @@
+#!/bin/bash
+#
+# Production launcher: pre-forked gunicorn workers with threads.
+#
+#   ./start_production.sh            start in the foreground
+#   ./start_production.sh reload     gracefully restart workers (config changes)
+#   ./start_production.sh upgrade    start a new master with new code, then
+#                                    gracefully stop the old one
+#   ./start_production.sh stop       graceful shutdown
+#
+# Tune with WEB_WORKERS, WEB_THREADS, WEB_BIND and the DB_POOL_* variables.
+
+PIDFILE="${WEB_PIDFILE:-gunicorn.pid}"
+
+if [ -d "venv" ]; then
+    source venv/bin/activate
+fi
+
+master_pid() {
+    if [ ! -f "$1" ]; then
+        echo "Error: $1 not found. Is the server running?" >&2
+        exit 1
+    fi
+    cat "$1"
+}
+
+case "$1" in
+    ""|start)
+        echo "Starting Mini Blog Portal (production)..."
+        exec gunicorn -c gunicorn.conf.py wsgi:app
+        ;;
+    reload)
+        echo "Gracefully restarting workers..."
+        kill -HUP "$(master_pid "$PIDFILE")"
+        ;;
+    upgrade)
+        OLD_PID="$(master_pid "$PIDFILE")"
+        echo "Starting new master alongside $OLD_PID..."
+        kill -USR2 "$OLD_PID"
+        # The new master writes $PIDFILE.2 once it is listening, and takes
+        # over $PIDFILE after the old master exits
+        for _ in $(seq 1 30); do
+            sleep 1
+            if [ -f "$PIDFILE.2" ]; then
+                echo "New master $(cat "$PIDFILE.2") is up; stopping $OLD_PID..."
+                kill -TERM "$OLD_PID"
+                exit 0
+            fi
+        done
+        echo "Error: new master did not start; old master left running." >&2
+        exit 1
+        ;;
+    stop)
+        echo "Stopping..."
+        kill -TERM "$(master_pid "$PIDFILE")"
+        ;;
+    *)
+        echo "Usage: $0 [start|reload|upgrade|stop]" >&2
+        exit 1
+        ;;
+esac
@@ -0,0 +1,117 @@
+"""Every test session runs against a database of its own
+
+It is created next to the blog's database (DB_HOST, DB_PORT and the other
+DB_* settings), migrated when the first test asks for the app, and dropped
+at the end, so tests never touch real data. Set TEST_DB_REPLICAS to a
+streaming replica of that server (host:port) to run the replica tests.
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app reads its configuration when it is imported
+os.environ['DB_NAME'] = f"blog_test_{os.getpid()}"
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ.setdefault('PERF_LOG_LEVEL', 'ERROR')
+os.environ.pop('WRITE_BEHIND', None)
+if os.environ.get('TEST_DB_REPLICAS'):
+    os.environ['DB_REPLICAS'] = os.environ['TEST_DB_REPLICAS']
+    # Tests pause replay on purpose; the replica must not be dropped meanwhile
+    os.environ['REPLICA_MAX_LAG'] = '300'
+else:
+    os.environ.pop('DB_REPLICAS', None)
+
+import app as blog  # noqa: E402
+
+
+def _admin_connection():
+    conn = psycopg2.connect(**dict(blog.DB_CONFIG, database='postgres'))
+    conn.autocommit = True
+    return conn
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The blog app module, on a freshly migrated database of its own"""
+    conn = _admin_connection()
+    try:
+        conn.cursor().execute(f"CREATE DATABASE {blog.DB_CONFIG['database']}")
+    finally:
+        conn.close()
+    try:
+        assert blog.init_database(), "migrating the test database failed"
+        yield blog
+    finally:
+        blog.db_pool.closeall()
+        if blog.replica_set is not None:
+            blog.replica_set.closeall()
+        conn = _admin_connection()
+        try:
+            conn.cursor().execute(f"DROP DATABASE IF EXISTS {blog.DB_CONFIG['database']} WITH (FORCE)")
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def db(app):
+    """A connection to the test database, for setting up and checking rows"""
+    conn = psycopg2.connect(**app.DB_CONFIG)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_users(db):
+    """Create `n` users named after the test; returns their ids"""
+    def make(n, prefix='user'):
+        cur = db.cursor()
+        tag = f"{prefix}{time.monotonic_ns()}"
+        cur.execute("""
+            INSERT INTO users (username, email, password)
+            SELECT %(tag)s || i, %(tag)s || i || '@test.local', 'x'
+            FROM generate_series(1, %(n)s) i
+            RETURNING id
+        """, {'tag': tag, 'n': n})
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("INSERT INTO user_stats (user_id) SELECT unnest(%s::int[])", (user_ids,))
+        db.commit()
+        cur.close()
+        return user_ids
+    return make
+
+
+@pytest.fixture
+def make_post(db):
+    """Create a post by `user_id`; returns its id"""
+    def make(user_id, title='Test post', content='Test content'):
+        cur = db.cursor()
+        cur.execute("""
+            INSERT INTO posts (user_id, title, content, excerpt, word_count)
+            VALUES (%s, %s, %s, left(%s, 201), %s)
+            RETURNING id
+        """, (user_id, title, content, content, len(content.split())))
+        post_id = cur.fetchone()[0]
+        cur.execute("UPDATE user_stats SET post_count = post_count + 1 WHERE user_id = %s", (user_id,))
+        db.commit()
+        cur.close()
+        return post_id
+    return make
+
+
+@pytest.fixture
+def client_for(app):
+    """A test client, logged in as `user_id` unless it is None"""
+    def make(user_id=None):
+        client = app.app.test_client()
+        if user_id is not None:
+            with client.session_transaction() as session:
+                session['user_id'] = user_id
+        return client
+    return make
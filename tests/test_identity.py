@@ -0,0 +1,32 @@
+"""Admin routes check the role in the database, not just the identity cache"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_demoted_admin_is_refused_despite_a_stale_cache(app, db, make_users, client_for):
+    admin_id, = make_users(1, prefix='admin')
+    cur = db.cursor()
+    cur.execute("""
+        UPDATE users SET role = 'admin', auth_version = auth_version + 1
+        WHERE id = %s RETURNING email
+    """, (admin_id,))
+    email = cur.fetchone()[0]
+    db.commit()
+    cur.close()
+
+    client = client_for(admin_id)
+    assert client.get('/admin').status_code == 200
+
+    # Demoted by another process; this one does not listen for its broadcast
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'set-role', email, 'user'],
+                   cwd=ROOT, check=True, capture_output=True)
+    assert app.identity_cache.get(f"identity:{admin_id}")['role'] == 'admin'
+
+    response = client.get('/admin')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/')
+    with client.session_transaction() as session:
+        assert session['role'] == 'user'
@@ -0,0 +1,109 @@
+"""toggle_like under concurrency: the stored counter always matches the likes rows"""
+import threading
+
+import pytest
+
+from db import ConnectionPool
+from writebehind import WriteBehindQueue
+
+
+@pytest.fixture
+def write_behind(app, monkeypatch):
+    """Queue likes and comments as with WRITE_BEHIND=1, for the length of a test"""
+    pool = ConnectionPool(app.DB_CONFIG, minconn=0, maxconn=1)
+    queue = WriteBehindQueue(app.write_batch, after_write=app.invalidate_written, **app.WRITE_BEHIND_CONFIG)
+    monkeypatch.setattr(app, 'write_pool', pool, raising=False)
+    monkeypatch.setattr(app, 'write_queue', queue)
+    monkeypatch.setattr(app, 'WRITE_BEHIND_DURABILITY', 'commit')
+    yield queue
+    queue.close()
+    pool.closeall()
+
+
+def toggle_from_threads(client_for, post_id, user_ids, clicks, toggles):
+    """Toggle the like on `post_id` `toggles` times from `clicks` threads per user
+
+    Returns the successful toggles per user and the failed responses.
+    """
+    successes, failures, lock = {}, [], threading.Lock()
+
+    def worker(user_id):
+        client = client_for(user_id)
+        done = 0
+        for _ in range(toggles):
+            data = client.get(f'/like_post/{post_id}').get_json()
+            if data and data.get('success'):
+                done += 1
+            else:
+                failures.append(data)
+        with lock:
+            successes[user_id] = successes.get(user_id, 0) + done
+
+    threads = [threading.Thread(target=worker, args=(user_id,))
+               for user_id in user_ids for _ in range(clicks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return successes, failures
+
+
+def stored_likes(db, post_id):
+    cur = db.cursor()
+    cur.execute("SELECT like_count FROM posts WHERE id = %s", (post_id,))
+    like_count = cur.fetchone()[0]
+    cur.execute("SELECT user_id FROM likes WHERE post_id = %s", (post_id,))
+    liked_by = {row[0] for row in cur.fetchall()}
+    cur.close()
+    db.rollback()
+    return like_count, liked_by
+
+
+def test_counter_matches_rows_when_users_race(db, make_users, make_post, client_for):
+    user_ids = make_users(16)
+    post_id = make_post(user_ids[0])
+
+    successes, failures = toggle_from_threads(client_for, post_id, user_ids, clicks=1, toggles=15)
+
+    assert failures == []
+    like_count, liked_by = stored_likes(db, post_id)
+    assert like_count == len(liked_by)
+    # One thread per user: each user's final state follows their toggle count
+    assert liked_by == {user_id for user_id, n in successes.items() if n % 2 == 1}
+
+
+def test_counter_matches_rows_on_double_clicks(db, make_users, make_post, client_for):
+    user_ids = make_users(8)
+    post_id = make_post(user_ids[0])
+
+    _, failures = toggle_from_threads(client_for, post_id, user_ids, clicks=3, toggles=15)
+
+    assert failures == []
+    like_count, liked_by = stored_likes(db, post_id)
+    assert like_count == len(liked_by)
+
+
+def test_user_stats_follow_the_likes(db, make_users, make_post, client_for):
+    user_ids = make_users(8)
+    post_id = make_post(user_ids[0])
+
+    toggle_from_threads(client_for, post_id, user_ids, clicks=2, toggles=9)
+
+    like_count, _ = stored_likes(db, post_id)
+    cur = db.cursor()
+    cur.execute("SELECT likes_received FROM user_stats WHERE user_id = %s", (user_ids[0],))
+    assert cur.fetchone()[0] == like_count
+    cur.close()
+
+
+def test_queued_toggles_each_flip_the_like(db, make_users, make_post, client_for, write_behind):
+    user_ids = make_users(4)
+    post_id = make_post(user_ids[0])
+
+    # Double clicks from one user race each other through the queue
+    successes, failures = toggle_from_threads(client_for, post_id, user_ids, clicks=3, toggles=5)
+
+    assert failures == []
+    like_count, liked_by = stored_likes(db, post_id)
+    assert like_count == len(liked_by)
+    assert liked_by == {user_id for user_id, n in successes.items() if n % 2 == 1}
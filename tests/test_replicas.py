@@ -0,0 +1,98 @@
+"""Read routing: replicas serve reads, and a session that just wrote reads from the primary
+
+Needs a streaming replica of the test server: TEST_DB_REPLICAS=host:port.
+Replay on it is paused while the tests write, so what it serves is
+known to be stale.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+pytestmark = pytest.mark.skipif(not os.environ.get('TEST_DB_REPLICAS'),
+                                reason="set TEST_DB_REPLICAS to a streaming replica (host:port)")
+
+
+@pytest.fixture
+def replica(app):
+    """A connection to the first replica"""
+    conn = psycopg2.connect(**app.DB_REPLICAS[0])
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+def wait_for_row(replica, sql, params, timeout=10):
+    """Wait until the replica has replayed the row `sql` selects"""
+    deadline = time.monotonic() + timeout
+    cur = replica.cursor()
+    try:
+        while time.monotonic() < deadline:
+            cur.execute(sql, params)
+            if cur.fetchone():
+                return
+            time.sleep(0.05)
+    finally:
+        cur.close()
+    pytest.fail("the replica did not catch up")
+
+
+@contextmanager
+def replay_paused(replica):
+    cur = replica.cursor()
+    cur.execute("SELECT pg_wal_replay_pause()")
+    try:
+        yield
+    finally:
+        cur.execute("SELECT pg_wal_replay_resume()")
+        cur.close()
+
+
+def replica_checkouts(app):
+    return sum(r['checkouts'] for r in app.replica_set.stats())
+
+
+def test_reads_go_to_the_replica_and_writers_read_their_writes(
+        app, replica, make_users, make_post, client_for):
+    writer_id, = make_users(1, prefix='writer')
+    post_id = make_post(writer_id)
+    wait_for_row(replica, "SELECT 1 FROM posts WHERE id = %s", (post_id,))
+
+    writer = client_for(writer_id)
+    reader = client_for()
+    with replay_paused(replica):
+        response = writer.post(f'/comment_post/{post_id}', data={'content': 'First!'},
+                               headers={'Accept': 'application/json'})
+        assert response.get_json()['comment_count'] == 1
+
+        # Anonymous reads come from the replica, which has not seen the comment
+        checkouts = replica_checkouts(app)
+        post = reader.get(f'/api/posts/{post_id}').get_json()['post']
+        assert replica_checkouts(app) > checkouts
+        assert post['comment_count'] == 0
+
+        # The writer's session reads from the primary, around what the
+        # replica read just cached
+        checkouts = replica_checkouts(app)
+        post = writer.get(f'/api/posts/{post_id}').get_json()['post']
+        assert replica_checkouts(app) == checkouts
+        assert post['comment_count'] == 1
+
+
+def test_reads_leave_the_primary_once_the_session_is_no_longer_sticky(
+        app, replica, make_users, make_post, client_for):
+    writer_id, = make_users(1, prefix='writer')
+    post_id = make_post(writer_id)
+    wait_for_row(replica, "SELECT 1 FROM posts WHERE id = %s", (post_id,))
+
+    writer = client_for(writer_id)
+    writer.post(f'/comment_post/{post_id}', data={'content': 'First!'},
+                headers={'Accept': 'application/json'})
+    with writer.session_transaction() as session:
+        session['primary_until'] = time.time() - 1
+
+    checkouts = replica_checkouts(app)
+    writer.get(f'/api/posts/{post_id}')
+    assert replica_checkouts(app) > checkouts
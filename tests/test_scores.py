@@ -0,0 +1,80 @@
+"""Deleting likes and comments takes back exactly the score they added"""
+import pytest
+
+
+def engage(app, db, post_id, user_id, comments=0, like=False, hours_ago=1):
+    """Add comments and a like by `user_id`, scored the way the views score them"""
+    cur = db.cursor()
+    events = []
+    for _ in range(comments):
+        cur.execute("""
+            INSERT INTO comments (post_id, user_id, content, created_at)
+            VALUES (%s, %s, 'Test comment', LOCALTIMESTAMP - make_interval(hours => %s))
+            RETURNING created_at
+        """, (post_id, user_id, hours_ago))
+        events.append((post_id, app.SCORE_WEIGHTS['comment'], cur.fetchone()[0]))
+    if like:
+        cur.execute("""
+            INSERT INTO likes (post_id, user_id, created_at)
+            VALUES (%s, %s, LOCALTIMESTAMP - make_interval(hours => %s))
+            RETURNING created_at
+        """, (post_id, user_id, hours_ago))
+        events.append((post_id, app.SCORE_WEIGHTS['like'], cur.fetchone()[0]))
+    cur.execute("""
+        UPDATE posts SET like_count = like_count + %s, comment_count = comment_count + %s
+        WHERE id = %s
+    """, (int(like), comments, post_id))
+    app.bump_scores(cur, events)
+    db.commit()
+    cur.close()
+
+
+def scores_against_rebuild(app, db, post_ids):
+    """The stored scores of `post_ids` and the ones a rebuild computes, both decayed to now"""
+    cur = db.cursor()
+    query = "SELECT feed, post_id, score FROM post_scores WHERE post_id = ANY(%s)"
+    # One transaction, so both see the same LOCALTIMESTAMP
+    app.redecay_post_scores(cur)
+    cur.execute(query, (post_ids,))
+    stored = {(feed, post_id): score for feed, post_id, score in cur.fetchall()}
+    app.rebuild_post_scores(cur)
+    cur.execute(query, (post_ids,))
+    rebuilt = {(feed, post_id): score for feed, post_id, score in cur.fetchall()}
+    cur.close()
+    db.rollback()
+    return stored, pytest.approx(rebuilt)
+
+
+def test_deleting_comments_takes_back_their_score(app, db, make_users, make_post):
+    author, commenter, other = make_users(3)
+    post_id = make_post(author)
+    engage(app, db, post_id, commenter, comments=5, hours_ago=2)
+    engage(app, db, post_id, other, comments=1, like=True)
+
+    cur = db.cursor()
+    cur.execute("SELECT id FROM comments WHERE post_id = %s AND user_id = %s", (post_id, commenter))
+    comment_ids = [row[0] for row in cur.fetchall()]
+    assert app.delete_comments(cur, comment_ids) == [(post_id, 5)]
+    db.commit()
+    cur.close()
+
+    stored, rebuilt = scores_against_rebuild(app, db, [post_id])
+    assert stored == rebuilt
+
+
+def test_deleting_a_user_takes_back_their_engagement(app, db, make_users, make_post):
+    author, spammer, other = make_users(3)
+    post_id = make_post(author)
+    spammer_post_id = make_post(spammer)
+    engage(app, db, post_id, spammer, comments=26, like=True, hours_ago=3)
+    engage(app, db, post_id, other, comments=1)
+    engage(app, db, spammer_post_id, other, comments=2, like=True)
+
+    cur = db.cursor()
+    assert app.delete_users(cur, [spammer]) == [spammer]
+    db.commit()
+    cur.close()
+
+    stored, rebuilt = scores_against_rebuild(app, db, [post_id, spammer_post_id])
+    assert stored == rebuilt
+    assert all(key[1] == post_id for key in stored)
@@ -0,0 +1,38 @@
+"""Conditional GETs: page validators come from the cache entry the page is rendered from"""
+
+
+def test_post_etag_follows_the_cached_body(app, db, make_users, make_post, client_for):
+    author, = make_users(1)
+    post_id = make_post(author, title='Before')
+    reader = client_for()
+
+    first = reader.get(f'/post/{post_id}')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    # A write the cache has not heard of yet: the cached body is still what is sent
+    cur = db.cursor()
+    cur.execute("UPDATE posts SET title = 'After', updated_at = CURRENT_TIMESTAMP WHERE id = %s", (post_id,))
+    db.commit()
+    cur.close()
+    assert reader.get(f'/post/{post_id}', headers={'If-None-Match': etag}).status_code == 304
+
+    app.invalidate_post(post_id)
+    fresh = reader.get(f'/post/{post_id}', headers={'If-None-Match': etag})
+    assert fresh.status_code == 200
+    assert fresh.headers['ETag'] != etag
+    assert b'After' in fresh.data
+
+
+def test_feed_answers_304_from_the_cache(app, make_users, make_post, client_for):
+    author, = make_users(1)
+    make_post(author)
+    app.cache.clear()
+    reader = client_for()
+
+    # The home page streams: a miss sends no validators, then fills the cache
+    first = reader.get('/?limit=5')
+    first.get_data()
+    assert 'ETag' not in first.headers
+    etag = reader.get('/?limit=5').headers['ETag']
+    assert reader.get('/?limit=5', headers={'If-None-Match': etag}).status_code == 304
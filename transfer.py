@@ -0,0 +1,358 @@
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from datetime import datetime
+
+TABLES = ('users', 'posts', 'comments', 'likes')
+FORMATS = ('ndjson', 'csv')
+
+# How CSV archives write NULL, so an empty field stays an empty string
+CSV_NULL = '\\N'
+
+# User references are exported as emails, so an archive can be loaded into a
+# database whose user ids differ. Post references are the source database's
+# post ids; they are resolved through imported_posts on import.
+EXPORT_QUERIES = {
+    'users': """
+        SELECT username, email, password, role, created_at
+        FROM users ORDER BY id
+    """,
+    'posts': """
+        SELECT p.id, u.email as author_email, p.title, p.content, p.created_at
+        FROM posts p JOIN users u ON u.id = p.user_id
+        ORDER BY p.id
+    """,
+    'comments': """
+        SELECT c.id, c.post_id, u.email as author_email, c.content, c.created_at
+        FROM comments c JOIN users u ON u.id = c.user_id
+        ORDER BY c.id
+    """,
+    'likes': """
+        SELECT l.post_id, u.email as user_email, l.created_at
+        FROM likes l JOIN users u ON u.id = l.user_id
+        ORDER BY l.id
+    """,
+}
+
+# Archive fields per table and their staging column types
+IMPORT_COLUMNS = {
+    'users': (('username', 'text'), ('email', 'text'), ('password', 'text'),
+              ('role', 'text'), ('created_at', 'timestamp')),
+    'posts': (('id', 'integer'), ('author_email', 'text'), ('title', 'text'),
+              ('content', 'text'), ('created_at', 'timestamp')),
+    'comments': (('id', 'integer'), ('post_id', 'integer'), ('author_email', 'text'),
+                 ('content', 'text'), ('created_at', 'timestamp')),
+    'likes': (('post_id', 'integer'), ('user_email', 'text'), ('created_at', 'timestamp')),
+}
+
+# Set-based merges from the staging table into the live tables. Each one keeps
+# the denormalized counters and user_stats in step and returns the rows added.
+# Rows with an unknown user or post, missing fields, or already present are
+# skipped, so re-running an import is harmless.
+MERGE_QUERIES = {
+    'users': """
+        WITH inserted AS (
+            INSERT INTO users (username, email, password, role, created_at)
+            SELECT DISTINCT ON (s.email)
+                   s.username, s.email,
+                   COALESCE(s.password, '!'),  -- no usable password; reset by an admin
+                   CASE WHEN s.role IN ('user', 'admin') THEN s.role ELSE 'user' END,
+                   COALESCE(s.created_at, CURRENT_TIMESTAMP)
+            FROM import_users s
+            WHERE s.email IS NOT NULL AND s.username IS NOT NULL
+            ON CONFLICT (email) DO NOTHING
+            RETURNING id
+        ), stats AS (
+            INSERT INTO user_stats (user_id) SELECT id FROM inserted
+        )
+        SELECT COUNT(*) FROM inserted
+    """,
+    'posts': """
+        WITH inserted AS (
+            INSERT INTO posts (id, user_id, title, content, created_at, search_vector, excerpt, word_count)
+            SELECT s.new_id, s.user_id, s.title, s.content,
+                   COALESCE(s.created_at, CURRENT_TIMESTAMP),
+                   setweight(to_tsvector('english', s.title), 'A') ||
+                   setweight(to_tsvector('english', s.content), 'B'),
+                   -- as app.POST_EXCERPT and app.POST_WORD_COUNT
+                   left(s.content, 201),
+                   (SELECT count(*) FROM regexp_matches(s.content, '\\S+', 'g'))
+            FROM import_posts s
+            WHERE s.new_id IS NOT NULL
+            RETURNING id, user_id
+        ), mapped AS (
+            INSERT INTO imported_posts (source_id, post_id)
+            SELECT s.id, s.new_id FROM import_posts s
+            WHERE s.new_id IS NOT NULL AND s.id IS NOT NULL
+            ON CONFLICT (source_id) DO NOTHING
+        ), credited AS (
+            INSERT INTO user_stats (user_id, post_count)
+            SELECT user_id, COUNT(*) FROM inserted GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET post_count = user_stats.post_count + EXCLUDED.post_count
+        )
+        SELECT COUNT(*) FROM inserted
+    """,
+    'comments': """
+        WITH inserted AS (
+            INSERT INTO comments (user_id, post_id, content, created_at)
+            SELECT u.id, m.post_id, s.content, COALESCE(s.created_at, CURRENT_TIMESTAMP)
+            FROM import_comments s
+            JOIN imported_posts m ON m.source_id = s.post_id
+            JOIN users u ON u.email = s.author_email
+            WHERE s.content IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM comments c
+                  WHERE c.post_id = m.post_id AND c.created_at = s.created_at
+                    AND c.user_id = u.id AND c.content = s.content
+              )
+            RETURNING post_id
+        ), counted AS (
+            SELECT post_id, COUNT(*) as n FROM inserted GROUP BY post_id
+        ), bumped AS (
+            UPDATE posts p
+            SET comment_count = p.comment_count + c.n, updated_at = CURRENT_TIMESTAMP
+            FROM counted c WHERE p.id = c.post_id
+            RETURNING p.user_id, c.n
+        ), credited AS (
+            INSERT INTO user_stats (user_id, comments_received)
+            SELECT user_id, SUM(n) FROM bumped GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET comments_received = user_stats.comments_received + EXCLUDED.comments_received
+        )
+        SELECT COALESCE(SUM(n), 0) FROM counted
+    """,
+    'likes': """
+        WITH inserted AS (
+            INSERT INTO likes (user_id, post_id, created_at)
+            SELECT DISTINCT ON (u.id, m.post_id)
+                   u.id, m.post_id, COALESCE(s.created_at, CURRENT_TIMESTAMP)
+            FROM import_likes s
+            JOIN imported_posts m ON m.source_id = s.post_id
+            JOIN users u ON u.email = s.user_email
+            ON CONFLICT (user_id, post_id) DO NOTHING
+            RETURNING post_id
+        ), counted AS (
+            SELECT post_id, COUNT(*) as n FROM inserted GROUP BY post_id
+        ), bumped AS (
+            UPDATE posts p
+            SET like_count = p.like_count + c.n, updated_at = CURRENT_TIMESTAMP
+            FROM counted c WHERE p.id = c.post_id
+            RETURNING p.user_id, c.n
+        ), credited AS (
+            INSERT INTO user_stats (user_id, likes_received)
+            SELECT user_id, SUM(n) FROM bumped GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET likes_received = user_stats.likes_received + EXCLUDED.likes_received
+        )
+        SELECT COALESCE(SUM(n), 0) FROM counted
+    """,
+}
+
+
+class Progress:
+    """Periodic throughput report on stderr"""
+
+    def __init__(self, label, unit='rows', interval=2.0, stream=None):
+        self.label = label
+        self.unit = unit
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.count = 0
+        self.started = self._last = time.perf_counter()
+
+    def add(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._report(now)
+
+    def done(self):
+        self._report(time.perf_counter())
+        return self.count
+
+    def _report(self, now):
+        elapsed = now - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0
+        print(f"{self.label}: {self.count:,} {self.unit} in {elapsed:.1f}s ({rate:,.0f}/s)",
+              file=self.stream)
+
+
+class IteratorFile(io.TextIOBase):
+    """Read-only file object over an iterator of text lines, for COPY FROM"""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+class _CountingWriter:
+    """Binary file wrapper that feeds the bytes written to a Progress"""
+
+    def __init__(self, file, progress):
+        self._file = file
+        self._progress = progress
+
+    def write(self, data):
+        self._progress.add(len(data))
+        return self._file.write(data)
+
+
+def copy_rows(cur, table, columns, rows):
+    """Stream tuples into `table` with COPY ... FROM STDIN (tab-separated text)"""
+    def lines():
+        for row in rows:
+            yield '\t'.join(_copy_value(v) for v in row) + '\n'
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+        IteratorFile(lines()),
+        size=65536,
+    )
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    text = value.isoformat() if isinstance(value, datetime) else str(value)
+    return (text.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def guess_format(path):
+    """'csv' for *.csv and *.csv.gz paths, otherwise 'ndjson'"""
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+def _open(path, mode):
+    """Open an archive for reading ('r') or binary writing ('w'); '-' is stdin/stdout, *.gz is gzipped"""
+    if mode == 'w':
+        if path == '-':
+            return sys.stdout.buffer
+        return gzip.open(path, 'wb') if path.endswith('.gz') else open(path, 'wb')
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def export_table(conn, table, path, fmt):
+    """Stream a table to an archive with COPY ... TO STDOUT; returns bytes written"""
+    query = EXPORT_QUERIES[table]
+    if fmt == 'csv':
+        sql = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER, NULL '{CSV_NULL}')"
+    else:
+        # One JSON document per line. CSV mode with quote and delimiter
+        # characters that JSON always escapes passes each document through
+        # verbatim, where text mode would double its backslashes.
+        sql = (f"COPY (SELECT row_to_json(t) FROM ({query}) t) TO STDOUT "
+               f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+
+    progress = Progress(f"export {table}", unit='bytes')
+    out = _open(path, 'w')
+    try:
+        cur = conn.cursor()
+        cur.copy_expert(sql, _CountingWriter(out, progress), size=65536)
+        cur.close()
+        conn.commit()
+    finally:
+        if out is sys.stdout.buffer:
+            out.flush()
+        else:
+            out.close()
+    return progress.done()
+
+
+def _read_ndjson(file, fields):
+    for lineno, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"line {lineno}: invalid JSON") from None
+        if not isinstance(record, dict):
+            raise ValueError(f"line {lineno}: expected a JSON object")
+        yield tuple(record.get(name) for name in fields)
+
+
+def _read_csv(file, fields):
+    reader = csv.DictReader(file)
+    missing = [name for name in fields if name not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"CSV header lacks column(s): {', '.join(missing)}")
+    for record in reader:
+        yield tuple(None if record[name] == CSV_NULL else record[name] for name in fields)
+
+
+def import_table(conn, table, path, fmt):
+    """Load an archive into `table` in one transaction; returns (rows read, rows added)
+
+    Rows are parsed lazily and streamed with COPY into a temporary staging
+    table, then merged with a single set-based statement.
+    """
+    columns = IMPORT_COLUMNS[table]
+    fields = [name for name, _ in columns]
+    staging = f"import_{table}"
+    progress = Progress(f"import {table}")
+
+    def counted(rows):
+        for row in rows:
+            progress.add()
+            yield row
+
+    file = _open(path, 'r')
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE TEMP TABLE {staging} (
+                {', '.join(f'{name} {kind}' for name, kind in columns)}
+            ) ON COMMIT DROP
+        """)
+        reader = _read_csv if fmt == 'csv' else _read_ndjson
+        copy_rows(cur, staging, fields, counted(reader(file, fields)))
+        read = progress.done()
+        cur.execute(f"ANALYZE {staging}")
+
+        if table == 'posts':
+            # Draw the new ids up front so the source -> new id mapping can
+            # be recorded in the same statement that inserts the posts
+            cur.execute("""
+                ALTER TABLE import_posts ADD COLUMN user_id integer, ADD COLUMN new_id integer
+            """)
+            cur.execute("""
+                UPDATE import_posts s
+                SET user_id = u.id, new_id = nextval(pg_get_serial_sequence('posts', 'id'))
+                FROM users u
+                WHERE u.email = s.author_email
+                  AND s.title IS NOT NULL AND s.content IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM imported_posts m WHERE m.source_id = s.id)
+            """)
+
+        cur.execute(MERGE_QUERIES[table])
+        added = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    finally:
+        file.close()
+    return read, added
@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFull(RuntimeError):
+    """Raised when the write queue stays full for longer than the timeout"""
+
+
+class _Batch:
+    """Writes collected between two flushes"""
+
+    def __init__(self):
+        self.likes = {}             # (user_id, post_id) -> [was_liked, liked, futures]
+        self.comments = []          # (comment, future)
+        self.like_delta = {}        # post_id -> likes added minus likes removed
+        self.comment_delta = {}     # post_id -> comments added
+        self.started = None         # when the first write arrived
+
+    def __len__(self):
+        return len(self.likes) + len(self.comments)
+
+
+class WriteBehindQueue:
+    """Collects like toggles and comments in process and writes them in batches
+
+    A background thread hands each batch to `flush(likes, comments)` at
+    most `interval` seconds after its first write arrived, or as soon as
+    `max_batch` writes are waiting; one batch is written at a time.
+    `likes` maps (user_id, post_id) to the wanted state, so a user toggling
+    the same post again and again within a batch costs one row at most;
+    `comments` is the list of comment dicts as queued. If a batch fails,
+    its writes are retried one by one so a bad row only fails itself.
+
+    `flush` may return a value, e.g. the keys it changed; once a batch is
+    written, `after_write(results)` gets the values its successful flush
+    calls returned, before any of its futures resolve. Its errors are
+    printed and do not fail the writes, which are committed by then.
+
+    Every write returns a Future that resolves once its batch is committed,
+    so callers choose their durability: wait for it, or answer right away
+    and accept losing the last `interval` of writes if the process dies.
+    At most `max_queue` writes wait; further callers block up to `timeout`
+    seconds and then get QueueFull. close() writes out what is queued.
+    """
+
+    def __init__(self, flush, interval=0.05, max_batch=500, max_queue=10000, timeout=2.0, after_write=None):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._flush = flush
+        self._after_write = after_write
+
+        self._cond = threading.Condition()
+        self._pending = _Batch()
+        self._flushing = None
+        self._written = 0
+        self._closing = False
+        self._thread = None
+        self._pid = None
+        self._stats = {
+            'queued_total': 0,
+            'coalesced': 0,         # toggles folded into one already queued
+            'rejected': 0,
+            'failed': 0,
+            'batches': 0,
+            'batch_retries': 0,
+            'written': 0,
+            'peak_queued': 0,
+            'flush_time_total': 0.0,
+            'flush_time_max': 0.0,
+            'queue_time_total': 0.0,    # first write of a batch until its commit
+        }
+
+    def _admit(self, coalesced):
+        """Wait for room in the queue; called with the condition held"""
+        if self._closing:
+            raise QueueFull("write queue is closed")
+        if coalesced:
+            return
+        deadline = time.monotonic() + self.timeout
+        while len(self._pending) >= self.max_queue:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._stats['rejected'] += 1
+                raise QueueFull("write queue is full")
+            self._cond.wait(remaining)
+
+    def _queued(self):
+        """Bookkeeping after a write was added; called with the condition held"""
+        if self._thread is None or self._pid != os.getpid():
+            # First write in this process (or after a fork)
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+        if self._pending.started is None:
+            self._pending.started = time.monotonic()
+        self._stats['queued_total'] += 1
+        self._stats['peak_queued'] = max(self._stats['peak_queued'], len(self._pending))
+        self._cond.notify_all()
+
+    def toggle(self, user_id, post_id, stored, written):
+        """Queue flipping a like; returns (liked, future), or None if `stored` may be out of date
+
+        The like flips from its queued state if a write for it is waiting,
+        else from `stored`, its state in the database as read after
+        written() returned `written`. A batch written since may have
+        changed it, so then nothing is queued: read it again and retry.
+        Deciding and queueing happen under one lock, so concurrent toggles
+        of the same like each flip it, as they would in the database.
+        """
+        future = Future()
+        key = (user_id, post_id)
+        with self._cond:
+            entry = self._pending.likes.get(key)
+            queued = entry or (self._flushing.likes.get(key) if self._flushing is not None else None)
+            if queued is None and written != self._written:
+                return None
+            was_liked = stored if queued is None else queued[1]
+            self._admit(entry is not None)
+            if entry is None:
+                entry = self._pending.likes[key] = [was_liked, not was_liked, []]
+                previous = 0
+            else:
+                previous = entry[1] - entry[0]
+                self._stats['coalesced'] += 1
+            liked = entry[1] = not was_liked
+            entry[2].append(future)
+            delta = self._pending.like_delta
+            delta[post_id] = delta.get(post_id, 0) + (entry[1] - entry[0]) - previous
+            self._queued()
+        return liked, future
+
+    def comment(self, comment):
+        """Queue a comment dict with at least post_id"""
+        future = Future()
+        with self._cond:
+            self._admit(False)
+            self._pending.comments.append((comment, future))
+            delta = self._pending.comment_delta
+            delta[comment['post_id']] = delta.get(comment['post_id'], 0) + 1
+            self._queued()
+        return future
+
+    def written(self):
+        """How many batches have been written, for toggle to tell whether one was since"""
+        with self._cond:
+            return self._written
+
+    def pending_counts(self, post_id):
+        """(likes, comments) queued for a post but not yet committed"""
+        likes = comments = 0
+        with self._cond:
+            for batch in (self._pending, self._flushing):
+                if batch is not None:
+                    likes += batch.like_delta.get(post_id, 0)
+                    comments += batch.comment_delta.get(post_id, 0)
+        return likes, comments
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closing and len(self._pending) < self.max_batch:
+                    if self._pending.started is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._pending.started + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._pending:
+                    if self._closing:
+                        return
+                    continue
+                batch, self._pending = self._pending, _Batch()
+                self._flushing = batch
+                self._cond.notify_all()     # room for blocked writers
+
+            self._write(batch)
+            with self._cond:
+                self._flushing = None
+                self._written += 1
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        likes = {key: entry[1] for key, entry in batch.likes.items()}
+        comments = [comment for comment, _ in batch.comments]
+        try:
+            written = [self._flush(likes, comments)]
+            results = [(futures, None) for _, _, futures in batch.likes.values()]
+            results += [([future], None) for _, future in batch.comments]
+            retried = False
+        except Exception as e:
+            print(f"Write-behind batch error, retrying writes one by one: {e}")
+            written, results = [], []
+            for key, (_, liked, futures) in batch.likes.items():
+                results.append((futures, self._write_one({key: liked}, [], written)))
+            for comment, future in batch.comments:
+                results.append(([future], self._write_one({}, [comment], written)))
+            retried = True
+        elapsed = time.perf_counter() - started
+
+        if self._after_write is not None and written:
+            try:
+                self._after_write(written)
+            except Exception as e:
+                print(f"Write-behind after_write error: {e}")
+
+        failed = 0
+        for futures, error in results:
+            failed += error is not None
+            for future in futures:
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+        with self._cond:
+            self._stats['batches'] += 1
+            self._stats['batch_retries'] += retried
+            self._stats['written'] += len(batch) - failed
+            self._stats['failed'] += failed
+            self._stats['flush_time_total'] += elapsed
+            self._stats['flush_time_max'] = max(self._stats['flush_time_max'], elapsed)
+            self._stats['queue_time_total'] += time.monotonic() - batch.started
+
+    def _write_one(self, likes, comments, written):
+        """Flush a single write, appending its result to `written`; returns the error, or None"""
+        try:
+            written.append(self._flush(likes, comments))
+            return None
+        except Exception as e:
+            print(f"Write-behind write error: {e}")
+            return e
+
+    def close(self, timeout=10):
+        """Stop taking writes and wait up to `timeout` seconds for the queued ones to be written"""
+        with self._cond:
+            self._closing = True
+            thread = self._thread if self._pid == os.getpid() else None
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'queued': len(self._pending),
+                'in_flight': len(self._flushing) if self._flushing is not None else 0,
+                'max_queue': self.max_queue,
+                'interval': self.interval,
+            })
+        return snapshot
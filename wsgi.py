@@ -0,0 +1,10 @@
+"""WSGI entry point for production servers.
+
+Schema setup is not run here; gunicorn.conf.py runs init_database() once in
+the master before workers are forked. Run with:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app
+
+application = app